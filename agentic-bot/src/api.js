@@ -49,6 +49,60 @@ export async function getAgent(agentName) {
     return data.agent;
 }
 
+/**
+ * Poll an ingestion job until it finishes and return its result
+ */
+export async function waitForJob(jobId, onProgress, intervalMs = 1000) {
+    while (true) {
+        const response = await fetch(`${API_BASE}/jobs/${jobId}`, {
+            headers: {
+                ...getAuthHeader(),
+            },
+        });
+
+        if (response.status === 401) {
+            throw new Error('Please login to view job status');
+        }
+
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to fetch job status');
+        }
+
+        const job = data.job;
+        if (onProgress) {
+            onProgress(job);
+        }
+
+        if (job.status === 'succeeded') {
+            return job.result;
+        }
+        if (job.status === 'failed' || job.status === 'cancelled') {
+            throw new Error(job.error || `Job ${job.status}`);
+        }
+
+        await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+}
+
+/**
+ * Cancel a queued or running ingestion job
+ */
+export async function cancelJob(jobId) {
+    const response = await fetch(`${API_BASE}/jobs/${jobId}/cancel`, {
+        method: 'POST',
+        headers: {
+            ...getAuthHeader(),
+        },
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || 'Failed to cancel job');
+    }
+    return data;
+}
+
 /**
  * Create a new agent with PDF files
  */
@@ -78,7 +132,7 @@ export async function createAgent(agentName, domain, description, files) {
     if (!response.ok) {
         throw new Error(data.error || 'Failed to create agent');
     }
-    return data;
+    return data.job_id ? waitForJob(data.job_id) : data;
 }
 
 /**
@@ -133,7 +187,7 @@ export async function createAgentFromSource(agentName, domain, description, sour
     if (!response.ok) {
         throw new Error(data.error || 'Failed to create agent');
     }
-    return data;
+    return data.job_id ? waitForJob(data.job_id) : data;
 }
 
 /**
@@ -185,7 +239,7 @@ export async function updateAgentData(agentName, sourceType, sourceConfig) {
     if (!response.ok) {
         throw new Error(data.error || 'Failed to update agent');
     }
-    return data;
+    return data.job_id ? waitForJob(data.job_id) : data;
 }
 
 /**
@@ -1,13 +1,19 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from rag_agent_system import RAGAgentSystem
-from db import get_users_collection, get_db
+from db import get_users_collection, get_db, get_jobs_collection
 from api_helpers import api_success, api_error, ErrorCodes, add_rate_limit_headers
 from token_manager import TokenManager
+from job_manager import JobManager, JobConflict, TERMINAL_STATUSES, remove_uploaded_files
+from dedup import DEDUP_MODES
+from embedding_backends import EMBEDDING_BACKENDS
+from data_sources.sql_source import SAMPLING_STRATEGIES as SQL_SAMPLING_STRATEGIES, FETCH_MODES
+from data_sources.nosql_source import SAMPLING_STRATEGIES as NOSQL_SAMPLING_STRATEGIES
 import os
 import json
 import jwt
 import time
+import uuid
 from werkzeug.utils import secure_filename
 from functools import wraps
 
@@ -32,6 +38,280 @@ os.makedirs(WIDGET_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 
+# Ingestion job handlers: each receives the job params and a progress callback
+def _run_create_job(params, progress_callback):
+    return rag_system.create_agent(**params, progress_callback=progress_callback)
+
+
+def _run_create_from_source_job(params, progress_callback):
+    return rag_system.create_agent_from_source(**params, progress_callback=progress_callback)
+
+
+def _run_update_job(params, progress_callback):
+    return rag_system.update_agent_data(**params, progress_callback=progress_callback)
+
+
+def _run_replace_source_job(params, progress_callback):
+    return rag_system.replace_agent_source(**params, progress_callback=progress_callback)
+
+
+def _run_sync_sql_job(params, progress_callback):
+    return rag_system.sync_agent_sql(**params, progress_callback=progress_callback)
+
+
+def _run_sync_nosql_job(params, progress_callback):
+    return rag_system.sync_agent_nosql(**params, progress_callback=progress_callback)
+
+
+def _run_reembed_job(params, progress_callback):
+    return rag_system.reembed_agent(**params, progress_callback=progress_callback)
+
+
+# Initialize ingestion job manager (dedicated worker pool, state in MongoDB)
+job_manager = JobManager(get_jobs_collection(), handlers={
+    "create": _run_create_job,
+    "create_from_source": _run_create_from_source_job,
+    "update": _run_update_job,
+    "replace_source": _run_replace_source_job,
+    "sync_sql": _run_sync_sql_job,
+    "sync_nosql": _run_sync_nosql_job,
+    "reembed": _run_reembed_job
+})
+
+
+def new_upload_dir():
+    """Create a per-request upload directory so concurrent jobs never share files"""
+    upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], uuid.uuid4().hex)
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+
+def job_accepted(job):
+    """202 response for a queued ingestion job"""
+    return jsonify({
+        "success": True,
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events"
+    }), 202
+
+
+def parse_int_field(field, default=None, minimum=1):
+    """Optional integer form field, at least minimum. Returns (value, error)."""
+    value = request.form.get(field)
+    if value in (None, ''):
+        return default, None
+    try:
+        value = int(value)
+    except ValueError:
+        return None, f"{field} must be an integer"
+    if value < minimum:
+        return None, f"{field} must be at least {minimum}"
+    return value, None
+
+
+def parse_source_config(source_type, user_id):
+    """
+    Build a source config from the request form/files.
+    Returns (source_config, error); uploaded files are saved to a fresh upload directory.
+    """
+    # Handle file-based sources (pdf, csv, word, parquet)
+    if source_type in ['pdf', 'csv', 'word', 'parquet']:
+        if 'files' not in request.files:
+            return None, f"No files provided for {source_type} source"
+        
+        files = request.files.getlist('files')
+        if not files:
+            return None, "At least one file is required"
+        
+        # Validate file extensions
+        valid_extensions = {
+            'pdf': ['.pdf'],
+            'csv': ['.csv'],
+            'word': ['.docx', '.doc'],
+            'parquet': ['.parquet', '.pq', '.feather', '.arrow', '.ipc', '.arrows']
+        }
+        
+        # CSV/Parquet: optional fixed number of rows per document (default: one chunk's worth of tokens)
+        rows_per_document, error = parse_int_field('rows_per_document')
+        if error:
+            return None, error
+        
+        upload_dir = new_upload_dir()
+        file_paths = []
+        for file in files:
+            if file and file.filename:
+                ext = os.path.splitext(file.filename)[1].lower()
+                if ext in valid_extensions.get(source_type, []):
+                    filename = secure_filename(file.filename)
+                    filepath = os.path.join(upload_dir, f"{user_id}_{filename}")
+                    file.save(filepath)
+                    file_paths.append(filepath)
+        
+        if not file_paths:
+            os.rmdir(upload_dir)
+            return None, f"No valid {source_type.upper()} files provided"
+        
+        source_config = {'file_paths': file_paths}
+        
+        if source_type in ('csv', 'parquet') and rows_per_document:
+            source_config['rows_per_document'] = rows_per_document
+        
+        # Parquet/Arrow: optional comma-separated columns to read
+        if source_type == 'parquet' and request.form.get('columns'):
+            source_config['columns'] = [c.strip() for c in request.form.get('columns').split(',') if c.strip()]
+        
+        return source_config, None
+    
+    # Handle SQL source
+    elif source_type == 'sql':
+        connection_string = request.form.get('connection_string', '')
+        tables_json = request.form.get('tables', '')
+        
+        if not connection_string:
+            return None, "SQL connection string is required"
+        
+        sample_limit, error = parse_int_field('sample_limit', 1000)
+        if error:
+            return None, error
+        
+        sampling = request.form.get('sampling') or 'first'
+        sample_column = request.form.get('sample_column') or None
+        if sampling not in SQL_SAMPLING_STRATEGIES:
+            return None, f"sampling must be one of: {', '.join(SQL_SAMPLING_STRATEGIES)}"
+        if sampling == 'stratified' and not sample_column:
+            return None, "Stratified sampling requires sample_column"
+        
+        # Optional seed so reservoir samples are reproducible across runs
+        sample_seed, error = parse_int_field('sample_seed', minimum=0)
+        if error:
+            return None, error
+        
+        fetch = request.form.get('fetch') or 'rows'
+        if fetch not in FETCH_MODES:
+            return None, f"fetch must be one of: {', '.join(FETCH_MODES)}"
+        
+        tables = None
+        if tables_json:
+            try:
+                tables = json.loads(tables_json)
+            except:
+                pass
+        
+        return {
+            'connection_string': connection_string,
+            'tables': tables,
+            'sample_limit': sample_limit,
+            'sampling': sampling,
+            'sample_column': sample_column,
+            'sample_seed': sample_seed,
+            'fetch': fetch
+        }, None
+    
+    # Handle NoSQL (MongoDB) source
+    elif source_type == 'nosql':
+        connection_string = request.form.get('connection_string', '')
+        database = request.form.get('database', '')
+        collections_json = request.form.get('collections', '')
+        
+        if not connection_string or not database:
+            return None, "MongoDB connection string and database name are required"
+        
+        sample_limit, error = parse_int_field('sample_limit', 1000)
+        if error:
+            return None, error
+        batch_size, error = parse_int_field('batch_size', 1000)
+        if error:
+            return None, error
+        
+        sampling = request.form.get('sampling') or 'first'
+        if sampling not in NOSQL_SAMPLING_STRATEGIES:
+            return None, f"sampling must be one of: {', '.join(NOSQL_SAMPLING_STRATEGIES)}"
+        
+        collections = None
+        if collections_json:
+            try:
+                collections = json.loads(collections_json)
+            except:
+                pass
+        
+        # Field selection: {"collection": ["field", ...]} or a plain list for every collection
+        field_settings = {}
+        for field in ('projection', 'exclude_fields'):
+            if request.form.get(field):
+                try:
+                    value = json.loads(request.form.get(field))
+                except ValueError:
+                    return None, f"{field} must be JSON"
+                field_settings[field] = {"*": value} if isinstance(value, list) else value
+        
+        return {
+            'connection_string': connection_string,
+            'database': database,
+            'collections': collections,
+            'sample_limit': sample_limit,
+            'batch_size': batch_size,
+            'sampling': sampling,
+            **field_settings
+        }, None
+    
+    return None, f"Unsupported source type: {source_type}"
+
+
+def parse_chunking():
+    """
+    Optional chunk_tokens/overlap_tokens, dedup/dedup_threshold and
+    embedding_backend/embedding_model form fields.
+    Returns (settings, error).
+    """
+    settings = {}
+    for field in ('chunk_tokens', 'overlap_tokens'):
+        value = request.form.get(field)
+        if value in (None, ''):
+            continue
+        try:
+            settings[field] = int(value)
+        except ValueError:
+            return None, f"{field} must be an integer"
+    
+    dedup = request.form.get('dedup')
+    if dedup:
+        if dedup not in DEDUP_MODES:
+            return None, f"dedup must be one of: {', '.join(DEDUP_MODES)}"
+        settings['dedup'] = dedup
+    
+    threshold = request.form.get('dedup_threshold')
+    if threshold not in (None, ''):
+        try:
+            settings['dedup_threshold'] = float(threshold)
+        except ValueError:
+            return None, "dedup_threshold must be a number"
+        if not 0 < settings['dedup_threshold'] <= 1:
+            return None, "dedup_threshold must be between 0 and 1"
+    
+    embedding, error = parse_embedding_model()
+    if error:
+        return None, error
+    settings.update(embedding)
+    return settings, None
+
+
+def parse_embedding_model():
+    """Optional embedding_backend/embedding_model form fields. Returns (settings, error)."""
+    settings = {}
+    backend = request.form.get('embedding_backend')
+    if backend:
+        if backend not in EMBEDDING_BACKENDS:
+            return None, f"embedding_backend must be one of: {', '.join(EMBEDDING_BACKENDS)}"
+        settings['embedding_backend'] = backend
+    
+    model = request.form.get('embedding_model', '').strip()
+    if model:
+        settings['embedding_model'] = model
+    return settings, None
+
+
 def verify_jwt(f):
     """JWT verification decorator"""
     @wraps(f)
@@ -534,6 +814,14 @@ def create_agent():
                 "error": "Agent name is required"
             }), 400
         
+        # Optional per-agent chunk sizing (tokens), deduplication and embedding model
+        chunking, error = parse_chunking()
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
+        
         if not files:
             return jsonify({
                 "success": False,
@@ -541,40 +829,53 @@ def create_agent():
             }), 400
         
         # Save uploaded files
+        upload_dir = new_upload_dir()
         pdf_paths = []
         for file in files:
             if file and file.filename.endswith('.pdf'):
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{user_id}_{filename}")
+                filepath = os.path.join(upload_dir, f"{user_id}_{filename}")
                 file.save(filepath)
                 pdf_paths.append(filepath)
         
         if not pdf_paths:
+            os.rmdir(upload_dir)
             return jsonify({
                 "success": False,
                 "error": "No valid PDF files provided"
             }), 400
         
-        # Create agent with user_id
-        result = rag_system.create_agent(
-            agent_name=agent_name,
-            pdf_paths=pdf_paths,
-            user_id=user_id,
-            description=description,
-            domain=domain
-        )
-        
-        # Clean up uploaded files
-        for path in pdf_paths:
-            try:
-                os.remove(path)
-            except:
-                pass
+        if rag_system.get_agent_info(agent_name, user_id):
+            remove_uploaded_files(pdf_paths)
+            return jsonify({
+                "success": False,
+                "error": f"Agent '{agent_name}' already exists for this user"
+            }), 400
         
-        if result["success"]:
-            return jsonify(result), 201
-        else:
-            return jsonify(result), 400
+        # Create agent in the background; uploaded files are removed when the job ends
+        try:
+            job = job_manager.submit(
+                kind="create",
+                user_id=user_id,
+                agent_name=agent_name,
+                params={
+                    "agent_name": agent_name,
+                    "pdf_paths": pdf_paths,
+                    "user_id": user_id,
+                    "description": description,
+                    "domain": domain,
+                    **chunking
+                },
+                cleanup_paths=pdf_paths,
+                exclusive=True
+            )
+        except JobConflict as e:
+            remove_uploaded_files(pdf_paths)
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 409
+        return job_accepted(job)
         
     except Exception as e:
         return jsonify({
@@ -602,128 +903,53 @@ def create_agent_from_source():
                 "error": "Agent name is required"
             }), 400
         
-        source_config = {}
-        
-        # Handle file-based sources (pdf, csv, word)
-        if source_type in ['pdf', 'csv', 'word']:
-            if 'files' not in request.files:
-                return jsonify({
-                    "success": False,
-                    "error": f"No files provided for {source_type} source"
-                }), 400
-            
-            files = request.files.getlist('files')
-            if not files:
-                return jsonify({
-                    "success": False,
-                    "error": f"At least one file is required"
-                }), 400
-            
-            # Validate file extensions
-            valid_extensions = {
-                'pdf': ['.pdf'],
-                'csv': ['.csv'],
-                'word': ['.docx', '.doc']
-            }
-            
-            file_paths = []
-            for file in files:
-                if file and file.filename:
-                    ext = os.path.splitext(file.filename)[1].lower()
-                    if ext in valid_extensions.get(source_type, []):
-                        filename = secure_filename(file.filename)
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{user_id}_{filename}")
-                        file.save(filepath)
-                        file_paths.append(filepath)
-            
-            if not file_paths:
-                return jsonify({
-                    "success": False,
-                    "error": f"No valid {source_type.upper()} files provided"
-                }), 400
-            
-            source_config = {'file_paths': file_paths}
-            
-        # Handle SQL source
-        elif source_type == 'sql':
-            connection_string = request.form.get('connection_string', '')
-            tables_json = request.form.get('tables', '')
-            sample_limit = int(request.form.get('sample_limit', 1000))
-            
-            if not connection_string:
-                return jsonify({
-                    "success": False,
-                    "error": "SQL connection string is required"
-                }), 400
-            
-            tables = None
-            if tables_json:
-                try:
-                    tables = json.loads(tables_json)
-                except:
-                    pass
-            
-            source_config = {
-                'connection_string': connection_string,
-                'tables': tables,
-                'sample_limit': sample_limit
-            }
-            
-        # Handle NoSQL (MongoDB) source
-        elif source_type == 'nosql':
-            connection_string = request.form.get('connection_string', '')
-            database = request.form.get('database', '')
-            collections_json = request.form.get('collections', '')
-            sample_limit = int(request.form.get('sample_limit', 1000))
-            
-            if not connection_string or not database:
-                return jsonify({
-                    "success": False,
-                    "error": "MongoDB connection string and database name are required"
-                }), 400
-            
-            collections = None
-            if collections_json:
-                try:
-                    collections = json.loads(collections_json)
-                except:
-                    pass
-            
-            source_config = {
-                'connection_string': connection_string,
-                'database': database,
-                'collections': collections,
-                'sample_limit': sample_limit
-            }
-            
-        else:
+        # Optional per-agent chunk sizing (tokens), deduplication and embedding model
+        chunking, error = parse_chunking()
+        if error:
             return jsonify({
                 "success": False,
-                "error": f"Unsupported source type: {source_type}"
+                "error": error
             }), 400
         
-        # Create agent
-        result = rag_system.create_agent_from_source(
-            agent_name=agent_name,
-            source_type=source_type,
-            source_config=source_config,
-            user_id=user_id,
-            description=description,
-            domain=domain
-        )
+        source_config, error = parse_source_config(source_type, user_id)
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
         
-        # Clean up uploaded files if any
-        if 'file_paths' in source_config:
-            for path in source_config['file_paths']:
-                try:
-                    os.remove(path)
-                except:
-                    pass
+        if rag_system.get_agent_info(agent_name, user_id):
+            remove_uploaded_files(source_config.get('file_paths', []))
+            return jsonify({
+                "success": False,
+                "error": f"Agent '{agent_name}' already exists for this user"
+            }), 400
         
-        if result["success"]:
-            return jsonify(result), 201
-        else:
-            return jsonify(result), 400
+        # Create agent in the background; uploaded files are removed when the job ends
+        try:
+            job = job_manager.submit(
+                kind="create_from_source",
+                user_id=user_id,
+                agent_name=agent_name,
+                params={
+                    "agent_name": agent_name,
+                    "source_type": source_type,
+                    "source_config": source_config,
+                    "user_id": user_id,
+                    "description": description,
+                    "domain": domain,
+                    **chunking
+                },
+                cleanup_paths=source_config.get('file_paths', []),
+                exclusive=True
+            )
+        except JobConflict as e:
+            remove_uploaded_files(source_config.get('file_paths', []))
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 409
+        return job_accepted(job)
         
     except Exception as e:
         return jsonify({
@@ -742,133 +968,258 @@ def update_agent(agent_name):
         # Get source type
         source_type = request.form.get('source_type', 'pdf')
         
-        source_config = {}
+        source_config, error = parse_source_config(source_type, user_id)
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
         
-        # Handle file-based sources (pdf, csv, word)
-        if source_type in ['pdf', 'csv', 'word']:
-            if 'files' not in request.files:
-                return jsonify({
-                    "success": False,
-                    "error": f"No files provided for {source_type} source"
-                }), 400
-            
-            files = request.files.getlist('files')
-            if not files:
-                return jsonify({
-                    "success": False,
-                    "error": "At least one file is required"
-                }), 400
-            
-            # Validate file extensions
-            valid_extensions = {
-                'pdf': ['.pdf'],
-                'csv': ['.csv'],
-                'word': ['.docx', '.doc']
-            }
-            
-            file_paths = []
-            for file in files:
-                if file and file.filename:
-                    ext = os.path.splitext(file.filename)[1].lower()
-                    if ext in valid_extensions.get(source_type, []):
-                        filename = secure_filename(file.filename)
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{user_id}_{filename}")
-                        file.save(filepath)
-                        file_paths.append(filepath)
-            
-            if not file_paths:
-                return jsonify({
-                    "success": False,
-                    "error": f"No valid {source_type.upper()} files provided"
-                }), 400
-            
-            source_config = {'file_paths': file_paths}
-            
-        # Handle SQL source
-        elif source_type == 'sql':
-            connection_string = request.form.get('connection_string', '')
-            tables_json = request.form.get('tables', '')
-            sample_limit = int(request.form.get('sample_limit', 1000))
-            
-            if not connection_string:
-                return jsonify({
-                    "success": False,
-                    "error": "SQL connection string is required"
-                }), 400
-            
-            tables = None
-            if tables_json:
-                try:
-                    tables = json.loads(tables_json)
-                except:
-                    pass
-            
-            source_config = {
-                'connection_string': connection_string,
-                'tables': tables,
-                'sample_limit': sample_limit
+        if not rag_system.get_agent_info(agent_name, user_id):
+            remove_uploaded_files(source_config.get('file_paths', []))
+            return jsonify({
+                "success": False,
+                "error": f"Agent '{agent_name}' not found"
+            }), 404
+        
+        # Update agent in the background; uploaded files are removed when the job ends
+        job = job_manager.submit(
+            kind="update",
+            user_id=user_id,
+            agent_name=agent_name,
+            params={
+                "agent_name": agent_name,
+                "user_id": user_id,
+                "source_type": source_type,
+                "source_config": source_config
+            },
+            cleanup_paths=source_config.get('file_paths', [])
+        )
+        return job_accepted(job)
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/agents/<agent_name>/sources', methods=['GET'])
+@verify_jwt
+def list_agent_sources(agent_name):
+    """List an agent's sources and their chunk counts"""
+    user_id = request.user_id
+    result = rag_system.list_agent_sources(agent_name, user_id)
+    
+    if result["success"]:
+        return jsonify(result)
+    else:
+        return jsonify(result), 404
+
+
+@app.route('/agents/<agent_name>/sources/<path:source_name>', methods=['DELETE'])
+@verify_jwt
+def delete_agent_source(agent_name, source_name):
+    """Remove a single source's chunks from an agent"""
+    user_id = request.user_id
+    result = rag_system.delete_agent_source(agent_name, user_id, source_name)
+    
+    if result["success"]:
+        return jsonify(result)
+    else:
+        return jsonify(result), 404
+
+
+@app.route('/agents/<agent_name>/sources/<path:source_name>', methods=['PUT'])
+@verify_jwt
+def replace_agent_source(agent_name, source_name):
+    """Replace a single source's chunks with new content (e.g. a revised file)"""
+    try:
+        user_id = request.user_id
+        
+        source_type = request.form.get('source_type', 'pdf')
+        
+        source_config, error = parse_source_config(source_type, user_id)
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
+        
+        if not rag_system.get_agent_info(agent_name, user_id):
+            remove_uploaded_files(source_config.get('file_paths', []))
+            return jsonify({
+                "success": False,
+                "error": f"Agent '{agent_name}' not found"
+            }), 404
+        
+        # Re-embed only this source in the background; uploaded files are removed when the job ends
+        job = job_manager.submit(
+            kind="replace_source",
+            user_id=user_id,
+            agent_name=agent_name,
+            params={
+                "agent_name": agent_name,
+                "user_id": user_id,
+                "source_name": source_name,
+                "source_type": source_type,
+                "source_config": source_config
+            },
+            cleanup_paths=source_config.get('file_paths', [])
+        )
+        return job_accepted(job)
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/agents/<agent_name>/sync', methods=['POST'])
+@verify_jwt
+def sync_agent(agent_name):
+    """Incrementally re-sync an agent's SQL tables or MongoDB collections (only records changed since the last sync)"""
+    try:
+        user_id = request.user_id
+        
+        source_type = request.form.get('source_type', 'sql')
+        if source_type not in ('sql', 'nosql'):
+            return jsonify({
+                "success": False,
+                "error": "Incremental sync supports 'sql' and 'nosql' sources"
+            }), 400
+        
+        source_config, error = parse_source_config(source_type, user_id)
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
+        
+        if not rag_system.get_agent_info(agent_name, user_id):
+            return jsonify({
+                "success": False,
+                "error": f"Agent '{agent_name}' not found"
+            }), 404
+        
+        job = job_manager.submit(
+            kind=f"sync_{source_type}",
+            user_id=user_id,
+            agent_name=agent_name,
+            params={
+                "agent_name": agent_name,
+                "user_id": user_id,
+                "source_config": source_config
             }
-            
-        # Handle NoSQL (MongoDB) source
-        elif source_type == 'nosql':
-            connection_string = request.form.get('connection_string', '')
-            database = request.form.get('database', '')
-            collections_json = request.form.get('collections', '')
-            sample_limit = int(request.form.get('sample_limit', 1000))
-            
-            if not connection_string or not database:
-                return jsonify({
-                    "success": False,
-                    "error": "MongoDB connection string and database name are required"
-                }), 400
-            
-            collections = None
-            if collections_json:
-                try:
-                    collections = json.loads(collections_json)
-                except:
-                    pass
-            
-            source_config = {
-                'connection_string': connection_string,
-                'database': database,
-                'collections': collections,
-                'sample_limit': sample_limit
+        )
+        return job_accepted(job)
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/agents/<agent_name>/reembed', methods=['POST'])
+@verify_jwt
+def reembed_agent(agent_name):
+    """Re-embed an agent's chunks with another embedding model (default: the current default model)"""
+    try:
+        user_id = request.user_id
+        
+        embedding, error = parse_embedding_model()
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
+        
+        if not rag_system.get_agent_info(agent_name, user_id):
+            return jsonify({
+                "success": False,
+                "error": f"Agent '{agent_name}' not found"
+            }), 404
+        
+        job = job_manager.submit(
+            kind="reembed",
+            user_id=user_id,
+            agent_name=agent_name,
+            params={
+                "agent_name": agent_name,
+                "user_id": user_id,
+                **embedding
             }
-            
-        else:
+        )
+        return job_accepted(job)
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/agents/<agent_name>/storage', methods=['PUT'])
+@verify_jwt
+def set_agent_storage(agent_name):
+    """Choose an agent's in-memory vector storage (precision, optional truncated dimensions)"""
+    try:
+        user_id = request.user_id
+        data = request.get_json() or {}
+        
+        dimensions = data.get('dimensions')
+        if dimensions is not None and (not isinstance(dimensions, int) or isinstance(dimensions, bool)):
             return jsonify({
                 "success": False,
-                "error": f"Unsupported source type: {source_type}"
+                "error": "dimensions must be an integer"
             }), 400
         
-        # Update agent with new data
-        result = rag_system.update_agent_data(
+        result = rag_system.set_agent_storage(
             agent_name=agent_name,
             user_id=user_id,
-            source_type=source_type,
-            source_config=source_config
+            precision=data.get('precision'),
+            dimensions=dimensions
         )
         
-        # Clean up uploaded files if any
-        if 'file_paths' in source_config:
-            for path in source_config['file_paths']:
-                try:
-                    os.remove(path)
-                except:
-                    pass
-        
         if result["success"]:
-            return jsonify(result), 200
+            return jsonify(result)
+        elif "not found" in result["error"]:
+            return jsonify(result), 404
         else:
             return jsonify(result), 400
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/agents/<agent_name>/storage-report', methods=['GET'])
+@verify_jwt
+def get_storage_report(agent_name):
+    """Recall vs memory of each vector storage option for an agent"""
+    try:
+        user_id = request.user_id
+        k = request.args.get('k', 4, type=int)
+        queries = request.args.getlist('query')
         
+        result = rag_system.get_storage_report(agent_name, user_id, k=k, queries=queries or None)
+        
+        if result["success"]:
+            return jsonify(result)
+        else:
+            return jsonify(result), 404
+    
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+
 @app.route('/agents/<agent_name>/query', methods=['POST'])
 @verify_jwt
 def query_agent(agent_name):
@@ -886,11 +1237,20 @@ def query_agent(agent_name):
         query = data['query']
         k = data.get('k', 4)
         
+        # Optional metadata filter, e.g. {"table_name": "orders"}
+        filter = data.get('filter')
+        if filter is not None and not isinstance(filter, dict):
+            return jsonify({
+                "success": False,
+                "error": "filter must be an object of metadata field -> value(s)"
+            }), 400
+        
         result = rag_system.query_agent(
             agent_name=agent_name,
             user_id=user_id,
             query=query,
-            k=k
+            k=k,
+            filter=filter
         )
         
         if result["success"]:
@@ -917,6 +1277,89 @@ def delete_agent(agent_name):
     else:
         return jsonify(result), 404
 
+# ==================== INGESTION JOBS ====================
+
+@app.route('/jobs', methods=['GET'])
+@verify_jwt
+def list_jobs():
+    """List the authenticated user's recent ingestion jobs"""
+    limit = request.args.get('limit', 20, type=int)
+    jobs = job_manager.list_jobs(request.user_id, limit)
+    return jsonify({
+        "success": True,
+        "count": len(jobs),
+        "jobs": jobs
+    })
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@verify_jwt
+def get_job(job_id):
+    """Get status and progress of an ingestion job"""
+    job = job_manager.get_job(job_id, request.user_id)
+    if job:
+        return jsonify({
+            "success": True,
+            "job": job
+        })
+    return jsonify({
+        "success": False,
+        "error": "Job not found"
+    }), 404
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@verify_jwt
+def job_events(job_id):
+    """Server-Sent Events stream of job progress, closed when the job finishes"""
+    user_id = request.user_id
+    if not job_manager.get_job(job_id, user_id):
+        return jsonify({
+            "success": False,
+            "error": "Job not found"
+        }), 404
+    
+    def stream():
+        last_payload = None
+        last_sent = time.time()
+        while True:
+            job = job_manager.get_job(job_id, user_id)
+            if job is None:
+                return
+            
+            payload = json.dumps(job)
+            if payload != last_payload:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last_payload = payload
+                last_sent = time.time()
+            elif time.time() - last_sent > 15:
+                yield ": keep-alive\n\n"
+                last_sent = time.time()
+            
+            if job["status"] in TERMINAL_STATUSES:
+                yield f"event: end\ndata: {payload}\n\n"
+                return
+            
+            time.sleep(0.5)
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@verify_jwt
+def cancel_job(job_id):
+    """Cancel a queued or running ingestion job"""
+    result = job_manager.cancel_job(job_id, request.user_id)
+    
+    if result["success"]:
+        return jsonify(result)
+    else:
+        return jsonify(result), 404
+
 # ==================== ADMIN ENDPOINTS ====================
 
 @app.route('/admin/users', methods=['GET'])
@@ -1027,10 +1470,20 @@ if __name__ == '__main__':
     print("\nProtected Endpoints (JWT Required):")
     print("  GET    /agents                      - List user's agents")
     print("  GET    /agents/<name>               - Get agent info")
-    print("  POST   /agents/create               - Create new agent")
+    print("  POST   /agents/create               - Create new agent (returns job id)")
+    print("  POST   /agents/create-from-source   - Create agent from CSV/Word/SQL/NoSQL (job)")
+    print("  POST   /agents/<name>/update        - Add data to agent (job)")
+    print("  GET    /agents/<name>/sources       - List agent sources")
+    print("  DELETE /agents/<name>/sources/<src> - Remove a source")
+    print("  PUT    /agents/<name>/sources/<src> - Replace a source (job)")
+    print("  POST   /agents/<name>/sync          - Incremental SQL/NoSQL re-sync (job)")
     print("  POST   /agents/<name>/query         - Query agent")
     print("  POST   /agents/<name>/embed-token   - Generate embed token")
     print("  DELETE /agents/<name>               - Delete agent")
+    print("  GET    /jobs                        - List ingestion jobs")
+    print("  GET    /jobs/<id>                   - Job status and progress")
+    print("  GET    /jobs/<id>/events            - Job progress stream (SSE)")
+    print("  POST   /jobs/<id>/cancel            - Cancel a job")
     print("\nPublic Endpoints (No Auth):")
     print("  GET    /health                      - Health check")
     print("  GET    /widget.js                   - Embed widget script")
@@ -0,0 +1,96 @@
+"""
+Chunking Benchmark
+Compares the previous pipeline (join every Document with "\\n\\n" and run
+RecursiveCharacterTextSplitter over the whole string) with StructuredSplitter
+on the same synthetic corpus of table rows and long prose documents.
+
+Usage (from rag-chatbot-generator-main):
+    python benchmarks/bench_chunking.py --rows 200000 --articles 200
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chunking import StructuredSplitter
+
+WORDS = ("order customer invoice shipment product warehouse payment refund account "
+         "region quarter revenue discount supplier contract delivery status").split()
+
+
+TABLE_TAG = re.compile(r"^table: (\S+)$", re.MULTILINE)
+
+
+def build_corpus(rows: int, articles: int, tables: int = 50, seed: int = 7):
+    """Short record documents (like CSV/SQL rows from several tables) followed by long prose documents"""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(rows):
+        table = f"table_{i * tables // max(rows, 1)}"
+        text = (f"table: {table}\norder_id: {i}\ncustomer: {rng.choice(WORDS)}_{rng.randint(1, 5000)}\n"
+                f"amount: {rng.randint(1, 10000) / 100}\nstatus: {rng.choice(WORDS)}")
+        documents.append(Document(page_content=text, metadata={"source": table, "row_number": i}))
+
+    for i in range(articles):
+        paragraphs = []
+        for _ in range(rng.randint(5, 40)):
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+                         for _ in range(rng.randint(2, 8))]
+            paragraphs.append(" ".join(sentences))
+        documents.append(Document(page_content="\n\n".join(paragraphs), metadata={"source": f"article_{i}"}))
+    return documents
+
+
+def run(name, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return name, chunks, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunking strategies")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of short record documents")
+    parser.add_argument("--articles", type=int, default=100, help="Number of long prose documents")
+    parser.add_argument("--chunk-size", type=int, default=400)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    documents = build_corpus(args.rows, args.articles)
+    total_chars = sum(len(d.page_content) for d in documents)
+    print(f"Corpus: {len(documents)} documents, {total_chars / (1024 * 1024):.1f} MB of text\n")
+
+    def recursive():
+        splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.overlap,
+                                                  length_function=len)
+        return splitter.split_text("\n\n".join(d.page_content for d in documents))
+
+    def structured():
+        splitter = StructuredSplitter(chunk_size=args.chunk_size, chunk_overlap=args.overlap)
+        key = lambda d: d.metadata["source"]
+        return [c.page_content for _, c in splitter.iter_chunks(documents, group_key=key)]
+
+    print(f"{'splitter':<12} {'chunks':>8} {'seconds':>9} {'peak MB':>9} {'mixed chunks':>13}")
+    for name, chunks, elapsed, peak in (run("recursive", recursive), run("structured", structured)):
+        # Mixed: records of two tables, or records glued to prose, in one chunk
+        mixed = 0
+        for chunk in chunks:
+            tags = set(TABLE_TAG.findall(chunk))
+            if len(tags) > 1 or (tags and not chunk.startswith("table: ")):
+                mixed += 1
+        print(f"{name:<12} {len(chunks):>8} {elapsed:>9.2f} {peak / (1024 * 1024):>9.1f} {mixed:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Structure-Aware Chunking
+Streaming splitter that works per document instead of over one concatenated
+string. Small records (CSV rows, SQL rows, Mongo documents) are packed into
+chunks without crossing a record boundary; long documents are split with a
+single linear scan that prefers paragraph, line, sentence and word breaks.
+
+Sizes are measured in characters, or in tokens when a tiktoken encoding is
+given, so chunks can be matched to the embedding model's context window.
+"""
+from bisect import bisect_left
+from itertools import islice
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Preferred cut points inside a long document, best first
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+# Joins packed records inside one chunk
+RECORD_SEPARATOR = "\n\n"
+
+# Records are tokenized in batches of this many documents
+TOKENIZE_BATCH_SIZE = 1024
+
+
+def _shared_metadata(metadata: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata fields with the same value in both documents"""
+    return {field: value for field, value in metadata.items() if other.get(field) == value}
+
+
+class StructuredSplitter:
+    """
+    Generator-based splitter that keeps document boundaries.
+
+    Consecutive documents with the same group key are packed up to chunk_size;
+    a document longer than chunk_size is split on its own. A chunk never
+    contains parts of two groups, and a record is never split unless it is
+    longer than a whole chunk.
+    """
+
+    def __init__(self, chunk_size: int = 400, chunk_overlap: int = 50,
+                 separators: Tuple[str, ...] = SEPARATORS, encoding: Any = None):
+        """
+        Initialize the splitter.
+
+        Args:
+            chunk_size: Maximum chunk length (characters, or tokens with an encoding)
+            chunk_overlap: Length repeated between pieces of one long document
+            separators: Preferred cut points for long documents, best first
+            encoding: Optional tiktoken encoding; sizes are then counted in tokens
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators
+        self.encoding = encoding
+
+        # Length of RECORD_SEPARATOR in the unit chunks are measured in
+        self.separator_length = len(encoding.encode_ordinary(RECORD_SEPARATOR)) if encoding else len(RECORD_SEPARATOR)
+
+    def _measured(self, documents: Iterable[Document]) -> Iterator[Tuple[Document, int]]:
+        """Pair documents with their length, tokenizing a batch of records per call"""
+        if self.encoding is None:
+            for doc in documents:
+                yield doc, len(doc.page_content)
+            return
+
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, TOKENIZE_BATCH_SIZE))
+            if not batch:
+                return
+            token_lists = self.encoding.encode_ordinary_batch([doc.page_content for doc in batch])
+            for doc, tokens in zip(batch, token_lists):
+                yield doc, len(tokens)
+
+    def iter_chunks(self, documents: Iterable[Document],
+                    group_key: Optional[Callable[[Document], Hashable]] = None) -> Iterator[Tuple[Hashable, Document]]:
+        """
+        Yield (group key, chunk) pairs. Each chunk keeps the metadata shared by
+        the records packed into it.
+
+        Args:
+            documents: Documents in source order (may be a generator)
+            group_key: Records are only packed with neighbours of the same key
+        """
+        pending: List[str] = []
+        pending_length = 0
+        pending_metadata: Dict[str, Any] = {}
+        pending_key = None
+
+        for doc, length in self._measured(documents):
+            text = doc.page_content
+            if not text or not text.strip():
+                continue
+            key = group_key(doc) if group_key else None
+
+            if pending and (key != pending_key or
+                            pending_length + self.separator_length + length > self.chunk_size):
+                yield pending_key, Document(page_content=RECORD_SEPARATOR.join(pending), metadata=pending_metadata)
+                pending, pending_length = [], 0
+
+            if length > self.chunk_size:
+                # Long record: split on its own, never merged with neighbours
+                for piece in self.split_text(text):
+                    yield key, Document(page_content=piece, metadata=dict(doc.metadata))
+                continue
+
+            if pending:
+                pending_metadata = _shared_metadata(pending_metadata, doc.metadata)
+                pending_length += self.separator_length
+            else:
+                pending_metadata = dict(doc.metadata)
+                pending_key = key
+            pending.append(text)
+            pending_length += length
+
+        if pending:
+            yield pending_key, Document(page_content=RECORD_SEPARATOR.join(pending), metadata=pending_metadata)
+
+    def split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Yield chunks without group keys"""
+        for _, chunk in self.iter_chunks(documents):
+            yield chunk
+
+    def split_text(self, text: str) -> Iterator[str]:
+        """
+        Split one long text in a single forward pass. Each cut is searched only
+        within the current window, so total work is linear in the text length.
+        """
+        if self.encoding is not None:
+            yield from self._split_tokens(text)
+            return
+
+        length = len(text)
+        start = 0
+        while start < length:
+            end = min(start + self.chunk_size, length)
+            if end < length:
+                # Never cut in the first half of the window, to keep chunks reasonably full
+                end = self._find_cut(text, start, end, start + self.chunk_size // 2)
+
+            piece = text[start:end].strip()
+            if piece:
+                yield piece
+            if end >= length:
+                break
+
+            # Step back for overlap, aligned to a word start so words are not cut
+            next_start = max(end - self.chunk_overlap, start + 1)
+            if next_start < end:
+                space = text.find(" ", next_start, end)
+                next_start = space + 1 if space != -1 else end
+            start = next_start
+
+    def _split_tokens(self, text: str) -> Iterator[str]:
+        """Token-sized variant of split_text: windows are chunk_size tokens, cuts still prefer separators"""
+        tokens = self.encoding.encode_ordinary(text)
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+        count = len(tokens)
+
+        start = 0
+        while start < count:
+            end = min(start + self.chunk_size, count)
+            if end < count:
+                # Never cut in the first half of the window, to keep chunks reasonably full
+                cut = self._find_cut(text, offsets[start], offsets[end], offsets[start + self.chunk_size // 2])
+                end = max(bisect_left(offsets, cut, start + 1, end), start + 1)
+
+            char_end = offsets[end] if end < count else len(text)
+            piece = text[offsets[start]:char_end].strip()
+            if piece:
+                yield piece
+            if end >= count:
+                break
+            start = max(end - self.chunk_overlap, start + 1)
+
+    def _find_cut(self, text: str, start: int, end: int, floor: int) -> int:
+        """Best cut position in text[start:end] at or after floor, preferring earlier separators"""
+        for separator in self.separators:
+            position = text.rfind(separator, floor, end)
+            if position != -1:
+                return position + len(separator)
+        return end
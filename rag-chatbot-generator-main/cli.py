@@ -13,7 +13,8 @@ def print_menu():
     print("  3. query          - Query an agent")
     print("  4. info           - Get agent information")
     print("  5. delete         - Delete an agent")
-    print("  6. exit           - Exit the program")
+    print("  6. reembed        - Re-embed an agent with another embedding model")
+    print("  7. exit           - Exit the program")
     print()
 
 def list_agents(rag_system):
@@ -181,6 +182,44 @@ def delete_agent(rag_system):
     else:
         print(f"\n[ERROR] {result['error']}")
 
+def reembed_agent(rag_system):
+    print("\n--- RE-EMBED AGENT ---")
+    agents = rag_system.list_agents()
+    
+    if not agents:
+        print("[ERROR] No agents available")
+        return
+    
+    print("\nAvailable agents:")
+    for i, agent in enumerate(agents, 1):
+        info = rag_system.get_agent_info(agent['name'], agent['user_id']) or {}
+        embedding = info.get('embedding') or {}
+        print(f"  {i}. {agent['name']} ({embedding.get('backend')}:{embedding.get('model')}, "
+              f"{embedding.get('dimension', '?')} dims)")
+    
+    choice = input("\nSelect agent number to re-embed: ").strip()
+    try:
+        idx = int(choice) - 1
+        if idx < 0 or idx >= len(agents):
+            print("[ERROR] Invalid selection")
+            return
+        agent = agents[idx]
+    except ValueError:
+        print("[ERROR] Invalid input")
+        return
+    
+    backend = input("Embedding backend (ollama/onnx/hash, default: current default): ").strip()
+    model = input("Embedding model (default: the backend's default): ").strip()
+    
+    result = rag_system.reembed_agent(agent['name'], agent['user_id'],
+                                      embedding_backend=backend or None, embedding_model=model or None)
+    if result["success"]:
+        embedding = result['embedding_model']
+        print(f"\n[SUCCESS] Re-embedded {result['total_chunks']} chunks with "
+              f"{embedding['backend']}:{embedding['model']} ({embedding['dimension']} dims)")
+    else:
+        print(f"\n[ERROR] {result['error']}")
+
 def main():
     print_header()
     rag_system = RAGAgentSystem()
@@ -199,7 +238,9 @@ def main():
             show_agent_info(rag_system)
         elif command in ['5', 'delete']:
             delete_agent(rag_system)
-        elif command in ['6', 'exit', 'quit']:
+        elif command in ['6', 'reembed']:
+            reembed_agent(rag_system)
+        elif command in ['7', 'exit', 'quit']:
             print("\n[INFO] Exiting... Goodbye!\n")
             sys.exit(0)
         else:
@@ -1,10 +1,11 @@
 """
 Data source connectors for multi-source RAG agents.
-Supports PDF, CSV, Word documents, SQL databases, and NoSQL databases.
+Supports PDF, CSV, Word documents, Parquet/Arrow files, SQL databases, and NoSQL databases.
 """
 from .base import BaseDataSource
 from .csv_source import CSVSource
 from .word_source import WordSource
+from .parquet_source import ParquetSource
 from .sql_source import SQLSource
 from .nosql_source import NoSQLSource
 
@@ -12,6 +13,7 @@ __all__ = [
     'BaseDataSource',
     'CSVSource',
     'WordSource', 
+    'ParquetSource',
     'SQLSource',
     'NoSQLSource'
 ]
@@ -0,0 +1,138 @@
+"""
+Columnar Row Rendering
+Turns Arrow record batches into "col: value" row text with vectorized
+string kernels, one column at a time, so no Python object is built per
+row or per cell until the finished row strings are read out.
+Shared by the Parquet/Arrow source and SQLSource's Arrow fetch mode;
+render_row writes rows fetched as Python values (SQLSource's rows mode)
+the same way.
+"""
+import re
+from datetime import datetime, time, timezone
+from typing import Any, Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    print("[WARN] pyarrow not installed. Parquet/Arrow support disabled.")
+
+# Separator between the "col: value" lines of one row
+FIELD_SEPARATOR = "\n"
+
+# Arrow writes exponents without padding (1.5e-7) and zero fractional seconds in full
+_EXPONENT_PADDING = re.compile(r"e([+-])0+(?=\d)")
+_ZERO_FRACTION = r"\.0+(Z?)$"
+
+
+def format_value(value: Any) -> Optional[str]:
+    """
+    A Python cell value as render_rows writes the same value from Arrow:
+    booleans as true/false, floats without a trailing ".0", times without
+    zero fractional seconds (zone-aware timestamps in UTC with a "Z").
+    Returns None for nulls and binary values, which are left out.
+    """
+    if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        text = repr(float(value))
+        if text.endswith(".0"):
+            text = text[:-2]
+        return _EXPONENT_PADDING.sub(r"e\1", text)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat(sep=" ") + "Z"
+        return value.isoformat(sep=" ")
+    if isinstance(value, time):
+        return value.replace(tzinfo=None).isoformat()
+    return str(value)
+
+
+def render_row(row: Iterable[Any], columns: List[str]) -> str:
+    """One row of Python values as render_rows renders it ("" when every cell is blank)"""
+    parts = []
+    for label, value in zip(columns, row):
+        text = (format_value(value) or "").strip()
+        if text:
+            parts.append(f"{label}: {text}")
+    return FIELD_SEPARATOR.join(parts)
+
+
+def _column_text(values: 'pa.Array') -> 'pa.Array':
+    """
+    A column as a string array, nulls preserved, in format_value's format.
+    Binary columns render as null; nested types (lists, structs, maps) and
+    durations go through format_value per value since Arrow cannot cast
+    them to strings (or casts durations to bare numbers).
+    """
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+
+    value_type = values.type
+    if pa.types.is_string(value_type) or pa.types.is_large_string(value_type):
+        return values
+    if pa.types.is_binary(value_type) or pa.types.is_large_binary(value_type) or pa.types.is_fixed_size_binary(value_type):
+        return pa.nulls(len(values), pa.string())
+
+    if not pa.types.is_duration(value_type):
+        try:
+            text = pc.cast(values, pa.string())
+        except (pa.ArrowNotImplementedError, pa.ArrowInvalid):
+            pass
+        else:
+            if pa.types.is_timestamp(value_type) or pa.types.is_time(value_type):
+                text = pc.replace_substring_regex(text, _ZERO_FRACTION, r"\1")
+            return text
+    return pa.array([format_value(value) for value in values.to_pylist()], pa.string())
+
+
+def render_rows(batch: 'pa.RecordBatch', columns: Optional[List[str]] = None) -> 'pa.Array':
+    """
+    Render each row of a record batch as "col: value" lines.
+    Null and blank cells are left out; a row with no values renders as "".
+
+    Args:
+        batch: Record batch (or table) to render
+        columns: Labels to use instead of the batch's column names
+    """
+    labels = columns or batch.schema.names
+    parts = []
+
+    for label, values in zip(labels, batch.columns):
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        text = pc.utf8_trim_whitespace(_column_text(values))
+        labelled = pc.binary_join_element_wise(f"{label}: ", text, "")
+        # Blank cells become null so the row join skips them
+        parts.append(pc.if_else(pc.greater(pc.utf8_length(text), 0), labelled, None))
+
+    if not parts:
+        return pa.array([""] * batch.num_rows, pa.string())
+
+    # The skipping join drops rows whose parts are all null (pyarrow 26), so
+    # lead with a non-null empty part and cut its separator off afterwards
+    lead = pa.array([""] * batch.num_rows, pa.string())
+    joined = pc.binary_join_element_wise(lead, *parts, FIELD_SEPARATOR, null_handling='skip')
+    return pc.utf8_slice_codeunits(joined, len(FIELD_SEPARATOR))
+
+
+def rows_to_batch(rows: List[tuple], names: List[str]) -> 'pa.RecordBatch':
+    """
+    Record batch from DB-API style row tuples, transposed column-wise.
+    Columns whose values Arrow cannot type together (e.g. SQLite's mixed
+    types) are kept as strings.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = []
+
+    for values in columns:
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+            arrays.append(pa.array([format_value(value) for value in values], pa.string()))
+
+    return pa.RecordBatch.from_arrays(arrays, names=names)
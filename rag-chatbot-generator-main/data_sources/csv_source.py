@@ -1,113 +1,473 @@
 """
 CSV Data Source Connector
 Extracts text from CSV files for RAG training.
+
+The encoding is detected once from bounded samples of the file, so a late
+decode error never forces a re-parse; bytes that still fail to decode
+become U+FFFD and are counted per file. Large files are split into
+newline-aligned byte ranges that a process pool parses in parallel; the
+results are merged back in file order. The quote characters before every
+range boundary are counted first, and a file whose boundary falls inside a
+quoted field is parsed serially without starting the pool. Workers are
+spawned, never forked, so they do not inherit the server's threads and locks.
 """
 import csv
+import io
 import os
-from typing import List, Dict, Any
+import time
+import codecs
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
 from .base import BaseDataSource
 
+# Separator between values in batched documents
+BATCH_VALUE_SEPARATOR = " | "
+
+# Rough characters-per-token ratio used when no tokenizer is given
+CHARS_PER_TOKEN = 4
+
+# Encodings tried on the samples, strictest first (latin-1 decodes anything)
+CANDIDATE_ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+
+# Bytes read from the head, middle and tail of a file for encoding detection
+ENCODING_SAMPLE_BYTES = 256 * 1024
+
+# Files at least this large are parsed in parallel byte ranges
+PARALLEL_MIN_BYTES = int(os.environ.get('CSV_PARALLEL_MIN_MB', '64')) * 1024 * 1024
+PARALLEL_RANGE_BYTES = 32 * 1024 * 1024
+PARSE_WORKERS = int(os.environ.get('CSV_PARSE_WORKERS', str(os.cpu_count() or 1)))
+
+# Serial parsing reports progress every this many rows
+PROGRESS_EVERY_ROWS = 50000
+
+# UTF-8 continuation bytes; a sample taken mid-file may start with some
+_UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+
+# Character substituted for bytes that do not decode (errors='replace')
+REPLACEMENT_CHAR = "\ufffd"
+
+
+def detect_encoding(file_path: str, sample_bytes: int = ENCODING_SAMPLE_BYTES) -> str:
+    """
+    Detect a file's encoding from bounded samples of its head, middle and tail.
+    At most three samples are read, whatever the file size.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(sample_bytes)
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        
+        samples = [head]
+        for offset in (size // 2, size - sample_bytes):
+            if offset > len(head):
+                f.seek(offset)
+                samples.append(f.read(sample_bytes).lstrip(_UTF8_CONTINUATION))
+    
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            for sample in samples:
+                # final=False: a character cut at the end of a sample is not an error
+                codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1'
+
+
+def _dialect_params(dialect) -> Dict[str, Any]:
+    """csv.reader keyword arguments for a dialect, picklable for worker processes"""
+    return {
+        "delimiter": dialect.delimiter,
+        "quotechar": dialect.quotechar,
+        "doublequote": dialect.doublequote,
+        "escapechar": dialect.escapechar,
+        "skipinitialspace": dialect.skipinitialspace
+    }
+
+
+def _has_quoted_newlines(sample: str, dialect_params: Dict[str, Any]) -> bool:
+    """True if a quoted field in the sample spans lines; byte ranges would cut such records"""
+    # Drop the last line, which is probably cut off
+    sample = sample[:sample.rfind("\n") + 1]
+    for row in csv.reader(io.StringIO(sample, newline=''), **dialect_params):
+        if any("\n" in value or "\r" in value for value in row):
+            return True
+    return False
+
+
+def _quote_count(data: bytes, encoding: str, dialect_params: Dict[str, Any]) -> int:
+    """
+    Quote characters in a byte range, escaped ones excluded. A range starting
+    outside quotes with an odd count ends inside a quoted field.
+    """
+    quotechar = dialect_params.get("quotechar")
+    if not quotechar:
+        return 0
+    quote = quotechar.encode(encoding)
+    count = data.count(quote)
+    escapechar = dialect_params.get("escapechar")
+    if escapechar:
+        count -= data.count(escapechar.encode(encoding) + quote)
+    return count
+
+
+def _boundary_inside_quotes(file_path: str, ranges: List[Tuple[int, int]], encoding: str,
+                            dialect_params: Dict[str, Any]) -> bool:
+    """True if a range after the first starts inside a quoted field (odd quote count before it)"""
+    quotes = 0
+    with open(file_path, 'rb') as f:
+        for start, end in ranges[:-1]:
+            f.seek(start)
+            quotes += _quote_count(f.read(end - start), encoding, dialect_params)
+            if quotes % 2:
+                return True
+    return False
+
+
+def _newline_aligned_ranges(file_path: str, start: int, end: int, range_bytes: int) -> List[Tuple[int, int]]:
+    """Split the byte range [start, end) into ranges that each begin at a line start"""
+    ranges = []
+    with open(file_path, 'rb') as f:
+        while start < end:
+            boundary = start + range_bytes
+            if boundary < end:
+                f.seek(boundary)
+                f.readline()  # Move to the start of the next line
+                boundary = f.tell()
+            boundary = min(boundary, end)
+            ranges.append((start, boundary))
+            start = boundary
+    return ranges
+
+
+# Tokenizers loaded by a worker process, by encoding name
+_worker_token_encodings: Dict[str, Any] = {}
+
+
+def _parse_byte_range(task: Dict[str, Any]) -> Tuple[List[Document], int, int]:
+    """
+    Worker process entry point: parse one byte range of a CSV file.
+    Row numbers are relative to the range; the parent shifts them.
+    Returns the documents, rows parsed and replacement characters
+    produced by decoding.
+    """
+    token_encoding = None
+    name = task["token_encoding"]
+    if name:
+        if name not in _worker_token_encodings:
+            import tiktoken
+            _worker_token_encodings[name] = tiktoken.get_encoding(name)
+        token_encoding = _worker_token_encodings[name]
+    
+    with open(task["file_path"], 'rb') as f:
+        f.seek(task["start"])
+        data = f.read(task["end"] - task["start"])
+    
+    text = data.decode(task["encoding"], errors='replace')
+    reader = csv.reader(io.StringIO(text, newline=''), **task["dialect"])
+    
+    source = CSVSource([], rows_per_document=task["rows_per_document"],
+                       max_tokens_per_document=task["max_tokens_per_document"],
+                       encoding=token_encoding, workers=1)
+    if source.batched:
+        documents = list(source._batch_documents(reader, task["headers"], task["filename"]))
+    else:
+        documents = list(source._row_documents(reader, task["headers"], task["filename"]))
+    return documents, source.rows_processed, text.count(REPLACEMENT_CHAR)
+
 
 class CSVSource(BaseDataSource):
     """Extract documents from CSV files"""
     
-    def __init__(self, file_paths: List[str]):
+    def __init__(self, file_paths: List[str], rows_per_document: Optional[int] = None,
+                 max_tokens_per_document: Optional[int] = None, encoding: Any = None,
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 workers: int = PARSE_WORKERS):
         """
         Initialize CSV source with file paths.
         
         Args:
             file_paths: List of paths to CSV files
+            rows_per_document: Batched mode - group up to this many rows per document
+            max_tokens_per_document: Batched mode - group rows up to this token budget
+            encoding: Optional tiktoken encoding for the token budget (estimated from length otherwise)
+            progress_callback: Optional callable receiving {"rows_processed", "rows_per_sec", ...} updates
+            workers: Processes used to parse large files (1 parses everything in this process)
+        
+        Without rows_per_document or max_tokens_per_document every row becomes
+        its own document.
         """
         self.file_paths = file_paths
+        self.rows_per_document = rows_per_document
+        self.max_tokens_per_document = max_tokens_per_document
+        self.encoding = encoding
+        self.progress_callback = progress_callback
+        self.workers = max(1, workers)
         self.documents: List[Document] = []
-        
+        self.rows_processed = 0
+        self.file_encodings: Dict[str, str] = {}
+        # file name -> U+FFFD characters substituted for bytes that did not decode
+        self.replacement_chars: Dict[str, int] = {}
+        self._started_at = time.time()
+        self._callback_error: Optional[BaseException] = None
+    
+    @property
+    def batched(self) -> bool:
+        return bool(self.rows_per_document or self.max_tokens_per_document)
+    
     def get_source_type(self) -> str:
         return "csv"
     
     def extract_documents(self) -> List[Document]:
         """
         Extract documents from CSV files.
-        Each row becomes a document with column headers as context.
+        Each row (or, in batched mode, each batch of rows) becomes a document
+        with column headers as context.
         """
         all_documents = []
+        self._started_at = time.time()
         
         for file_path in self.file_paths:
             if not os.path.exists(file_path):
                 print(f"[WARN] CSV file not found: {file_path}")
                 continue
-                
+            
             try:
                 docs = self._process_csv_file(file_path)
                 all_documents.extend(docs)
                 print(f"[OK] Extracted {len(docs)} documents from {os.path.basename(file_path)}")
             except Exception as e:
+                # An error from the progress callback (e.g. a cancelled job) stops extraction
+                if self._callback_error is not None:
+                    raise
                 print(f"[ERROR] Failed to process {file_path}: {e}")
-                
+        
         self.documents = all_documents
         return all_documents
     
     def _process_csv_file(self, file_path: str) -> List[Document]:
         """Process a single CSV file into documents"""
-        documents = []
         filename = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
         
-        # Try different encodings
-        encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252']
+        # Detected once; bytes outside the samples that do not decode become U+FFFD
+        encoding = detect_encoding(file_path)
+        self.file_encodings[filename] = encoding
+        self.replacement_chars.pop(filename, None)
         
-        for encoding in encodings:
+        with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+            # Detect delimiter
+            sample = f.read(64 * 1024)
+            f.seek(0)
+            
             try:
-                with open(file_path, 'r', encoding=encoding, newline='') as f:
-                    # Detect delimiter
-                    sample = f.read(4096)
-                    f.seek(0)
-                    
-                    try:
-                        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
-                    except csv.Error:
-                        dialect = csv.excel
-                    
-                    reader = csv.DictReader(f, dialect=dialect)
-                    headers = reader.fieldnames or []
-                    
-                    # Create documents from rows
-                    for row_num, row in enumerate(reader, start=1):
-                        # Convert row to readable text format
-                        text_parts = []
-                        for header in headers:
-                            value = row.get(header, '').strip()
-                            if value:
-                                text_parts.append(f"{header}: {value}")
-                        
-                        if text_parts:
-                            content = "\n".join(text_parts)
-                            doc = Document(
-                                page_content=content,
-                                metadata={
-                                    "source": filename,
-                                    "source_type": "csv",
-                                    "row_number": row_num,
-                                    "columns": headers
-                                }
-                            )
-                            documents.append(doc)
-                    
-                    break  # Successfully parsed
-                    
-            except UnicodeDecodeError:
-                continue
-            except Exception as e:
-                if encoding == encodings[-1]:
-                    raise e
-                continue
+                dialect = csv.Sniffer().sniff(sample[:4096], delimiters=',;\t|')
+            except csv.Error:
+                dialect = csv.excel
+            dialect_params = _dialect_params(dialect)
+            
+            # Plain reader: rows are compact lists instead of per-row dicts
+            reader = csv.reader(self._counted_lines(f, filename), **dialect_params)
+            headers = next(reader, [])
+            
+            documents = None
+            if (self.workers > 1 and file_size >= PARALLEL_MIN_BYTES and
+                    not _has_quoted_newlines(sample, dialect_params)):
+                documents = self._parse_parallel(file_path, filename, encoding, dialect_params, headers)
+            if documents is None:
+                if self.batched:
+                    documents = list(self._batch_documents(reader, headers, filename))
+                else:
+                    documents = list(self._row_documents(reader, headers, filename))
         
+        replaced = self.replacement_chars.get(filename, 0)
+        if replaced:
+            print(f"[WARN] {replaced} replacement characters (U+FFFD) in {filename}: "
+                  f"bytes that did not decode as {encoding}")
+        
+        self._report_progress(bytes_processed=file_size, bytes_total=file_size)
         return documents
     
+    def _counted_lines(self, lines: Iterator[str], filename: str) -> Iterator[str]:
+        """Yield lines, counting the U+FFFD characters that replaced undecodable bytes"""
+        for line in lines:
+            if REPLACEMENT_CHAR in line:
+                self.replacement_chars[filename] = self.replacement_chars.get(filename, 0) + line.count(REPLACEMENT_CHAR)
+            yield line
+    
+    def _parse_parallel(self, file_path: str, filename: str, encoding: str,
+                        dialect_params: Dict[str, Any], headers: List[str]) -> Optional[List[Document]]:
+        """
+        Parse newline-aligned byte ranges in a process pool and merge them in
+        file order. Returns None before any range is parsed when a range
+        boundary falls inside a quoted field (the file must be parsed serially).
+        """
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            f.readline()  # Header line
+            data_start = f.tell()
+        
+        ranges = _newline_aligned_ranges(file_path, data_start, file_size, PARALLEL_RANGE_BYTES)
+        # A cheap byte count, so no range is parsed only to be thrown away
+        if _boundary_inside_quotes(file_path, ranges, encoding, dialect_params):
+            print(f"[INFO] A byte range of {filename} starts inside a quoted field; parsing it serially")
+            return None
+        
+        tasks = [{
+            "file_path": file_path,
+            "start": start,
+            "end": end,
+            "encoding": encoding,
+            "dialect": dialect_params,
+            "headers": headers,
+            "filename": filename,
+            "rows_per_document": self.rows_per_document,
+            "max_tokens_per_document": self.max_tokens_per_document,
+            "token_encoding": getattr(self.encoding, "name", None)
+        } for start, end in ranges]
+        
+        workers = min(self.workers, len(tasks))
+        print(f"[INFO] Parsing {filename} in {len(tasks)} byte ranges with {workers} processes")
+        
+        documents = []
+        rows_before = self.rows_processed
+        replaced = 0
+        # Spawned workers: forking a threaded server can copy a held lock into the child
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            # map() returns results in submission order, i.e. file order
+            results = executor.map(_parse_byte_range, tasks)
+            for (range_docs, range_rows, range_replaced), (_, end) in zip(results, ranges):
+                replaced += range_replaced
+                
+                offset = self.rows_processed - rows_before
+                for doc in range_docs:
+                    for field in ("row_number", "row_start", "row_end"):
+                        if field in doc.metadata:
+                            doc.metadata[field] += offset
+                documents.extend(range_docs)
+                self.rows_processed += range_rows
+                self._report_progress(bytes_processed=end, bytes_total=file_size)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        
+        if replaced:
+            self.replacement_chars[filename] = self.replacement_chars.get(filename, 0) + replaced
+        return documents
+    
+    def _count_row(self):
+        """Count one parsed row, reporting progress every PROGRESS_EVERY_ROWS rows"""
+        self.rows_processed += 1
+        if self.rows_processed % PROGRESS_EVERY_ROWS == 0:
+            self._report_progress()
+    
+    def _report_progress(self, **extra):
+        if self.progress_callback is None:
+            return
+        elapsed = time.time() - self._started_at
+        update = {
+            "rows_processed": self.rows_processed,
+            "rows_per_sec": round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+        }
+        update.update(extra)
+        try:
+            self.progress_callback(update)
+        except BaseException as e:
+            self._callback_error = e
+            raise
+    
+    def _row_documents(self, reader, headers: List[str], filename: str) -> Iterator[Document]:
+        """One document per row, as 'header: value' lines"""
+        for row_num, row in enumerate(reader, start=1):
+            self._count_row()
+            
+            # Convert row to readable text format
+            text_parts = []
+            for header, value in zip(headers, row):
+                value = value.strip()
+                if value:
+                    text_parts.append(f"{header}: {value}")
+            
+            if text_parts:
+                yield Document(
+                    page_content="\n".join(text_parts),
+                    metadata={
+                        "source": filename,
+                        "source_type": "csv",
+                        "row_number": row_num,
+                        "columns": headers
+                    }
+                )
+    
+    def _batch_documents(self, reader, headers: List[str], filename: str) -> Iterator[Document]:
+        """
+        Group rows into documents with the headers written once per batch.
+        A batch ends at rows_per_document rows or when the next row would
+        exceed max_tokens_per_document.
+        """
+        header_line = "Columns: " + BATCH_VALUE_SEPARATOR.join(h.strip() for h in headers)
+        header_tokens = self._count_tokens(header_line)
+        
+        lines: List[str] = []
+        batch_tokens = header_tokens
+        first_row = last_row = 0
+        
+        def make_document() -> Document:
+            return Document(
+                page_content=header_line + "\n" + "\n".join(lines),
+                metadata={
+                    "source": filename,
+                    "source_type": "csv",
+                    "row_start": first_row,
+                    "row_end": last_row,
+                    "columns": headers
+                }
+            )
+        
+        for row_num, row in enumerate(reader, start=1):
+            self._count_row()
+            values = [value.strip() for value in row]
+            if not any(values):
+                continue
+            
+            line = BATCH_VALUE_SEPARATOR.join(values)
+            # +1 for the newline joining it to the batch
+            line_tokens = self._count_tokens(line) + 1 if self.max_tokens_per_document else 0
+            
+            if lines and (
+                (self.rows_per_document and len(lines) >= self.rows_per_document) or
+                (self.max_tokens_per_document and batch_tokens + line_tokens > self.max_tokens_per_document)
+            ):
+                yield make_document()
+                lines = []
+                batch_tokens = header_tokens
+            
+            if not lines:
+                first_row = row_num
+            lines.append(line)
+            batch_tokens += line_tokens
+            last_row = row_num
+        
+        if lines:
+            yield make_document()
+    
+    def _count_tokens(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode_ordinary(text))
+        return len(text) // CHARS_PER_TOKEN + 1
+    
     def get_metadata(self) -> Dict[str, Any]:
         """Return metadata about the CSV source"""
         return {
             "source_type": "csv",
             "file_count": len(self.file_paths),
             "document_count": len(self.documents),
+            "rows_processed": self.rows_processed,
+            "batched": self.batched,
+            "encodings": self.file_encodings,
+            "replacement_chars": self.replacement_chars,
             "files": [os.path.basename(f) for f in self.file_paths]
         }
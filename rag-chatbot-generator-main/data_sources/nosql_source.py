@@ -1,26 +1,74 @@
 """
 NoSQL (MongoDB) Data Source Connector
 Extracts data from MongoDB collections for RAG training.
+
+Documents are read through an aggregation pipeline that projects away
+unwanted fields (binary data by default) and trims long arrays on the server,
+so wide documents are not shipped whole. Collections are extracted
+concurrently over the client's connection pool.
 """
 import os
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set, Tuple
 from langchain_core.documents import Document
 from .base import BaseDataSource
 
 try:
     from pymongo import MongoClient
-    from pymongo.errors import ConnectionFailure
+    from pymongo.errors import ConnectionFailure, PyMongoError
+    from bson import ObjectId
     PYMONGO_AVAILABLE = True
 except ImportError:
     PYMONGO_AVAILABLE = False
     print("[WARN] pymongo not installed. MongoDB support disabled.")
 
+# How documents are chosen from each collection
+SAMPLING_STRATEGIES = ('first', 'random')
+
+# Documents per cursor batch (round trip)
+DEFAULT_BATCH_SIZE = 1000
+
+# Collections extracted at once
+EXTRACT_WORKERS = int(os.environ.get('NOSQL_EXTRACT_WORKERS', '4'))
+
+# Array items shown in document text; longer arrays are trimmed on the server
+ARRAY_PREVIEW_ITEMS = 5
+
+# Key in projection/exclude_fields applying to every collection
+ALL_COLLECTIONS = "*"
+
+# Incremental sync: "last modified" field names, most preferred first
+WATERMARK_FIELDS = ('updated_at', 'updatedAt', 'modified_at', 'modifiedAt', 'last_modified', 'lastModified')
+SYNC_PAGE_DOCS = 1000
+
+
+def _encode_value(value: Any) -> Any:
+    """Resume point value as stored on the agent (JSON-safe)"""
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if PYMONGO_AVAILABLE and isinstance(value, ObjectId):
+        return {"type": "objectid", "value": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    """Inverse of _encode_value"""
+    if isinstance(value, dict) and "type" in value:
+        if value["type"] == "datetime":
+            return datetime.fromisoformat(value["value"])
+        return ObjectId(value["value"])
+    return value
+
 
 class NoSQLSource(BaseDataSource):
     """Extract documents from MongoDB databases"""
     
     def __init__(self, connection_string: str, database: str, 
-                 collections: Optional[List[str]] = None, sample_limit: int = 1000):
+                 collections: Optional[List[str]] = None, sample_limit: int = 1000,
+                 projection: Optional[Dict[str, List[str]]] = None,
+                 exclude_fields: Optional[Dict[str, List[str]]] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, sampling: str = 'first'):
         """
         Initialize NoSQL source with MongoDB connection.
         
@@ -29,11 +77,24 @@ class NoSQLSource(BaseDataSource):
             database: Database name to extract from
             collections: Optional list of specific collections. If None, extracts all.
             sample_limit: Maximum documents to extract per collection (default 1000)
+            projection: Optional collection -> fields to keep ("*" for every collection)
+            exclude_fields: Optional collection -> fields to drop ("*" for every collection)
+            batch_size: Documents fetched per cursor round trip
+            sampling: 'first' (natural order) or 'random' ($sample)
+        
+        Top-level binary fields are dropped unless listed in projection.
         """
+        if sampling not in SAMPLING_STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy '{sampling}'. Use one of: {', '.join(SAMPLING_STRATEGIES)}")
+        
         self.connection_string = connection_string
         self.database_name = database
         self.collections = collections
         self.sample_limit = sample_limit
+        self.projection = projection or {}
+        self.exclude_fields = exclude_fields or {}
+        self.batch_size = batch_size
+        self.sampling = sampling
         self.documents: List[Document] = []
         self.client: Optional[MongoClient] = None
         
@@ -71,26 +132,17 @@ class NoSQLSource(BaseDataSource):
         
         try:
             db = self.client[self.database_name]
-            collection_names = self.collections or db.list_collection_names()
+            # Skip system collections
+            collection_names = [name for name in (self.collections or db.list_collection_names())
+                                if not name.startswith('system.')]
             
-            for collection_name in collection_names:
-                # Skip system collections
-                if collection_name.startswith('system.'):
-                    continue
-                    
-                try:
-                    # Extract schema info from sample document
-                    schema_doc = self._extract_schema(db, collection_name)
-                    if schema_doc:
-                        all_documents.append(schema_doc)
-                    
-                    # Extract documents
-                    data_docs = self._extract_collection_data(db, collection_name)
-                    all_documents.extend(data_docs)
-                    print(f"[OK] Extracted {len(data_docs)} documents from collection '{collection_name}'")
-                    
-                except Exception as e:
-                    print(f"[ERROR] Failed to extract from collection '{collection_name}': {e}")
+            # MongoClient is thread-safe; each worker borrows a pooled connection
+            workers = max(1, min(EXTRACT_WORKERS, len(collection_names)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # map() keeps collection order
+                for collection_docs in executor.map(lambda name: self._extract_collection(db, name),
+                                                    collection_names):
+                    all_documents.extend(collection_docs)
                     
         except Exception as e:
             print(f"[ERROR] Failed to access database: {e}")
@@ -101,11 +153,32 @@ class NoSQLSource(BaseDataSource):
         self.documents = all_documents
         return all_documents
     
-    def _extract_schema(self, db, collection_name: str) -> Optional[Document]:
+    def _extract_collection(self, db, collection_name: str) -> List[Document]:
+        """Schema and data documents for one collection"""
+        documents = []
+        try:
+            # One sample document describes the schema and which fields are binary or arrays
+            sample = db[collection_name].find_one()
+            
+            # Extract schema info from sample document
+            schema_doc = self._extract_schema(db, collection_name, sample)
+            if schema_doc:
+                documents.append(schema_doc)
+            
+            # Extract documents
+            data_docs = self._extract_collection_data(db, collection_name, sample)
+            documents.extend(data_docs)
+            print(f"[OK] Extracted {len(data_docs)} documents from collection '{collection_name}'")
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to extract from collection '{collection_name}': {e}")
+        
+        return documents
+    
+    def _extract_schema(self, db, collection_name: str, sample: Optional[dict]) -> Optional[Document]:
         """Extract collection schema from sample document"""
         try:
             collection = db[collection_name]
-            sample = collection.find_one()
             
             if not sample:
                 return None
@@ -149,29 +222,72 @@ class NoSQLSource(BaseDataSource):
             print(f"[WARN] Could not extract schema for {collection_name}: {e}")
             return None
     
-    def _extract_collection_data(self, db, collection_name: str) -> List[Document]:
+    def _fields_for(self, setting: Dict[str, List[str]], collection_name: str) -> List[str]:
+        """Fields configured for a collection, plus those configured for every collection"""
+        return list(setting.get(ALL_COLLECTIONS, [])) + list(setting.get(collection_name, []))
+    
+    def _pipeline(self, collection_name: str, sample: Optional[dict]) -> Tuple[List[dict], Set[str]]:
+        """Aggregation pipeline for a collection's sampled data, and the array fields it trims"""
+        if self.sampling == 'random':
+            pipeline = [{"$sample": {"size": self.sample_limit}}]
+        else:
+            pipeline = [{"$limit": self.sample_limit}]
+        
+        stages, trimmed = self._shaping_stages(collection_name, sample)
+        return pipeline + stages, trimmed
+    
+    def _shaping_stages(self, collection_name: str, sample: Optional[dict],
+                        keep: Tuple[str, ...] = ()) -> Tuple[List[dict], Set[str]]:
+        """
+        Stages applying the field projection and trimming arrays, and the array
+        fields they trim. Trimmed arrays keep one item past the preview so the
+        text can still mark them as truncated. Fields in keep, and _id (which
+        identifies the document and its record key), are never dropped.
+        """
+        keep = ("_id",) + tuple(field for field in keep if field != "_id")
+        pipeline = []
+        include = self._fields_for(self.projection, collection_name)
+        exclude = set(self._fields_for(self.exclude_fields, collection_name)) - set(keep)
+        if include:
+            include = [field for field in include if field not in exclude] + [f for f in keep if f not in include]
+        elif sample:
+            # Binary blobs only become unreadable text
+            exclude.update(key for key, value in sample.items()
+                           if isinstance(value, (bytes, bytearray)) and key not in keep)
+        
+        trimmed = set()
+        if sample:
+            for key, value in sample.items():
+                # Dotted or $-prefixed names would be read as paths/operators by $addFields
+                if ('.' in key or key.startswith('$')):
+                    continue
+                if isinstance(value, list) and key not in exclude and (not include or key in include):
+                    trimmed.add(key)
+        if trimmed:
+            pipeline.append({"$addFields": {
+                key: {"$cond": [{"$isArray": f"${key}"}, {"$slice": [f"${key}", ARRAY_PREVIEW_ITEMS + 1]}, f"${key}"]}
+                for key in trimmed
+            }})
+        
+        if include:
+            pipeline.append({"$project": {field: 1 for field in include}})
+        elif exclude:
+            pipeline.append({"$project": {field: 0 for field in exclude}})
+        
+        return pipeline, trimmed
+    
+    def _extract_collection_data(self, db, collection_name: str, sample: Optional[dict] = None) -> List[Document]:
         """Extract documents from a MongoDB collection"""
         documents = []
         
         try:
             collection = db[collection_name]
-            cursor = collection.find().limit(self.sample_limit)
+            pipeline, trimmed = self._pipeline(collection_name, sample)
+            cursor = collection.aggregate(pipeline, batchSize=self.batch_size)
             
             for doc_num, mongo_doc in enumerate(cursor, start=1):
-                # Convert MongoDB document to readable text
-                content = self._document_to_text(mongo_doc, collection_name)
-                
-                if content:
-                    doc = Document(
-                        page_content=content,
-                        metadata={
-                            "source": collection_name,
-                            "source_type": "nosql",
-                            "collection_name": collection_name,
-                            "document_number": doc_num,
-                            "document_id": str(mongo_doc.get('_id', ''))
-                        }
-                    )
+                doc = self._data_document(mongo_doc, collection_name, doc_num, trimmed)
+                if doc:
                     documents.append(doc)
                     
         except Exception as e:
@@ -179,8 +295,214 @@ class NoSQLSource(BaseDataSource):
         
         return documents
     
-    def _document_to_text(self, mongo_doc: dict, collection_name: str) -> str:
-        """Convert MongoDB document to readable text format"""
+    def _data_document(self, mongo_doc: dict, collection_name: str, doc_num: int,
+                       trimmed: Set[str], record_key: bool = False) -> Optional[Document]:
+        """LangChain document for one MongoDB document (None if it has no text)"""
+        # Convert MongoDB document to readable text
+        content = self._document_to_text(mongo_doc, collection_name, trimmed)
+        if not content:
+            return None
+        
+        metadata = {
+            "source": collection_name,
+            "source_type": "nosql",
+            "collection_name": collection_name,
+            "document_number": doc_num,
+            "document_id": str(mongo_doc.get('_id', ''))
+        }
+        if record_key:
+            metadata["record_key"] = metadata["document_id"]
+        return Document(page_content=content, metadata=metadata)
+    
+    # ==================== INCREMENTAL SYNC ====================
+    
+    def extract_changes(self, resume_points: Dict[str, dict]) -> Tuple[List[Document], Dict[str, dict],
+                                                                       Dict[str, List[str]], List[str]]:
+        """
+        Extract only documents added or modified since each collection's resume point.
+        
+        Resume points, best first:
+            - change_stream: a change stream resume token (replica sets); also reports deletions
+            - watermark: an updated_at-style datetime field plus _id
+            - object_id: ObjectId _id order (new documents only)
+        The first sync of a collection reads all of it, paged by _id, after
+        opening a change stream so nothing written during the pass is missed.
+        
+        Returns the changed documents (each with a "record_key"), the new
+        resume points, deleted document ids per collection and the collections
+        that cannot be synced incrementally.
+        """
+        if not self._connect():
+            raise ConnectionError("Could not connect to MongoDB")
+        
+        documents = []
+        new_points = {}
+        deleted = {}
+        unsupported = []
+        try:
+            db = self.client[self.database_name]
+            collection_names = [name for name in (self.collections or db.list_collection_names())
+                                if not name.startswith('system.')]
+            
+            workers = max(1, min(EXTRACT_WORKERS, len(collection_names)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(lambda name: self._sync_collection(db, name, resume_points.get(name)),
+                                       collection_names)
+                for collection_name, (collection_docs, deleted_ids, point) in zip(collection_names, results):
+                    if point is None:
+                        unsupported.append(collection_name)
+                        continue
+                    documents.extend(collection_docs)
+                    new_points[collection_name] = point
+                    if deleted_ids:
+                        deleted[collection_name] = deleted_ids
+                    print(f"[OK] Synced {len(collection_docs)} changed documents from collection '{collection_name}'")
+        finally:
+            self.client.close()
+        
+        self.documents = documents
+        return documents, new_points, deleted, unsupported
+    
+    def _sync_collection(self, db, collection_name: str,
+                         point: Optional[dict]) -> Tuple[List[Document], List[str], Optional[dict]]:
+        """Changed documents, deleted ids and the new resume point of one collection (None: unsupported)"""
+        collection = db[collection_name]
+        sample = collection.find_one()
+        if sample is None:
+            # Nothing to index yet; the next sync starts with a full pass
+            return [], [], {"mode": "full"}
+        
+        watermark_field = next((field for field in WATERMARK_FIELDS if isinstance(sample.get(field), datetime)), None)
+        
+        if point and point.get("mode") == "change_stream":
+            try:
+                return self._sync_change_stream(collection, collection_name, sample, point)
+            except PyMongoError as e:
+                # e.g. the resume token fell off the oplog
+                print(f"[WARN] Change stream for '{collection_name}' unusable ({e}), running a full pass")
+                point = None
+        
+        if point and point.get("mode") == "watermark" and point.get("field") == watermark_field:
+            last = (_decode_value(point["value"]), _decode_value(point["key"]))
+            match = {"$or": [{watermark_field: {"$gt": last[0]}},
+                             {watermark_field: last[0], "_id": {"$gt": last[1]}}]}
+            docs, top = self._read_pages(collection, collection_name, sample, match,
+                                         (watermark_field, "_id"), watermark_field, last)
+            return docs, [], self._watermark_point(watermark_field, top)
+        
+        if point and point.get("mode") == "object_id" and watermark_field is None:
+            last_id = _decode_value(point["key"])
+            docs, top = self._read_pages(collection, collection_name, sample, {"_id": {"$gt": last_id}},
+                                         ("_id",), None, (None, last_id))
+            return docs, [], {"mode": "object_id", "key": _encode_value(top[1])}
+        
+        # First pass (or the resume point no longer applies)
+        token = self._current_resume_token(collection)
+        if token is None and watermark_field is None and not isinstance(sample.get("_id"), ObjectId):
+            return [], [], None
+        
+        docs, top = self._read_pages(collection, collection_name, sample, {}, ("_id",), watermark_field, (None, None))
+        if token is not None:
+            return docs, [], {"mode": "change_stream", "resume_token": token}
+        if watermark_field is not None:
+            return docs, [], self._watermark_point(watermark_field, top)
+        return docs, [], {"mode": "object_id", "key": _encode_value(top[1])}
+    
+    @staticmethod
+    def _watermark_point(field: str, top: Tuple[Any, Any]) -> dict:
+        if top[0] is None:
+            return {"mode": "full"}
+        return {"mode": "watermark", "field": field, "value": _encode_value(top[0]), "key": _encode_value(top[1])}
+    
+    def _read_pages(self, collection, collection_name: str, sample: dict, match: dict,
+                    sort_fields: Tuple[str, ...], watermark_field: Optional[str],
+                    top: Tuple[Any, Any]) -> Tuple[List[Document], Tuple[Any, Any]]:
+        """
+        Read matching documents with keyset pagination on sort_fields.
+        Returns the documents and the highest (watermark value, _id) seen, starting from top.
+        """
+        stages, trimmed = self._shaping_stages(collection_name, sample,
+                                               keep=(watermark_field,) if watermark_field else ())
+        documents = []
+        after: Optional[dict] = None
+        while True:
+            page_match = {"$and": [match, after]} if after else match
+            pipeline = [{"$match": page_match}, {"$sort": {field: 1 for field in sort_fields}},
+                        {"$limit": SYNC_PAGE_DOCS}] + stages
+            page = list(collection.aggregate(pipeline, batchSize=self.batch_size))
+            
+            for mongo_doc in page:
+                doc = self._data_document(mongo_doc, collection_name, len(documents) + 1, trimmed, record_key=True)
+                if doc:
+                    documents.append(doc)
+                
+                if watermark_field is None:
+                    if top[1] is None or mongo_doc["_id"] > top[1]:
+                        top = (None, mongo_doc["_id"])
+                else:
+                    value = mongo_doc.get(watermark_field)
+                    if isinstance(value, datetime) and (top[0] is None or (value, mongo_doc["_id"]) > top):
+                        top = (value, mongo_doc["_id"])
+            
+            if len(page) < SYNC_PAGE_DOCS:
+                return documents, top
+            last = page[-1]
+            if sort_fields == ("_id",):
+                after = {"_id": {"$gt": last["_id"]}}
+            else:
+                value = last.get(watermark_field)
+                after = {"$or": [{watermark_field: {"$gt": value}}, {watermark_field: value, "_id": {"$gt": last["_id"]}}]}
+    
+    def _current_resume_token(self, collection) -> Optional[dict]:
+        """A resume token for 'now', or None when change streams are unavailable (standalone server)"""
+        try:
+            with collection.watch(max_await_time_ms=100) as stream:
+                stream.try_next()
+                return stream.resume_token
+        except PyMongoError:
+            return None
+    
+    def _sync_change_stream(self, collection, collection_name: str, sample: dict,
+                            point: dict) -> Tuple[List[Document], List[str], dict]:
+        """Drain the change stream since the stored token, then fetch the changed documents"""
+        changed, deleted = set(), set()
+        with collection.watch(resume_after=point["resume_token"], max_await_time_ms=100) as stream:
+            while True:
+                change = stream.try_next()
+                if change is None:
+                    break
+                doc_id = change.get("documentKey", {}).get("_id")
+                if doc_id is None:
+                    continue
+                if change["operationType"] == "delete":
+                    deleted.add(doc_id)
+                    changed.discard(doc_id)
+                else:
+                    changed.add(doc_id)
+                    deleted.discard(doc_id)
+            token = stream.resume_token
+        
+        stages, trimmed = self._shaping_stages(collection_name, sample)
+        documents = []
+        found = set()
+        changed = list(changed)
+        for start in range(0, len(changed), SYNC_PAGE_DOCS):
+            batch = changed[start:start + SYNC_PAGE_DOCS]
+            for mongo_doc in collection.aggregate([{"$match": {"_id": {"$in": batch}}}] + stages,
+                                                  batchSize=self.batch_size):
+                found.add(mongo_doc["_id"])
+                doc = self._data_document(mongo_doc, collection_name, len(documents) + 1, trimmed, record_key=True)
+                if doc:
+                    documents.append(doc)
+        
+        # Changed then deleted before we looked
+        deleted.update(set(changed) - found)
+        return documents, [str(doc_id) for doc_id in deleted], {"mode": "change_stream", "resume_token": token}
+    
+    def _document_to_text(self, mongo_doc: dict, collection_name: str,
+                          trimmed: Optional[Set[str]] = None) -> str:
+        """Convert MongoDB document to readable text format (trimmed: arrays cut short on the server)"""
+        trimmed = trimmed or set()
         text_parts = [f"[{collection_name}]"]
         
         def format_value(key, value, indent=0):
@@ -197,12 +519,15 @@ class NoSQLSource(BaseDataSource):
             elif isinstance(value, list):
                 if not value:
                     return f"{prefix}{key}: []"
-                if len(value) <= 5:
+                if len(value) <= ARRAY_PREVIEW_ITEMS:
                     items = [str(v) for v in value]
                     return f"{prefix}{key}: [{', '.join(items)}]"
                 else:
-                    items = [str(v) for v in value[:5]]
-                    return f"{prefix}{key}: [{', '.join(items)}, ... +{len(value)-5} more]"
+                    items = [str(v) for v in value[:ARRAY_PREVIEW_ITEMS]]
+                    if indent == 0 and key in trimmed:
+                        # Only the first items were fetched, so the full length is unknown
+                        return f"{prefix}{key}: [{', '.join(items)}, ... more]"
+                    return f"{prefix}{key}: [{', '.join(items)}, ... +{len(value)-ARRAY_PREVIEW_ITEMS} more]"
             else:
                 return f"{prefix}{key}: {value}"
         
@@ -218,5 +543,7 @@ class NoSQLSource(BaseDataSource):
             "database": self.database_name,
             "collections": self.collections,
             "document_count": len(self.documents),
-            "sample_limit": self.sample_limit
+            "sample_limit": self.sample_limit,
+            "sampling": self.sampling,
+            "batch_size": self.batch_size
         }
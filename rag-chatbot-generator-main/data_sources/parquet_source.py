@@ -0,0 +1,268 @@
+"""
+Parquet / Arrow Data Source Connector
+Reads Parquet, Feather and Arrow IPC files for RAG training.
+
+Files are read in record batches (memory-mapped where the format allows)
+and every batch is rendered to "col: value" row text with vectorized
+string kernels (see columnar.py). Rows never become Python dicts; batches
+are grouped into documents of about one chunk, like CSVSource's batched mode.
+"""
+import os
+import time
+from typing import List, Dict, Any, Optional, Callable, Iterator
+from langchain_core.documents import Document
+from .base import BaseDataSource
+from .columnar import PYARROW_AVAILABLE, render_rows
+
+if PYARROW_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+# Approximate characters per token when no tokenizer is given
+CHARS_PER_TOKEN = 4
+
+# Rows per record batch read from a file
+BATCH_ROWS = 65536
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc', '.arrows')
+SUPPORTED_EXTENSIONS = PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+# Separator between rows grouped into one document
+ROW_SEPARATOR = "\n\n"
+
+
+class ParquetSource(BaseDataSource):
+    """Extract documents from Parquet, Feather and Arrow IPC files"""
+
+    def __init__(self, file_paths: List[str], rows_per_document: Optional[int] = None,
+                 max_tokens_per_document: Optional[int] = None, encoding: Any = None,
+                 columns: Optional[List[str]] = None, batch_rows: int = BATCH_ROWS,
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Initialize the source with file paths.
+
+        Args:
+            file_paths: Paths to .parquet, .feather or .arrow files
+            rows_per_document: Batched mode - group up to this many rows per document
+            max_tokens_per_document: Batched mode - group rows up to this token budget
+            encoding: Optional tiktoken encoding for the token budget (estimated from length otherwise)
+            columns: Only read these columns (default: all)
+            batch_rows: Rows per record batch read from a file
+            progress_callback: Optional callable receiving {"rows_processed", "rows_per_sec"} updates
+
+        Without rows_per_document or max_tokens_per_document every row becomes
+        its own document.
+        """
+        self.file_paths = file_paths
+        self.rows_per_document = rows_per_document
+        self.max_tokens_per_document = max_tokens_per_document
+        self.encoding = encoding
+        self.columns = columns
+        self.batch_rows = max(1, batch_rows)
+        self.progress_callback = progress_callback
+        self.documents: List[Document] = []
+        self.rows_processed = 0
+        self._started_at = time.time()
+        self._callback_error: Optional[BaseException] = None
+
+    @property
+    def batched(self) -> bool:
+        return bool(self.rows_per_document or self.max_tokens_per_document)
+
+    def get_source_type(self) -> str:
+        return "parquet"
+
+    def extract_documents(self) -> List[Document]:
+        """
+        Extract documents from all files.
+        Each row (or, in batched mode, each group of rows) becomes a document.
+        """
+        all_documents = []
+
+        for file_path, docs in self._file_documents():
+            all_documents.extend(docs)
+            print(f"[OK] Extracted {len(docs)} documents from {os.path.basename(file_path)}")
+
+        self.documents = all_documents
+        return all_documents
+
+    def iter_documents(self) -> Iterator[Document]:
+        """
+        Yield documents as record batches are read, without holding a whole file.
+        A file that fails part-way keeps the documents already yielded.
+        """
+        for file_path, docs in self._file_documents(lazy=True):
+            count = 0
+            try:
+                for doc in docs:
+                    count += 1
+                    yield doc
+            except Exception as e:
+                if self._callback_error is not None:
+                    raise
+                print(f"[ERROR] Failed to process {file_path}: {e}")
+                continue
+            print(f"[OK] Extracted {count} documents from {os.path.basename(file_path)}")
+
+    def _file_documents(self, lazy: bool = False):
+        """Yield (file_path, documents) per readable file; documents is a generator when lazy"""
+        if not PYARROW_AVAILABLE:
+            print("[ERROR] pyarrow not installed. Run: pip install pyarrow")
+            return
+
+        self._started_at = time.time()
+
+        for file_path in self.file_paths:
+            if not os.path.exists(file_path):
+                print(f"[WARN] Columnar file not found: {file_path}")
+                continue
+
+            if not file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+                print(f"[WARN] Not a Parquet/Arrow file: {file_path}")
+                continue
+
+            documents = self._process_file(file_path)
+            if lazy:
+                yield file_path, documents
+                continue
+
+            try:
+                docs = list(documents)
+            except Exception as e:
+                # An error from the progress callback (e.g. a cancelled job) stops extraction
+                if self._callback_error is not None:
+                    raise
+                print(f"[ERROR] Failed to process {file_path}: {e}")
+                continue
+            yield file_path, docs
+
+    def _record_batches(self, file_path: str) -> Iterator['pa.RecordBatch']:
+        """Record batches of at most batch_rows rows, read through a memory map"""
+        if file_path.lower().endswith(PARQUET_EXTENSIONS):
+            parquet_file = pq.ParquetFile(file_path, memory_map=True)
+            yield from parquet_file.iter_batches(batch_size=self.batch_rows, columns=self.columns)
+            return
+
+        with pa.memory_map(file_path, 'r') as source:
+            # Feather v2 / Arrow IPC file format, falling back to the IPC stream format
+            try:
+                reader = pa.ipc.open_file(source)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            except pa.ArrowInvalid:
+                source.seek(0)
+                batches = iter(pa.ipc.open_stream(source))
+
+            for batch in batches:
+                if self.columns:
+                    batch = batch.select(self.columns)
+                # Zero-copy slices keep rendering memory bounded for large written batches
+                for offset in range(0, batch.num_rows, self.batch_rows):
+                    yield batch.slice(offset, self.batch_rows)
+
+    def _process_file(self, file_path: str) -> Iterator[Document]:
+        """Render a file batch by batch into documents"""
+        filename = os.path.basename(file_path)
+        first_row = 1
+
+        for batch in self._record_batches(file_path):
+            texts = render_rows(batch)
+            columns = batch.schema.names
+
+            if self.batched:
+                yield from self._batch_documents(texts, first_row, filename, columns)
+            else:
+                for index, text in enumerate(texts.to_pylist()):
+                    if text:
+                        yield self._make_document(text, filename, columns, row_number=first_row + index)
+
+            first_row += batch.num_rows
+            self.rows_processed += batch.num_rows
+            self._report_progress()
+
+    def _batch_documents(self, texts: 'pa.Array', first_row: int, filename: str,
+                         columns: List[str]) -> Iterator[Document]:
+        """
+        Group one record batch's rows into documents. A document ends at
+        rows_per_document rows or when the next row would exceed
+        max_tokens_per_document. Groups do not span record batches.
+        """
+        rows = texts.to_pylist()
+        row_tokens = self._count_tokens(texts, rows) if self.max_tokens_per_document else None
+
+        start = None
+        count = tokens = 0
+
+        for index, text in enumerate(rows):
+            if not text:
+                continue
+
+            # +1 for the separator joining it to the group
+            text_tokens = row_tokens[index] + 1 if row_tokens is not None else 0
+
+            if count and (
+                (self.rows_per_document and count >= self.rows_per_document) or
+                (self.max_tokens_per_document and tokens + text_tokens > self.max_tokens_per_document)
+            ):
+                yield self._group_document(rows, start, index, first_row, filename, columns)
+                start = None
+                count = tokens = 0
+
+            if start is None:
+                start = index
+            count += 1
+            tokens += text_tokens
+
+        if count:
+            yield self._group_document(rows, start, len(rows), first_row, filename, columns)
+
+    def _group_document(self, rows: List[str], start: int, end: int, first_row: int,
+                        filename: str, columns: List[str]) -> Document:
+        """Document for rows[start:end]; blank rows in between are skipped"""
+        group = [text for text in rows[start:end] if text]
+        last = end - 1
+        while not rows[last]:
+            last -= 1
+        return self._make_document(ROW_SEPARATOR.join(group), filename, columns,
+                                   row_start=first_row + start, row_end=first_row + last)
+
+    def _make_document(self, text: str, filename: str, columns: List[str], **rows) -> Document:
+        metadata = {
+            "source": filename,
+            "source_type": "parquet",
+            "columns": columns
+        }
+        metadata.update(rows)
+        return Document(page_content=text, metadata=metadata)
+
+    def _count_tokens(self, texts: 'pa.Array', rows: List[str]) -> List[int]:
+        """Token count per rendered row"""
+        if self.encoding is not None:
+            return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(rows)]
+        estimate = pc.add(pc.divide(pc.utf8_length(texts), CHARS_PER_TOKEN), 1)
+        return estimate.to_pylist()
+
+    def _report_progress(self):
+        if self.progress_callback is None:
+            return
+        elapsed = time.time() - self._started_at
+        try:
+            self.progress_callback({
+                "rows_processed": self.rows_processed,
+                "rows_per_sec": round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+            })
+        except BaseException as e:
+            self._callback_error = e
+            raise
+
+    def get_metadata(self) -> Dict[str, Any]:
+        """Return metadata about the Parquet/Arrow source"""
+        return {
+            "source_type": "parquet",
+            "file_count": len(self.file_paths),
+            "document_count": len(self.documents),
+            "rows_processed": self.rows_processed,
+            "batched": self.batched,
+            "files": [os.path.basename(f) for f in self.file_paths]
+        }
@@ -1,150 +1,220 @@
 """
 Word Document Data Source Connector
 Extracts text from .docx files for RAG training.
+
+Each file becomes a sequence of structural units (headings, paragraphs and
+tables, in document order) that go straight to the shared chunking stage;
+nothing is pre-chunked here. Several files are parsed in a pool of
+spawned (not forked) processes.
 """
 import os
-from typing import List, Dict, Any
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.documents import Document
 from .base import BaseDataSource
 
 try:
     from docx import Document as DocxDocument
     from docx.table import Table
+    from docx.text.paragraph import Paragraph
     DOCX_AVAILABLE = True
 except ImportError:
     DOCX_AVAILABLE = False
     print("[WARN] python-docx not installed. Word document support disabled.")
 
+# Processes used when more than one file is extracted
+PARSE_WORKERS = int(os.environ.get('WORD_PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Chunking the connector used to apply before the shared splitter (see legacy_duplicated_chars)
+LEGACY_CHUNK_SIZE = 1500
+LEGACY_CHUNK_OVERLAP = 200
+
+
+def _heading_level(paragraph: 'Paragraph') -> Optional[int]:
+    """Outline level of a heading paragraph (Title is 0), None for body text"""
+    style_name = paragraph.style.name if paragraph.style is not None else ""
+    if style_name == "Title":
+        return 0
+    if style_name.startswith("Heading"):
+        level = style_name[len("Heading"):].strip()
+        return int(level) if level.isdigit() else 1
+    return None
+
+
+def _table_text(table: 'Table') -> str:
+    """Extract text from a Word table, one ' | '-joined line per row"""
+    rows_text = []
+    
+    for row in table.rows:
+        cells = [cell.text.strip() for cell in row.cells]
+        if any(cells):
+            rows_text.append(" | ".join(cells))
+    
+    return "\n".join(rows_text)
+
+
+def extract_units(file_path: str) -> List[Document]:
+    """
+    Parse one .docx file into structural units in document order.
+    Every unit carries the heading path it belongs to as "section".
+    Module-level so it can run in a worker process.
+    """
+    filename = os.path.basename(file_path)
+    doc = DocxDocument(file_path)
+    
+    units = []
+    headings: List[Tuple[int, str]] = []
+    table_count = 0
+    
+    def add(text: str, unit_type: str, **extra):
+        metadata = {
+            "source": filename,
+            "source_type": "word",
+            "unit_type": unit_type,
+            "unit_index": len(units),
+            "section": " > ".join(title for _, title in headings)
+        }
+        metadata.update(extra)
+        units.append(Document(page_content=text, metadata=metadata))
+    
+    # Body children in order, so tables stay next to the text that introduces them
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        
+        if tag == 'p':
+            paragraph = Paragraph(child, doc)
+            text = paragraph.text.strip()
+            if not text:
+                continue
+            
+            level = _heading_level(paragraph)
+            if level is not None:
+                # A heading closes every section at its level or deeper
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, text))
+                add(text, "heading", heading_level=level)
+            else:
+                add(text, "paragraph")
+        
+        elif tag == 'tbl':
+            table_count += 1
+            text = _table_text(Table(child, doc))
+            if text:
+                add(f"[Table {table_count}]\n{text}", "table", table_index=table_count)
+    
+    return units
+
+
+def legacy_duplicated_chars(text: str, chunk_size: int = LEGACY_CHUNK_SIZE,
+                            overlap: int = LEGACY_CHUNK_OVERLAP) -> int:
+    """
+    Characters the old 1500/200 pre-chunking would have repeated in its
+    overlaps (and then embedded twice). Walks the same cut points without
+    building the chunks.
+    """
+    length = len(text)
+    if length <= chunk_size:
+        return 0
+    
+    duplicated = 0
+    start = 0
+    while start < length:
+        end = start + chunk_size
+        if end < length:
+            for delim in ['. ', '.\n', '\n\n', '\n']:
+                last_delim = text.rfind(delim, start + chunk_size // 2, end)
+                if last_delim != -1:
+                    end = last_delim + len(delim)
+                    break
+        
+        next_start = end - overlap
+        if next_start >= length:
+            break
+        duplicated += min(end, length) - next_start
+        start = next_start
+    
+    return duplicated
+
 
 class WordSource(BaseDataSource):
     """Extract documents from Word (.docx) files"""
     
-    def __init__(self, file_paths: List[str]):
+    def __init__(self, file_paths: List[str], workers: int = PARSE_WORKERS):
         """
         Initialize Word source with file paths.
         
         Args:
             file_paths: List of paths to .docx files
+            workers: Processes used to parse several files (1 parses them in this process)
         """
         self.file_paths = file_paths
+        self.workers = max(1, workers)
         self.documents: List[Document] = []
-        
+        self.duplicated_chars_avoided = 0
+    
     def get_source_type(self) -> str:
         return "word"
     
     def extract_documents(self) -> List[Document]:
         """
         Extract documents from Word files.
-        Preserves paragraph structure and extracts tables as text.
+        Returns one document per heading, paragraph or table, in file order.
         """
         if not DOCX_AVAILABLE:
             print("[ERROR] python-docx not installed. Run: pip install python-docx")
             return []
-            
-        all_documents = []
         
+        file_paths = []
         for file_path in self.file_paths:
             if not os.path.exists(file_path):
                 print(f"[WARN] Word file not found: {file_path}")
                 continue
-                
+            
             if not file_path.lower().endswith('.docx'):
                 print(f"[WARN] Not a .docx file: {file_path}")
                 continue
-                
-            try:
-                docs = self._process_word_file(file_path)
-                all_documents.extend(docs)
-                print(f"[OK] Extracted {len(docs)} documents from {os.path.basename(file_path)}")
-            except Exception as e:
-                print(f"[ERROR] Failed to process {file_path}: {e}")
-                
-        self.documents = all_documents
-        return all_documents
-    
-    def _process_word_file(self, file_path: str) -> List[Document]:
-        """Process a single Word file into documents"""
-        documents = []
-        filename = os.path.basename(file_path)
-        
-        doc = DocxDocument(file_path)
-        
-        # Extract all text content
-        full_text = []
-        
-        # Process paragraphs
-        for para in doc.paragraphs:
-            text = para.text.strip()
-            if text:
-                full_text.append(text)
+            
+            file_paths.append(file_path)
         
-        # Process tables
-        for table_idx, table in enumerate(doc.tables):
-            table_text = self._extract_table_text(table)
-            if table_text:
-                full_text.append(f"\n[Table {table_idx + 1}]\n{table_text}")
+        all_documents = []
+        self.duplicated_chars_avoided = 0
         
-        # Combine into single document or split by sections
-        if full_text:
-            content = "\n\n".join(full_text)
-            
-            # Split into chunks if document is large
-            chunks = self._split_into_chunks(content, chunk_size=1500, overlap=200)
+        for file_path, docs, error in self._parse_files(file_paths):
+            if error is not None:
+                print(f"[ERROR] Failed to process {file_path}: {error}")
+                continue
             
-            for chunk_idx, chunk in enumerate(chunks):
-                doc_obj = Document(
-                    page_content=chunk,
-                    metadata={
-                        "source": filename,
-                        "source_type": "word",
-                        "chunk_index": chunk_idx,
-                        "total_chunks": len(chunks)
-                    }
-                )
-                documents.append(doc_obj)
+            all_documents.extend(docs)
+            self.duplicated_chars_avoided += legacy_duplicated_chars("\n\n".join(d.page_content for d in docs))
+            print(f"[OK] Extracted {len(docs)} documents from {os.path.basename(file_path)}")
         
-        return documents
-    
-    def _extract_table_text(self, table: 'Table') -> str:
-        """Extract text from a Word table"""
-        rows_text = []
-        
-        for row in table.rows:
-            cells = [cell.text.strip() for cell in row.cells]
-            if any(cells):
-                rows_text.append(" | ".join(cells))
+        if self.duplicated_chars_avoided:
+            print(f"[INFO] Word extraction avoided {self.duplicated_chars_avoided} duplicated overlap characters")
         
-        return "\n".join(rows_text)
+        self.documents = all_documents
+        return all_documents
     
-    def _split_into_chunks(self, text: str, chunk_size: int = 1500, overlap: int = 200) -> List[str]:
-        """Split text into overlapping chunks"""
-        if len(text) <= chunk_size:
-            return [text]
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            
-            # Try to break at sentence boundary
-            if end < len(text):
-                # Look for sentence end near chunk boundary
-                for delim in ['. ', '.\n', '\n\n', '\n']:
-                    last_delim = text.rfind(delim, start + chunk_size // 2, end)
-                    if last_delim != -1:
-                        end = last_delim + len(delim)
-                        break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            start = end - overlap
-            if start >= len(text):
-                break
+    def _parse_files(self, file_paths: List[str]):
+        """Yield (file_path, units, error) in input order, parsing in a process pool when worthwhile"""
+        workers = min(self.workers, len(file_paths))
+        if workers <= 1:
+            for file_path in file_paths:
+                try:
+                    yield file_path, extract_units(file_path), None
+                except Exception as e:
+                    yield file_path, None, e
+            return
         
-        return chunks
+        # Spawned workers: forking a threaded server can copy a held lock into the child
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(extract_units, file_path) for file_path in file_paths]
+            for file_path, future in zip(file_paths, futures):
+                try:
+                    yield file_path, future.result(), None
+                except Exception as e:
+                    yield file_path, None, e
     
     def get_metadata(self) -> Dict[str, Any]:
         """Return metadata about the Word source"""
@@ -152,5 +222,6 @@ class WordSource(BaseDataSource):
             "source_type": "word",
             "file_count": len(self.file_paths),
             "document_count": len(self.documents),
+            "duplicated_chars_avoided": self.duplicated_chars_avoided,
             "files": [os.path.basename(f) for f in self.file_paths]
         }
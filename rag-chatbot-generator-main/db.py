@@ -69,6 +69,14 @@ def get_embed_tokens_collection():
     return db['embed_tokens']
 
 
+def get_jobs_collection():
+    """Get ingestion jobs collection (agent create/update progress)"""
+    db = get_database()
+    if db is None:
+        return None
+    return db['ingestion_jobs']
+
+
 def close_connection():
     """Close MongoDB connection"""
     global _client, _db
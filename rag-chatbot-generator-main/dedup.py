@@ -0,0 +1,207 @@
+"""
+Chunk Deduplication
+Drops repeated chunks before they are embedded. Exact duplicates are found
+by a hash of the whitespace-normalized text; near-duplicates optionally
+with MinHash (Jaccard similarity of word shingles) or SimHash (Hamming
+distance of 64-bit fingerprints). Both near-duplicate methods bucket
+fingerprints with LSH so a chunk is only compared with likely matches.
+
+The first chunk of every duplicate set is kept. Chunks are only compared
+within their group (the agent source they belong to, plus their table or
+collection), so removing one source never takes away content another
+source still needs.
+"""
+import hashlib
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEDUP_MODES = ('off', 'exact', 'minhash', 'simhash')
+
+# SimHash distances run small on short chunks, so it needs a stricter
+# threshold; 0.95 is the usual 3-bit distance for 64-bit fingerprints
+DEFAULT_THRESHOLDS = {'minhash': 0.9, 'simhash': 0.95}
+
+# MinHash: words per shingle and number of hash permutations
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 128
+_MINHASH_PRIME = (1 << 31) - 1
+_MINHASH_SEED = 1
+
+# SimHash fingerprints are 64 bits; the LSH blocks need at least 4 bits each
+SIMHASH_BITS = 64
+SIMHASH_MAX_DISTANCE = 15
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Collapse whitespace so formatting differences do not hide duplicates"""
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode('utf-8')).hexdigest()
+
+
+def shingles(text: str) -> Dict[str, int]:
+    """Word shingles (SHINGLE_WORDS consecutive words) of a text with their counts"""
+    words = _WORD_PATTERN.findall(text.lower())
+    counts: Dict[str, int] = defaultdict(int)
+    if len(words) <= SHINGLE_WORDS:
+        counts[" ".join(words)] += 1
+        return counts
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        counts[" ".join(words[i:i + SHINGLE_WORDS])] += 1
+    return counts
+
+
+# ==================== MINHASH ====================
+
+_permutations = np.random.RandomState(_MINHASH_SEED).randint(
+    1, _MINHASH_PRIME, size=(2, MINHASH_PERMUTATIONS)
+).astype(np.uint64)
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash signature over the text's word shingles"""
+    features = shingles(text)
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) % _MINHASH_PRIME for s in features),
+                         dtype=np.uint64, count=len(features))
+    a, b = _permutations
+    # (a * h + b) mod p stays below 2**62, so uint64 never overflows
+    return ((a[:, None] * hashes[None, :] + b[:, None]) % _MINHASH_PRIME).min(axis=1)
+
+
+def minhash_bands(threshold: float, permutations: int = MINHASH_PERMUTATIONS) -> Tuple[int, int]:
+    """
+    (bands, rows per band) whose LSH threshold (1/b)^(1/r) is closest to,
+    and not above, the similarity threshold.
+    """
+    best = (permutations, 1)
+    best_gap = None
+    for rows in range(1, permutations + 1):
+        if permutations % rows:
+            continue
+        bands = permutations // rows
+        lsh_threshold = (1.0 / bands) ** (1.0 / rows)
+        if lsh_threshold > threshold:
+            continue
+        gap = threshold - lsh_threshold
+        if best_gap is None or gap < best_gap:
+            best, best_gap = (bands, rows), gap
+    return best
+
+
+# ==================== SIMHASH ====================
+
+def simhash(text: str) -> int:
+    """64-bit SimHash fingerprint over word shingles, weighted by count"""
+    counts = shingles(text)
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little')
+                       for s in counts], dtype=np.uint64)
+    weights = np.array(list(counts.values()), dtype=np.int64)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little').astype(np.int64)
+    totals = (weights[:, None] * (2 * bits - 1)).sum(axis=0)
+
+    fingerprint = 0
+    for bit in np.flatnonzero(totals > 0):
+        fingerprint |= 1 << int(bit)
+    return fingerprint
+
+
+def simhash_distance(threshold: float) -> int:
+    """Largest Hamming distance counted as a near-duplicate at this similarity"""
+    return max(0, min(SIMHASH_MAX_DISTANCE, int((1.0 - threshold) * SIMHASH_BITS)))
+
+
+def _simhash_blocks(fingerprint: int, blocks: int) -> List[int]:
+    """Split a fingerprint into `blocks` bit ranges. Two fingerprints within
+    blocks - 1 bits of each other share at least one block (pigeonhole)."""
+    width = SIMHASH_BITS // blocks
+    values = []
+    for index in range(blocks):
+        start = index * width
+        end = SIMHASH_BITS if index == blocks - 1 else start + width
+        values.append((fingerprint >> start) & ((1 << (end - start)) - 1))
+    return values
+
+
+# ==================== DEDUPLICATION ====================
+
+def deduplicate(texts: Sequence[str], groups: Optional[Sequence[Hashable]] = None,
+                mode: str = 'exact', threshold: Optional[float] = None) -> Tuple[List[int], Dict[str, int]]:
+    """
+    Indices of the texts to keep, in order, and the number of chunks collapsed.
+
+    Args:
+        texts: Chunk texts
+        groups: Group of each text; texts are only compared within a group
+        mode: 'off', 'exact', or 'minhash'/'simhash' (exact plus near-duplicates)
+        threshold: Similarity at or above which two chunks are near-duplicates
+                   (estimated Jaccard for MinHash, 1 - distance/64 for SimHash);
+                   defaults to DEFAULT_THRESHOLDS[mode]
+
+    Returns (kept indices, {"exact_duplicates": n, "near_duplicates": m}).
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode '{mode}'. Use one of: {', '.join(DEDUP_MODES)}")
+
+    stats = {"exact_duplicates": 0, "near_duplicates": 0}
+    if mode == 'off':
+        return list(range(len(texts))), stats
+
+    if groups is None:
+        groups = [None] * len(texts)
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLDS.get(mode, 1.0)
+
+    seen_hashes = set()
+    buckets: Dict[tuple, List[int]] = defaultdict(list)
+    fingerprints: Dict[int, object] = {}
+    kept = []
+
+    if mode == 'minhash':
+        bands, rows = minhash_bands(threshold)
+    elif mode == 'simhash':
+        max_distance = simhash_distance(threshold)
+
+    for index, (text, group) in enumerate(zip(texts, groups)):
+        digest = (group, content_hash(text))
+        if digest in seen_hashes:
+            stats["exact_duplicates"] += 1
+            continue
+        seen_hashes.add(digest)
+
+        if mode == 'minhash':
+            signature = minhash_signature(text)
+            keys = [(group, band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+            def similar(other: int) -> bool:
+                return float(np.mean(fingerprints[other] == signature)) >= threshold
+        elif mode == 'simhash':
+            signature = simhash(text)
+            keys = [(group, block, value) for block, value in
+                    enumerate(_simhash_blocks(signature, max_distance + 1))]
+
+            def similar(other: int) -> bool:
+                return bin(fingerprints[other] ^ signature).count('1') <= max_distance
+        else:
+            kept.append(index)
+            continue
+
+        # Compare only with kept chunks that share an LSH bucket
+        candidates = {other for key in keys for other in buckets.get(key, ())}
+        if any(similar(other) for other in sorted(candidates)):
+            stats["near_duplicates"] += 1
+            continue
+
+        fingerprints[index] = signature
+        for key in keys:
+            buckets[key].append(index)
+        kept.append(index)
+
+    return kept, stats
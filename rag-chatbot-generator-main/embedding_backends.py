@@ -0,0 +1,243 @@
+"""
+Embedding Backends
+Interchangeable embedding implementations behind LangChain's Embeddings
+interface, so vector stores, the embedding cache and the dispatcher work
+with any of them:
+
+- ollama: the Ollama HTTP API (the original and default backend)
+- onnx:   an in-process ONNX Runtime session on the CPU, loading a local
+          sentence-embedding model file; no network round trip per query
+- hash:   deterministic feature hashing with no model at all, for tests
+          and benchmarks
+
+The backend and model an agent was indexed with are recorded on the agent
+(see spec()), so queries are always embedded the same way as its chunks.
+"""
+import os
+import hashlib
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    from langchain_ollama import OllamaEmbeddings
+    OLLAMA_AVAILABLE = True
+except ImportError:
+    OLLAMA_AVAILABLE = False
+    print("[WARN] langchain-ollama not installed. Ollama embedding backend disabled.")
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+EMBEDDING_BACKENDS = ('ollama', 'onnx', 'hash')
+
+# Backend and model for new agents
+DEFAULT_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'ollama')
+DEFAULT_MODELS = {
+    'ollama': 'mxbai-embed-large',
+    'onnx': os.environ.get('ONNX_EMBEDDING_MODEL', ''),
+    'hash': 'hash-384'
+}
+DEFAULT_MODEL = os.environ.get('EMBEDDING_MODEL', DEFAULT_MODELS.get(DEFAULT_BACKEND, ''))
+
+# What agents created before the backend was recorded were indexed with
+LEGACY_SPEC = {"backend": "ollama", "model": "mxbai-embed-large", "dimension": 1024}
+
+# Input window in tokens of common Ollama embedding models (tag suffixes are
+# ignored); chunks are sized to fit. Unknown models get DEFAULT_CONTEXT_WINDOW.
+MODEL_CONTEXT_WINDOWS = {
+    'mxbai-embed-large': 512,
+    'nomic-embed-text': 2048,
+    'all-minilm': 256,
+    'snowflake-arctic-embed': 512,
+    'bge-m3': 8192,
+    'bge-large': 512
+}
+DEFAULT_CONTEXT_WINDOW = 512
+
+# Models trained with Matryoshka representation learning: a prefix of their
+# vector is itself a usable embedding, so stored vectors may be truncated
+MATRYOSHKA_MODELS = ('mxbai-embed-large', 'nomic-embed-text', 'snowflake-arctic-embed2')
+
+# ONNX: texts per inference call and the model's input length
+ONNX_BATCH_SIZE = 32
+ONNX_MAX_LENGTH = 512
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class EmbeddingBackend(Embeddings):
+    """Base class: an Embeddings implementation that can describe itself"""
+
+    backend = ""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def cache_key(self) -> str:
+        """Model name used for embedding cache keys"""
+        return f"{self.backend}:{self.model}"
+
+    @property
+    def context_window(self) -> int:
+        """Longest input in tokens the model embeds without truncating"""
+        return MODEL_CONTEXT_WINDOWS.get(self.model.split(':')[0], DEFAULT_CONTEXT_WINDOW)
+
+    @property
+    def matryoshka(self) -> bool:
+        """Whether leading dimensions of the model's vectors can stand alone"""
+        return self.model.split(':')[0] in MATRYOSHKA_MODELS
+
+    def spec(self) -> Dict[str, Any]:
+        """Stored on the agent to rebuild the same backend at query time"""
+        return {"backend": self.backend, "model": self.model}
+
+
+class OllamaBackend(EmbeddingBackend):
+    """Embeddings from an Ollama server"""
+
+    backend = "ollama"
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        if not OLLAMA_AVAILABLE:
+            raise ValueError("langchain-ollama not installed. Run: pip install langchain-ollama")
+        self.client = OllamaEmbeddings(model=model)
+
+    @property
+    def cache_key(self) -> str:
+        # Plain model name, as cached before backends existed
+        return self.model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed_query(text)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    In-process CPU embeddings from an ONNX sentence-embedding model.
+
+    model is the path of a .onnx file, or of a directory holding model.onnx;
+    tokenizer.json (Hugging Face tokenizers format) must sit next to it.
+    Token embeddings are mean-pooled over the attention mask and
+    L2-normalized, as sentence-transformers models expect.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model: str, batch_size: int = ONNX_BATCH_SIZE, max_length: int = ONNX_MAX_LENGTH):
+        super().__init__(model)
+        if not ONNX_AVAILABLE:
+            raise ValueError("onnxruntime and tokenizers not installed. Run: pip install onnxruntime tokenizers")
+        if not model:
+            raise ValueError("The onnx backend needs a model path (set ONNX_EMBEDDING_MODEL)")
+
+        model_file = os.path.join(model, "model.onnx") if os.path.isdir(model) else model
+        tokenizer_file = os.path.join(os.path.dirname(model_file), "tokenizer.json")
+        if not os.path.exists(model_file) or not os.path.exists(tokenizer_file):
+            raise ValueError(f"ONNX model needs {model_file} and {tokenizer_file}")
+
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.session = onnxruntime.InferenceSession(model_file, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+    @property
+    def context_window(self) -> int:
+        return self.max_length
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            output = self.session.run(None, {name: value for name, value in feeds.items()
+                                             if name in self.input_names})[0]
+
+            # (batch, tokens, dim) token embeddings are mean-pooled; (batch, dim) is already pooled
+            if output.ndim == 3:
+                mask = attention_mask[:, :, None].astype(output.dtype)
+                output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+            norms = np.linalg.norm(output, axis=1, keepdims=True)
+            vectors.extend((output / np.maximum(norms, 1e-12)).astype(np.float32).tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+
+class HashBackend(EmbeddingBackend):
+    """
+    Deterministic signed feature hashing of words and word pairs into a
+    fixed number of dimensions. Not semantic, but stable across processes
+    and free to compute, which is what tests and benchmarks need.
+    The model name encodes the dimension, e.g. "hash-384".
+    """
+
+    backend = "hash"
+
+    def __init__(self, model: str = "hash-384"):
+        super().__init__(model)
+        _, _, size = model.rpartition('-')
+        if not size.isdigit() or int(size) <= 0:
+            raise ValueError(f"Hash model must look like 'hash-<dimension>', got '{model}'")
+        self.dimension = int(size)
+
+    def _embed(self, text: str) -> List[float]:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            value = int.from_bytes(digest, 'little')
+            vector[value % self.dimension] += 1.0 if value >> 63 else -1.0
+
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+_BACKEND_CLASSES = {
+    'ollama': OllamaBackend,
+    'onnx': OnnxBackend,
+    'hash': HashBackend
+}
+
+
+def create_backend(backend: str, model: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Build an embedding backend. model defaults to the backend's default model.
+    Raises ValueError for an unknown backend or one that cannot be loaded.
+    """
+    if backend not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Use one of: {', '.join(EMBEDDING_BACKENDS)}")
+    return _BACKEND_CLASSES[backend](model or DEFAULT_MODELS[backend])
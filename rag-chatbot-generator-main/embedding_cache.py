@@ -0,0 +1,262 @@
+"""
+Embedding Cache
+Persistent, content-addressed cache of chunk embeddings backed by SQLite.
+Identical chunks (re-uploads, shared handbooks, re-created agents) are
+embedded once and served from disk afterwards.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Optional, Any
+
+from langchain_core.embeddings import Embeddings
+
+# Default cache size limit (MB), can be overridden per deployment
+DEFAULT_MAX_SIZE_MB = int(os.environ.get('EMBEDDING_CACHE_MAX_MB', '1024'))
+
+# After eviction the cache is trimmed down to this fraction of the limit
+EVICTION_LOW_WATERMARK = 0.9
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """Content hash used as cache key: sha256(model, text)"""
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _encode_vector(vector: List[float]) -> bytes:
+    """Pack a vector as float32 bytes"""
+    return array('f', vector).tobytes()
+
+
+def _decode_vector(blob: bytes) -> List[float]:
+    """Unpack float32 bytes into a list of floats"""
+    values = array('f')
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by sha256(model, text) with size-based LRU eviction"""
+
+    def __init__(self, db_path: str, max_size_mb: int = DEFAULT_MAX_SIZE_MB):
+        """
+        Initialize the cache.
+
+        Args:
+            db_path: Path of the SQLite file holding the vectors
+            max_size_mb: Maximum total size of stored vectors before eviction
+        """
+        self.db_path = db_path
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self._lock = threading.Lock()
+
+        # Lifetime counters (since process start)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        self._entries = row[0]
+        self._size_bytes = row[1]
+        print(f"[OK] Embedding cache ready: {self._entries} vectors, "
+              f"{self._size_bytes / (1024 * 1024):.1f} MB")
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts. Returns None for every miss."""
+        keys = [embedding_cache_key(model, t) for t in texts]
+        found: Dict[str, bytes] = {}
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, k) for k in found]
+                )
+                self._conn.commit()
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(_decode_vector(blob))
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Store embeddings for texts and evict old entries if over the size limit"""
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            blob = _encode_vector(vector)
+            rows[embedding_cache_key(model, text)] = (model, len(vector), blob, len(blob), now)
+
+        if not rows:
+            return
+
+        with self._lock:
+            keys = list(rows.keys())
+            existing = set()
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(r[0] for r in self._conn.execute(
+                    f"SELECT key FROM embeddings WHERE key IN ({placeholders})", batch
+                ))
+
+            new_rows = [(k, *v) for k, v in rows.items() if k not in existing]
+            self._conn.executemany(
+                "INSERT INTO embeddings (key, model, dim, vector, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                new_rows
+            )
+            self._conn.commit()
+
+            self._entries += len(new_rows)
+            self._size_bytes += sum(r[4] for r in new_rows)
+
+            if self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used vectors until under the low watermark (lock held)"""
+        target = int(self.max_size_bytes * EVICTION_LOW_WATERMARK)
+        cursor = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC")
+
+        to_delete = []
+        freed = 0
+        for key, size in cursor:
+            if self._size_bytes - freed <= target:
+                break
+            to_delete.append((key,))
+            freed += size
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+        self._conn.commit()
+
+        self._entries -= len(to_delete)
+        self._size_bytes -= freed
+        self.evictions += len(to_delete)
+        print(f"[INFO] Embedding cache evicted {len(to_delete)} vectors "
+              f"({freed / (1024 * 1024):.1f} MB)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return lifetime cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "size_mb": round(self._size_bytes / (1024 * 1024), 2),
+            "max_size_mb": round(self.max_size_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        """Close the SQLite connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before every
+    embed_documents batch and only sends misses to the wrapped model.
+
+    One instance is created per ingestion so its counters describe that run.
+    It may be called from several threads (see embedding_dispatcher).
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[EmbeddingCache], model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            with self._lock:
+                self.misses += len(texts)
+            return self.embeddings.embed_documents(texts)
+
+        vectors = self.cache.get_many(self.model, texts)
+
+        # Embed each missing text once, even if repeated within the batch
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        misses = sum(1 for v in vectors if v is None)
+        with self._lock:
+            self.hits += len(texts) - misses
+            self.misses += misses
+
+        if missing:
+            computed = self.embeddings.embed_documents(missing)
+            self.cache.put_many(self.model, missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries are not cached, only ingested chunks
+        return self.embeddings.embed_query(text)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit-rate stats for this ingestion plus the cache totals"""
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.cache is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.get_stats()
+        return stats
@@ -0,0 +1,174 @@
+"""
+Embedding Dispatcher
+Sends chunks to the embedding model in batches, several requests at a time,
+and keeps going through a slow or restarting model server.
+
+- Batch size and the number of requests in flight adapt to observed
+  latency (additive increase while batches come back under the target
+  latency, multiplicative decrease when they are slow or fail).
+- Every batch is retried with exponential backoff and jitter before the
+  ingestion is given up.
+- Batches are checkpointed as they complete, but only through the wrapped
+  embedder: CachedEmbeddings stores each batch in the content-addressed
+  embedding cache, so a re-run of an interrupted ingestion gets finished
+  batches back and only embeds the rest. Without a cache there is no
+  checkpoint and a re-run embeds everything (get_stats reports resumable).
+"""
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Any
+
+from langchain_core.embeddings import Embeddings
+
+# Largest batch sent in one request (also the starting batch size)
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', '64'))
+MIN_BATCH_SIZE = 8
+
+# Upper bound on concurrent embedding requests; the dispatcher starts at one
+EMBED_MAX_IN_FLIGHT = int(os.environ.get('EMBED_MAX_IN_FLIGHT', '4'))
+
+# Batches slower than this (seconds) shrink the batch size and concurrency
+EMBED_TARGET_LATENCY = float(os.environ.get('EMBED_TARGET_LATENCY', '10'))
+
+# Attempts per batch, and the backoff between them (seconds)
+EMBED_MAX_RETRIES = int(os.environ.get('EMBED_MAX_RETRIES', '5'))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+
+class EmbeddingDispatchError(Exception):
+    """A batch still failed after every retry"""
+    pass
+
+
+class EmbeddingDispatcher:
+    """Adaptive, concurrent and retrying batch embedding for one ingestion"""
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = EMBED_BATCH_SIZE,
+                 max_in_flight: int = EMBED_MAX_IN_FLIGHT, target_latency: float = EMBED_TARGET_LATENCY,
+                 max_retries: int = EMBED_MAX_RETRIES):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            embeddings: Embedder called per batch (normally CachedEmbeddings, which checkpoints batches)
+            batch_size: Largest batch per request
+            max_in_flight: Largest number of concurrent requests
+            target_latency: Seconds per batch above which the dispatcher backs off
+            max_retries: Attempts per batch before the ingestion fails
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, batch_size)
+        self.min_batch_size = min(MIN_BATCH_SIZE, self.max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.target_latency = target_latency
+        self.max_retries = max(1, max_retries)
+
+        # Adaptive state, updated by worker threads under the lock
+        self.batch_size = self.max_batch_size
+        self.in_flight_limit = 1.0
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.retries = 0
+        self._latency_total = 0.0
+
+    def embed(self, texts: List[str],
+              progress_callback: Optional[Callable[[int, int], None]] = None) -> List[List[float]]:
+        """
+        Embed texts, returning vectors in input order.
+        progress_callback(done, total) is called on this thread after every
+        batch; an exception from it stops the dispatch.
+        Raises EmbeddingDispatchError when a batch fails after every retry.
+        """
+        total = len(texts)
+        vectors: List[Optional[List[float]]] = [None] * total
+        done = 0
+        next_start = 0
+        pending = {}
+
+        if progress_callback:
+            progress_callback(0, total)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+        try:
+            while next_start < total or pending:
+                # Fill the window up to the current limit
+                while next_start < total and len(pending) < int(self.in_flight_limit):
+                    end = min(total, next_start + self.batch_size)
+                    future = executor.submit(self._embed_batch, texts[next_start:end])
+                    pending[future] = next_start
+                    next_start = end
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start = pending.pop(future)
+                    batch_vectors = future.result()
+                    vectors[start:start + len(batch_vectors)] = batch_vectors
+                    done += len(batch_vectors)
+
+                if progress_callback:
+                    progress_callback(done, total)
+        finally:
+            # Running requests finish in the background; queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return vectors
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """One batch with retries (runs on a worker thread)"""
+        for attempt in range(1, self.max_retries + 1):
+            started = time.time()
+            try:
+                result = self.embeddings.embed_documents(batch)
+            except Exception as e:
+                self._record_failure()
+                if attempt == self.max_retries:
+                    raise EmbeddingDispatchError(
+                        f"Embedding batch of {len(batch)} chunks failed after {attempt} attempts: {e}"
+                    ) from e
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.0)
+                print(f"[WARN] Embedding batch failed ({e}), retry {attempt}/{self.max_retries - 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._record_success(time.time() - started)
+            return result
+
+    def _record_success(self, latency: float):
+        """Additive increase while batches are fast, multiplicative decrease when slow"""
+        with self._lock:
+            self.batches += 1
+            self._latency_total += latency
+            if latency > self.target_latency:
+                self.in_flight_limit = max(1.0, self.in_flight_limit / 2)
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            else:
+                # About +1 request per window of completed batches
+                self.in_flight_limit = min(float(self.max_in_flight),
+                                           self.in_flight_limit + 1.0 / max(1.0, self.in_flight_limit))
+                if latency < self.target_latency / 2:
+                    self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def _record_failure(self):
+        """Back off after an error: one request at a time with a smaller batch"""
+        with self._lock:
+            self.retries += 1
+            self.in_flight_limit = 1.0
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Dispatch statistics for this ingestion"""
+        return {
+            "batches": self.batches,
+            "retries": self.retries,
+            "batch_size": self.batch_size,
+            "in_flight": int(self.in_flight_limit),
+            "avg_batch_seconds": round(self._latency_total / self.batches, 3) if self.batches else 0.0,
+            # Whether finished batches survive a failure (they are checkpointed in the embedding cache)
+            "resumable": getattr(self.embeddings, "cache", None) is not None
+        }
@@ -0,0 +1,493 @@
+"""
+Ingestion Job Manager
+Runs agent creation and update work on a dedicated worker pool so HTTP
+requests can return a job id immediately. Jobs for the same agent run one at
+a time, in submission order, within this process; only exclusive (create)
+submissions also check MongoDB for jobs running in other processes. Job
+state is mirrored to MongoDB so it survives restarts and can be polled from
+any server process.
+"""
+import os
+import uuid
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
+
+# Worker pool size for ingestion (separate from the threads serving queries)
+INGESTION_WORKERS = int(os.environ.get('INGESTION_WORKERS', '2'))
+
+# Job statuses
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+TERMINAL_STATUSES = {STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED}
+
+# How often progress is written to MongoDB (seconds)
+PROGRESS_SAVE_INTERVAL = 1.0
+
+# Live jobs are touched this often; jobs not touched for STALE_AFTER are orphaned
+HEARTBEAT_INTERVAL = 15
+STALE_AFTER = 60
+
+# Running jobs interrupted in these phases have not written to an index yet and
+# are re-run after a restart; embedded batches come back from the embedding cache
+RESUMABLE_PHASES = {"starting", "extracting", "splitting", "embedding"}
+
+# Params holding credentials: kept in memory while the job is live, never
+# written to MongoDB, and dropped once the job ends
+SECRET_PARAMS = {"connection_string"}
+
+
+def redact_params(params: Any) -> Any:
+    """Copy of job params without the SECRET_PARAMS values, at any depth"""
+    if isinstance(params, dict):
+        return {key: redact_params(value) for key, value in params.items() if key not in SECRET_PARAMS}
+    if isinstance(params, list):
+        return [redact_params(value) for value in params]
+    return params
+
+
+def remove_uploaded_files(paths: List[str]):
+    """Remove uploaded files and their per-request upload directories"""
+    directories = set()
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        directories.add(os.path.dirname(path))
+
+    for directory in directories:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback when a job has been cancelled"""
+    pass
+
+
+class JobConflict(Exception):
+    """Raised by submit when an exclusive job's agent already has a job queued or running"""
+    pass
+
+
+class JobManager:
+    """Queues ingestion jobs, runs them on a worker pool and tracks their progress"""
+
+    def __init__(self, collection, handlers: Dict[str, Callable], max_workers: int = INGESTION_WORKERS):
+        """
+        Initialize the job manager.
+
+        Args:
+            collection: MongoDB collection for job state (None = in-memory only)
+            handlers: Map of job kind -> callable(params, progress_callback) returning a result dict
+            max_workers: Number of ingestion worker threads
+        """
+        self.collection = collection
+        self.handlers = handlers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        # Jobs owned by this process
+        self.jobs: Dict[str, dict] = {}
+        self._futures = {}
+        # (user_id, agent_name) -> ids of its unfinished jobs; only the first one runs
+        self._agent_queues: Dict[tuple, List[str]] = {}
+        self._last_saved: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        if self.collection is not None:
+            try:
+                self.collection.create_index([("user_id", 1), ("created_at", -1)])
+                self.collection.create_index("status")
+            except Exception as e:
+                print(f"[WARN] Could not create job indexes: {e}")
+
+        self._recover_jobs()
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+
+    # ==================== SUBMISSION ====================
+
+    def submit(self, kind: str, user_id: str, agent_name: str, params: Dict[str, Any],
+               cleanup_paths: Optional[List[str]] = None, exclusive: bool = False) -> dict:
+        """
+        Queue a job and return its public view. The job waits for any earlier
+        jobs of the same agent. With exclusive (agent creation) it is refused
+        with JobConflict if the agent already has a job queued or running.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if exclusive and self._has_active_job(user_id, agent_name):
+            raise JobConflict(f"Agent '{agent_name}' already has a job queued or running")
+
+        now = datetime.now()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "user_id": user_id,
+            "agent_name": agent_name,
+            "params": params,
+            "params_redacted": redact_params(params) != params,
+            "cleanup_paths": cleanup_paths or [],
+            "status": STATUS_QUEUED,
+            "phase": "queued",
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "throughput": 0.0,
+            "cancel_requested": False,
+            "error": None,
+            "result": None,
+            "worker_id": self.worker_id,
+            "heartbeat_at": now,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": now
+        }
+
+        with self._lock:
+            # Checked again under the lock so two exclusive submits cannot both pass
+            if exclusive and self._agent_queues.get((user_id, agent_name)):
+                raise JobConflict(f"Agent '{agent_name}' already has a job queued or running")
+            self.jobs[job["_id"]] = job
+            self._agent_queues.setdefault((user_id, agent_name), []).append(job["_id"])
+        self._save(job, force=True)
+        self._schedule(job)
+
+        print(f"[INFO] Queued {kind} job {job['_id']} for agent '{agent_name}'")
+        return self._public_view(job)
+
+    def _has_active_job(self, user_id: str, agent_name: str) -> bool:
+        """True if the agent has a queued or running job in this or another process"""
+        with self._lock:
+            if self._agent_queues.get((user_id, agent_name)):
+                return True
+        if self.collection is None:
+            return False
+        try:
+            return self.collection.find_one({
+                "user_id": user_id,
+                "agent_name": agent_name,
+                "status": {"$in": [STATUS_QUEUED, STATUS_RUNNING]},
+                "heartbeat_at": {"$gte": datetime.now() - timedelta(seconds=STALE_AFTER)}
+            }) is not None
+        except Exception as e:
+            print(f"[WARN] Could not check active jobs for agent '{agent_name}': {e}")
+            return False
+
+    def _schedule(self, job: dict):
+        """Hand a queued job to the worker pool once it is first in its agent's queue"""
+        key = (job["user_id"], job["agent_name"])
+        with self._lock:
+            queue = self._agent_queues.setdefault(key, [])
+            if job["_id"] not in queue:
+                queue.append(job["_id"])
+            first = queue[0] == job["_id"]
+        if first:
+            self._start(job["_id"])
+
+    def _start(self, job_id: str):
+        with self._lock:
+            self._futures[job_id] = self.executor.submit(self._run, job_id)
+
+    def _release(self, job: dict):
+        """Drop a finished job from its agent's queue and start the next one"""
+        key = (job["user_id"], job["agent_name"])
+        next_id = None
+        with self._lock:
+            queue = self._agent_queues.get(key, [])
+            if job["_id"] in queue:
+                was_first = queue[0] == job["_id"]
+                queue.remove(job["_id"])
+                if was_first and queue:
+                    next_id = queue[0]
+            if not queue:
+                self._agent_queues.pop(key, None)
+        if next_id is not None:
+            self._start(next_id)
+
+    # ==================== EXECUTION ====================
+
+    def _run(self, job_id: str):
+        """Execute a job on a worker thread"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return
+
+        if job["cancel_requested"]:
+            self._finish(job, STATUS_CANCELLED, error="Cancelled before start")
+            return
+
+        job["status"] = STATUS_RUNNING
+        job["phase"] = "starting"
+        job["started_at"] = datetime.now()
+        self._save(job, force=True)
+
+        try:
+            handler = self.handlers[job["kind"]]
+            result = handler(job["params"], self._make_progress_callback(job))
+
+            if result.get("success"):
+                self._finish(job, STATUS_SUCCEEDED, result=result)
+            elif job["cancel_requested"]:
+                self._finish(job, STATUS_CANCELLED, error="Cancelled by user")
+            else:
+                self._finish(job, STATUS_FAILED, error=result.get("error", "Unknown error"), result=result)
+
+        except JobCancelled:
+            self._finish(job, STATUS_CANCELLED, error="Cancelled by user")
+        except Exception as e:
+            print(f"[ERROR] Job {job_id} failed: {e}")
+            self._finish(job, STATUS_FAILED, error=str(e))
+
+    def _make_progress_callback(self, job: dict) -> Callable[[dict], None]:
+        """Build the callback the RAG system calls with progress updates"""
+        embed_started = {"at": None}
+
+        def progress_callback(update: dict):
+            if job["cancel_requested"]:
+                raise JobCancelled("Job cancelled")
+
+            phase = update.get("phase", job["phase"])
+            phase_changed = phase != job["phase"]
+            job["phase"] = phase
+
+            if "chunks_total" in update:
+                job["chunks_total"] = update["chunks_total"]
+            if "chunks_embedded" in update:
+                if embed_started["at"] is None:
+                    embed_started["at"] = time.time()
+                    embed_started["base"] = job["chunks_embedded"]
+                job["chunks_embedded"] = update["chunks_embedded"]
+                elapsed = time.time() - embed_started["at"]
+                if elapsed > 0:
+                    done = job["chunks_embedded"] - embed_started["base"]
+                    job["throughput"] = round(done / elapsed, 2)
+            if "rows_processed" in update:
+                # Row-level extraction progress (CSV parsing)
+                job["extraction"] = {field: update[field] for field in
+                                     ("rows_processed", "rows_per_sec", "bytes_processed", "bytes_total")
+                                     if field in update}
+
+            self._save(job, force=phase_changed)
+
+        return progress_callback
+
+    def _finish(self, job: dict, status: str, error: Optional[str] = None, result: Optional[dict] = None):
+        """Record a terminal state and clean up uploaded files"""
+        job["status"] = status
+        job["phase"] = "done" if status == STATUS_SUCCEEDED else status
+        job["error"] = error
+        job["result"] = result
+        job["finished_at"] = datetime.now()
+        job["params"] = redact_params(job["params"])
+        self._save(job, force=True)
+        self._cleanup_files(job)
+
+        with self._lock:
+            self._futures.pop(job["_id"], None)
+        self._release(job)
+
+        print(f"[INFO] Job {job['_id']} {status}" + (f": {error}" if error else ""))
+
+    def _cleanup_files(self, job: dict):
+        """Remove the job's uploaded files once it is done"""
+        remove_uploaded_files(job.get("cleanup_paths", []))
+
+    # ==================== QUERIES & CANCELLATION ====================
+
+    def get_job(self, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        """Get the public view of a job, optionally checking ownership"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+
+        if job is None and self.collection is not None:
+            try:
+                job = self.collection.find_one({"_id": job_id})
+            except Exception as e:
+                print(f"[ERROR] Error loading job {job_id}: {e}")
+
+        if job is None:
+            return None
+        if user_id is not None and job.get("user_id") != user_id:
+            return None
+
+        return self._public_view(job)
+
+    def list_jobs(self, user_id: str, limit: int = 20) -> List[dict]:
+        """List a user's most recent jobs"""
+        if self.collection is not None:
+            try:
+                cursor = self.collection.find({"user_id": user_id}).sort("created_at", -1).limit(limit)
+                return [self._public_view(self.jobs.get(doc["_id"], doc)) for doc in cursor]
+            except Exception as e:
+                print(f"[ERROR] Error listing jobs: {e}")
+
+        with self._lock:
+            jobs = [j for j in self.jobs.values() if j["user_id"] == user_id]
+        jobs.sort(key=lambda j: j["created_at"], reverse=True)
+        return [self._public_view(j) for j in jobs[:limit]]
+
+    def cancel_job(self, job_id: str, user_id: str) -> dict:
+        """Request cancellation of a queued or running job"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            future = self._futures.get(job_id)
+
+        if job is None:
+            # Owned by another process: flag it, its progress callback will stop it
+            if self.collection is None:
+                return {"success": False, "error": "Job not found"}
+            updated = self.collection.find_one_and_update(
+                {"_id": job_id, "user_id": user_id, "status": {"$in": [STATUS_QUEUED, STATUS_RUNNING]}},
+                {"$set": {"cancel_requested": True}}
+            )
+            if updated is None:
+                return {"success": False, "error": "Job not found or already finished"}
+            return {"success": True, "job_id": job_id, "status": "cancelling"}
+
+        if job["user_id"] != user_id:
+            return {"success": False, "error": "Job not found"}
+        if job["status"] in TERMINAL_STATUSES:
+            return {"success": False, "error": f"Job already {job['status']}"}
+
+        job["cancel_requested"] = True
+        if (future is None and job["status"] == STATUS_QUEUED) or (future is not None and future.cancel()):
+            # Never started (still waiting behind the agent's earlier jobs, or in the pool queue)
+            self._finish(job, STATUS_CANCELLED, error="Cancelled before start")
+            return {"success": True, "job_id": job_id, "status": STATUS_CANCELLED}
+
+        self._save(job, force=True)
+        return {"success": True, "job_id": job_id, "status": "cancelling"}
+
+    def _public_view(self, job: dict) -> dict:
+        """Job fields safe to return to clients (no params or file paths)"""
+        def iso(value):
+            return value.isoformat() if isinstance(value, datetime) else value
+
+        return {
+            "job_id": job["_id"],
+            "kind": job["kind"],
+            "agent_name": job["agent_name"],
+            "status": job["status"],
+            "phase": job["phase"],
+            "chunks_total": job.get("chunks_total", 0),
+            "chunks_embedded": job.get("chunks_embedded", 0),
+            "throughput": job.get("throughput", 0.0),
+            "extraction": job.get("extraction"),
+            "cancel_requested": job.get("cancel_requested", False),
+            "error": job.get("error"),
+            "result": job.get("result"),
+            "created_at": iso(job.get("created_at")),
+            "started_at": iso(job.get("started_at")),
+            "finished_at": iso(job.get("finished_at")),
+            "updated_at": iso(job.get("updated_at"))
+        }
+
+    # ==================== PERSISTENCE ====================
+
+    def _save(self, job: dict, force: bool = False):
+        """Write job state to MongoDB (throttled unless forced)"""
+        now = time.time()
+        if not force and now - self._last_saved.get(job["_id"], 0) < PROGRESS_SAVE_INTERVAL:
+            return
+        self._last_saved[job["_id"]] = now
+
+        job["updated_at"] = datetime.now()
+        job["heartbeat_at"] = job["updated_at"]
+
+        if self.collection is None:
+            return
+
+        try:
+            fields = {k: v for k, v in job.items() if k not in ("_id", "cancel_requested")}
+            fields["params"] = redact_params(job["params"])
+            update = {"$set": fields}
+            if job["cancel_requested"]:
+                fields["cancel_requested"] = True
+            else:
+                update["$setOnInsert"] = {"cancel_requested": False}
+
+            stored = self.collection.find_one_and_update({"_id": job["_id"]}, update, upsert=True)
+
+            # Pick up cancellation requested through another process
+            if stored is not None and stored.get("cancel_requested"):
+                job["cancel_requested"] = True
+        except Exception as e:
+            print(f"[ERROR] Error saving job {job['_id']}: {e}")
+
+    def _heartbeat_loop(self):
+        """Keep live jobs' heartbeat fresh and forget finished ones"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                jobs = list(self.jobs.values())
+
+            for job in jobs:
+                if job["status"] in TERMINAL_STATUSES:
+                    finished = job.get("finished_at")
+                    if finished and datetime.now() - finished > timedelta(hours=1):
+                        with self._lock:
+                            self.jobs.pop(job["_id"], None)
+                            self._last_saved.pop(job["_id"], None)
+                    continue
+                self._save(job, force=True)
+
+    def _recover_jobs(self):
+        """
+        Take over jobs orphaned by a previous server process.
+        Queued jobs are re-run, and so are running jobs interrupted before they
+        started saving (the embedding cache holds their finished batches).
+        Other running jobs are marked failed, since their partial work cannot
+        be trusted, and their uploads are removed. So are jobs whose params
+        held credentials, which were never persisted; those must be resubmitted.
+        """
+        if self.collection is None:
+            return
+
+        stale_before = datetime.now() - timedelta(seconds=STALE_AFTER)
+        try:
+            orphans = list(self.collection.find({
+                "status": {"$in": [STATUS_QUEUED, STATUS_RUNNING]},
+                "heartbeat_at": {"$lt": stale_before}
+            }))
+        except Exception as e:
+            print(f"[ERROR] Error recovering jobs: {e}")
+            return
+
+        for doc in orphans:
+            # Claim atomically so only one process takes each job
+            now = datetime.now()
+            claimed = self.collection.find_one_and_update(
+                {"_id": doc["_id"], "heartbeat_at": doc["heartbeat_at"]},
+                {"$set": {"worker_id": self.worker_id, "heartbeat_at": now}}
+            )
+            if claimed is None:
+                continue
+
+            job = {**doc, "worker_id": self.worker_id, "heartbeat_at": now}
+            with self._lock:
+                self.jobs[job["_id"]] = job
+
+            if doc.get("params_redacted"):
+                self._finish(job, STATUS_FAILED,
+                             error="Interrupted by server restart; resubmit it (connection credentials are not stored)")
+            elif doc["status"] == STATUS_QUEUED and doc["kind"] in self.handlers:
+                print(f"[INFO] Resuming queued job {job['_id']}")
+                self._schedule(job)
+            elif doc.get("phase") in RESUMABLE_PHASES and doc["kind"] in self.handlers:
+                print(f"[INFO] Restarting job {job['_id']} interrupted while {doc['phase']}")
+                self._schedule(job)
+            else:
+                self._finish(job, STATUS_FAILED, error="Interrupted by server restart")
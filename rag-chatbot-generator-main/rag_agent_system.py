@@ -1,15 +1,20 @@
 import os
 import uuid
 import time
+import threading
+import itertools
+import inspect
+from functools import wraps
 from collections import defaultdict
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_ollama import OllamaEmbeddings, ChatOllama
+import numpy as np
+from langchain_ollama import ChatOllama
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
 from pypdf import PdfReader
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, Iterable, List, Optional, Any, Tuple
 import json
 from datetime import datetime, timedelta
 
@@ -17,10 +22,65 @@ from datetime import datetime, timedelta
 from db import get_agents_collection, get_token_usage_collection
 
 # Token counting
-from token_counter import calculate_token_usage
+from token_counter import calculate_token_usage, ENCODING
+
+# Embedding cache
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+
+# Adaptive, retrying batch embedding
+from embedding_dispatcher import EmbeddingDispatcher
+
+# Pluggable embedding backends (Ollama, in-process ONNX, hashing)
+from embedding_backends import (EmbeddingBackend, create_backend, EMBEDDING_BACKENDS, DEFAULT_BACKEND,
+                                DEFAULT_MODEL, DEFAULT_MODELS, LEGACY_SPEC)
 
 # Data source connectors
-from data_sources import CSVSource, WordSource, SQLSource, NoSQLSource
+from data_sources import CSVSource, WordSource, ParquetSource, SQLSource, NoSQLSource
+
+# Structure-aware chunking
+from chunking import StructuredSplitter
+
+# Exact and near-duplicate chunk removal
+from dedup import deduplicate, DEDUP_MODES
+
+# Segmented agent indexes
+from vector_stores import (AgentStore, FILTER_FIELDS, STORAGE_PRECISIONS, storage_settings, recall_report,
+                           create_agent_store, load_agent_store, grow_agent_store, replace_agent_store,
+                           remove_agent_store)
+from vector_stores.quantization import MIN_DIMENSIONS
+
+# Sources whose documents carry their file name in metadata['source']
+FILE_SOURCE_TYPES = ('pdf', 'csv', 'word', 'parquet')
+
+# Where a re-embedded index is built before it replaces the agent's index
+REEMBED_STAGING_SUFFIX = ".reembed"
+
+
+def _filter_key(doc: Document) -> Tuple[str, ...]:
+    """
+    A chunk's filterable metadata values. Records are only packed together,
+    and chunks only deduplicated against each other, when these match.
+    """
+    return tuple(str(doc.metadata.get(field)) for field in FILTER_FIELDS)
+
+
+def agent_write(method):
+    """
+    Run a RAGAgentSystem method that changes one agent (named by its
+    agent_name and user_id arguments) under that agent's lock, from its
+    existence checks through embedding to the metadata save. Writes to the
+    same agent run one at a time, so an update never appends vectors from
+    a model a concurrent re-embed has just replaced. The lock is per
+    process: API workers running in separate processes are not serialized.
+    """
+    signature = inspect.signature(method)
+    
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        arguments = signature.bind(self, *args, **kwargs).arguments
+        with self._agent_lock(self.get_agent_key(arguments["agent_name"], arguments["user_id"])):
+            return method(self, *args, **kwargs)
+    return locked
 
 
 class RAGAgentSystem:
@@ -28,15 +88,25 @@ class RAGAgentSystem:
         """Initialize the RAG Agent System with FAISS using modern LCEL approach"""
         self.persist_directory = persist_directory
         
-        # Initialize embeddings
-        self.embeddings = OllamaEmbeddings(model="mxbai-embed-large")
+        # Embedding backend for new agents; every agent keeps the one it was indexed with
+        self.embeddings = create_backend(DEFAULT_BACKEND, DEFAULT_MODEL)
+        self.embedding_model = self.embeddings.model
+        self._embedding_backends: Dict[Tuple[str, str], EmbeddingBackend] = {
+            (self.embeddings.backend, self.embeddings.model): self.embeddings
+        }
         
         # Initialize LLM
         self.llm = ChatOllama(model="llama3.2:3b", temperature=0.7)
         
         # In-memory storage (cached from MongoDB)
         self.agents: Dict[str, dict] = {}
-        self.vectorstores: Dict[str, FAISS] = {}
+        self.vectorstores: Dict[str, AgentStore] = {}
+        
+        # Changes to one agent's index and metadata (ingestion, source edits,
+        # storage, deletion) run one at a time within this process (see
+        # agent_write); queries never wait on these
+        self._agent_locks: Dict[str, threading.RLock] = defaultdict(threading.RLock)
+        self._agent_locks_guard = threading.Lock()
         
         # Embed token to agent mapping
         self.embed_tokens: Dict[str, str] = {}  # token -> agent_key
@@ -46,6 +116,18 @@ class RAGAgentSystem:
         self.RATE_LIMIT_WINDOW = 60  # seconds
         self.RATE_LIMIT_MAX = 20  # max requests per window
         
+        # Chunk sizing in tokens, matched to the embedding model's context window.
+        # Tokens are counted with cl100k_base, so keep headroom below the window.
+        self.EMBEDDING_WINDOW_TOKENS = 512  # mxbai-embed-large
+        self.CHUNK_WINDOW_SHARE = 0.9
+        self.MAX_CHUNK_TOKENS = int(self.EMBEDDING_WINDOW_TOKENS * self.CHUNK_WINDOW_SHARE)
+        self.MIN_CHUNK_TOKENS = 32
+        self.DEFAULT_CHUNK_TOKENS = 320
+        self.DEFAULT_OVERLAP_TOKENS = 32
+        
+        # Duplicate chunks dropped before embedding: off, exact, minhash or simhash
+        self.DEFAULT_DEDUP_MODE = 'exact'
+        
         # MongoDB collection
         self.collection = get_agents_collection()
         self.token_usage_collection = get_token_usage_collection()
@@ -69,6 +151,16 @@ class RAGAgentSystem:
             Answer:"""
         
         os.makedirs(self.persist_directory, exist_ok=True)
+        
+        # Content-addressed embedding cache shared by all agents
+        try:
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(self.persist_directory, "embedding_cache.sqlite")
+            )
+        except Exception as e:
+            print(f"[WARN] Embedding cache disabled, interrupted ingestions will re-embed every chunk: {e}")
+            self.embedding_cache = None
+        
         self.load_agents_from_db()
         
     def load_agents_from_db(self):
@@ -239,32 +331,333 @@ class RAGAgentSystem:
         agent_key = self.get_agent_key(agent_name, user_id)
         return os.path.join(self.persist_directory, agent_key)
     
-    def get_agent_info(self, agent_name: str, user_id: str) -> Optional[dict]:
-        """Get information about a specific agent"""
-        agent_key = self.get_agent_key(agent_name, user_id)
+    def _embeddings_for(self, spec: Dict[str, Any]) -> EmbeddingBackend:
+        """Embedding backend for a stored {"backend", "model"} spec, created once per process"""
+        key = (spec["backend"], spec["model"])
+        if key not in self._embedding_backends:
+            self._embedding_backends[key] = create_backend(spec["backend"], spec["model"])
+        return self._embedding_backends[key]
+    
+    def _agent_embedding_spec(self, agent_key: str) -> Dict[str, Any]:
+        """Stored {"backend", "model", "dimension"} of an agent (Ollama mxbai for agents that predate the field)"""
+        return self.agents.get(agent_key, {}).get("embedding") or LEGACY_SPEC
+    
+    def _agent_embeddings(self, agent_key: str) -> EmbeddingBackend:
+        """The backend an agent's index was built with"""
+        return self._embeddings_for(self._agent_embedding_spec(agent_key))
+    
+    def _embedding_settings(self, backend: Optional[str] = None, model: Optional[str] = None) -> EmbeddingBackend:
+        """
+        Backend for a new agent or a re-embed (default: the one for new agents).
+        A backend given without a model uses that backend's default model.
+        """
+        backend = backend or self.embeddings.backend
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}'. Use one of: {', '.join(EMBEDDING_BACKENDS)}")
+        if not model:
+            model = self.embeddings.model if backend == self.embeddings.backend else DEFAULT_MODELS[backend]
+        return self._embeddings_for({"backend": backend, "model": model})
+    
+    def _agent_lock(self, agent_key: str) -> threading.RLock:
+        """Lock serializing changes to one agent in this process"""
+        with self._agent_locks_guard:
+            return self._agent_locks[agent_key]
+    
+    def _get_vectorstore(self, agent_key: str) -> AgentStore:
+        """Return an agent's index (small or segmented), loading it from disk if needed"""
+        if agent_key not in self.vectorstores:
+            agent_path = os.path.join(self.persist_directory, agent_key)
+            self.vectorstores[agent_key] = load_agent_store(
+                agent_path, self._agent_embeddings(agent_key), storage=self._agent_storage(agent_key)
+            )
+        return self.vectorstores[agent_key]
+    
+    def _append_chunks(self, agent_key: str, new_vectorstore: FAISS, chunk_map: Dict[str, str],
+                       chunk_records: Optional[Dict[str, str]] = None) -> AgentStore:
+        """
+        Add newly embedded chunks to an agent's index, upgrading a small index
+        to the segmented layout first when it would outgrow the small-store limit.
+        Returns the agent's (possibly new) index.
+        """
+        vectorstore = grow_agent_store(self._get_vectorstore(agent_key), new_vectorstore.index.ntotal)
+        self.vectorstores[agent_key] = vectorstore
+        vectorstore.append(new_vectorstore, chunk_sources=chunk_map, chunk_records=chunk_records)
+        return vectorstore
+    
+    def _storage_settings(self, precision: Optional[str], dimensions: Optional[int],
+                          spec: Dict[str, Any]) -> Dict[str, Any]:
+        """In-memory vector storage for an agent with the given embedding spec; truncation needs a Matryoshka model"""
+        if dimensions and not self._embeddings_for(spec).matryoshka:
+            raise ValueError(f"Embedding model '{spec['model']}' is not Matryoshka-trained, "
+                             f"so its vectors cannot be truncated")
+        return storage_settings(precision, dimensions, spec.get("dimension"))
+    
+    def _agent_storage(self, agent_key: str, spec: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Vector storage stored on an agent (float32 when unset). A truncation the
+        agent's model no longer supports (e.g. after a re-embed) is dropped.
+        """
+        spec = spec or self._agent_embedding_spec(agent_key)
+        storage = self.agents.get(agent_key, {}).get("storage") or {}
+        try:
+            return self._storage_settings(storage.get("precision"), storage.get("dimensions"), spec)
+        except ValueError:
+            return storage_settings(storage.get("precision"))
+    
+    def _report_progress(self, progress_callback: Optional[Callable[[dict], None]], phase: str, **fields):
+        """Send a progress update to the caller (e.g. an ingestion job), if any"""
+        if progress_callback is not None:
+            progress_callback({"phase": phase, **fields})
+    
+    def _load_source_documents(self, source_type: str, source_config: Dict[str, Any],
+                               chunking: Optional[Dict[str, int]] = None,
+                               progress_callback: Optional[Callable[[dict], None]] = None
+                               ) -> Tuple[Iterable[Document], List[str], Dict[str, Any]]:
+        """
+        Extract documents from a data source.
         
-        if agent_key not in self.agents:
-            return None
+        chunking is the agent's chunk sizing; CSV and Parquet rows are batched
+        into documents of about one chunk each. progress_callback receives
+        "extracting" updates with rows parsed so far and rows/sec.
         
-        agent = self.agents[agent_key]
+        Returns the documents, the source names recorded on the agent and
+        extraction stats for the job result (CSV: replacement characters
+        substituted for undecodable bytes, per file; Word: overlap characters
+        the old extractor would have duplicated). Parquet/Arrow documents
+        are an iterator, read batch by batch as the splitter consumes it
+        (empty list when the files yield nothing).
+        Raises ValueError for unsupported types or incomplete configuration.
+        """
+        documents = []
+        source_names = []
+        extraction = {}
         
-        # Check ownership
-        if agent.get("user_id") != user_id:
-            return None
+        if source_type == 'pdf':
+            for pdf_path in source_config.get('file_paths', []):
+                if not os.path.exists(pdf_path):
+                    raise ValueError(f"PDF file not found: {pdf_path}")
+                
+                text = self.extract_text_from_pdf(pdf_path)
+                if text:
+                    name = os.path.basename(pdf_path)
+                    documents.append(Document(page_content=text, metadata={"source": name, "source_type": "pdf"}))
+                    source_names.append(name)
         
-        return {
-            "name": agent.get("agent_name"),
-            "domain": agent.get("domain", ""),
-            "description": agent.get("description", ""),
-            "source_type": agent.get("source_type", "pdf"),
-            "source_files": agent.get("source_files", agent.get("pdf_files", [])),
-            "num_documents": agent.get("num_documents", 0),
-            "embed_token": agent.get("embed_token"),
-            "embed_enabled": agent.get("embed_enabled", False),
-            "created_at": agent.get("created_at"),
-            "updated_at": agent.get("updated_at")
+        elif source_type == 'csv':
+            file_paths = source_config.get('file_paths', [])
+            # Batch rows into documents of about one chunk, headers written once per batch
+            source = CSVSource(
+                file_paths,
+                rows_per_document=source_config.get('rows_per_document'),
+                max_tokens_per_document=(chunking or self._chunking_settings())["chunk_tokens"],
+                encoding=ENCODING,
+                progress_callback=lambda update: self._report_progress(progress_callback, "extracting", **update)
+            )
+            documents = source.extract_documents()
+            source_names = [os.path.basename(f) for f in file_paths]
+            extraction["replacement_chars"] = dict(source.replacement_chars)
+        
+        elif source_type == 'parquet':
+            file_paths = source_config.get('file_paths', [])
+            # Rows rendered per record batch and grouped into documents of about one chunk
+            source = ParquetSource(
+                file_paths,
+                rows_per_document=source_config.get('rows_per_document'),
+                max_tokens_per_document=(chunking or self._chunking_settings())["chunk_tokens"],
+                encoding=ENCODING,
+                columns=source_config.get('columns'),
+                progress_callback=lambda update: self._report_progress(progress_callback, "extracting", **update)
+            )
+            # Streamed into the splitter; only its chunks are held, not every rendered row
+            stream = source.iter_documents()
+            first = next(stream, None)
+            documents = itertools.chain([first], stream) if first is not None else []
+            source_names = [os.path.basename(f) for f in file_paths]
+        
+        elif source_type == 'word':
+            file_paths = source_config.get('file_paths', [])
+            source = WordSource(file_paths)
+            documents = source.extract_documents()
+            source_names = [os.path.basename(f) for f in file_paths]
+            extraction["duplicated_chars_avoided"] = source.duplicated_chars_avoided
+        
+        elif source_type == 'sql':
+            connection_string = source_config.get('connection_string', '')
+            tables = source_config.get('tables', None)
+            sample_limit = source_config.get('sample_limit', 1000)
+            
+            if not connection_string:
+                raise ValueError("SQL connection string is required")
+            
+            # Raises ValueError for an unknown sampling strategy or fetch mode
+            source = SQLSource(connection_string, tables=tables, sample_limit=sample_limit,
+                               sampling=source_config.get('sampling', 'first'),
+                               sample_column=source_config.get('sample_column'),
+                               sample_seed=source_config.get('sample_seed'),
+                               fetch=source_config.get('fetch', 'rows'))
+            documents = source.extract_documents()
+            source_names = [f"SQL: {len(tables) if tables else 'all'} tables"]
+        
+        elif source_type == 'nosql':
+            connection_string = source_config.get('connection_string', '')
+            database = source_config.get('database', '')
+            collections = source_config.get('collections', None)
+            sample_limit = source_config.get('sample_limit', 1000)
+            
+            if not connection_string or not database:
+                raise ValueError("MongoDB connection string and database name are required")
+            
+            # Raises ValueError for an unknown sampling strategy
+            source = NoSQLSource(connection_string, database, collections=collections, sample_limit=sample_limit,
+                                 projection=source_config.get('projection'),
+                                 exclude_fields=source_config.get('exclude_fields'),
+                                 batch_size=source_config.get('batch_size', 1000),
+                                 sampling=source_config.get('sampling', 'first'))
+            documents = source.extract_documents()
+            source_names = [f"MongoDB: {database}"]
+        
+        else:
+            raise ValueError(f"Unsupported source type: {source_type}")
+        
+        return documents, source_names, extraction
+    
+    def _chunking_settings(self, chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None,
+                           embeddings: Optional[EmbeddingBackend] = None) -> Dict[str, int]:
+        """Per-agent chunk sizing, clamped to the window of the agent's embedding model"""
+        max_tokens = self.MAX_CHUNK_TOKENS
+        if embeddings is not None:
+            max_tokens = max(self.MIN_CHUNK_TOKENS, int(embeddings.context_window * self.CHUNK_WINDOW_SHARE))
+        
+        chunk_tokens = int(chunk_tokens or self.DEFAULT_CHUNK_TOKENS)
+        chunk_tokens = max(self.MIN_CHUNK_TOKENS, min(chunk_tokens, max_tokens))
+        
+        overlap_tokens = self.DEFAULT_OVERLAP_TOKENS if overlap_tokens is None else int(overlap_tokens)
+        overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+        
+        return {"chunk_tokens": chunk_tokens, "overlap_tokens": overlap_tokens}
+    
+    def _agent_chunking(self, agent_key: str) -> Dict[str, int]:
+        """Chunk sizing stored on an agent (defaults for agents created before it was stored)"""
+        chunking = self.agents[agent_key].get("chunking") or {}
+        return self._chunking_settings(chunking.get("chunk_tokens"), chunking.get("overlap_tokens"),
+                                       self._agent_embeddings(agent_key))
+    
+    def _dedup_settings(self, mode: Optional[str] = None, threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Per-agent deduplication; threshold None uses the mode's default"""
+        mode = mode or self.DEFAULT_DEDUP_MODE
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode '{mode}'. Use one of: {', '.join(DEDUP_MODES)}")
+        if threshold is not None:
+            threshold = max(0.0, min(float(threshold), 1.0))
+        return {"mode": mode, "threshold": threshold}
+    
+    def _agent_dedup(self, agent_key: str) -> Dict[str, Any]:
+        """Deduplication stored on an agent (exact for agents created before it was stored)"""
+        dedup = self.agents[agent_key].get("dedup") or {}
+        return self._dedup_settings(dedup.get("mode"), dedup.get("threshold"))
+    
+    def _dedup_chunks(self, chunks: List[Document], chunk_sources: List[str],
+                      dedup: Dict[str, Any]) -> Tuple[List[Document], List[str], Dict[str, Any]]:
+        """
+        Drop exact (and, for minhash/simhash, near-) duplicate chunks before
+        they are embedded. Chunks are only compared within the splitter group
+        they came from (their source and filterable metadata), so identical
+        rows of two tables loaded as one source are both kept.
+        Returns the kept chunks, their sources and how many were collapsed.
+        """
+        groups = [(source,) + _filter_key(chunk) for chunk, source in zip(chunks, chunk_sources)]
+        kept, stats = deduplicate([chunk.page_content for chunk in chunks], groups,
+                                  mode=dedup["mode"], threshold=dedup.get("threshold"))
+        collapsed = len(chunks) - len(kept)
+        if collapsed:
+            print(f"[INFO] Dedup ({dedup['mode']}) collapsed {collapsed} of {len(chunks)} chunks")
+        
+        return [chunks[i] for i in kept], [chunk_sources[i] for i in kept], {
+            "mode": dedup["mode"],
+            "chunks_before": len(chunks),
+            "chunks_collapsed": collapsed,
+            **stats
         }
     
+    def _split_by_source(self, documents: Iterable[Document], source_type: str, source_names: List[str],
+                         chunking: Dict[str, int], source_name: Optional[str] = None,
+                         keyed_records: bool = False) -> Tuple[List[Document], List[str]]:
+        """
+        Split documents into chunks without letting a chunk span two sources,
+        keeping the documents' metadata on every chunk.
+        
+        Records (e.g. rows of one table) are packed only with neighbours from the
+        same source and with the same filterable metadata, and never cut unless
+        longer than a chunk. File sources are keyed by file name, database sources
+        by their single source name; source_name overrides the key (used when
+        replacing a source). With keyed_records (incremental sync) each document
+        is keyed by its own "source" and chunks never hold two records, so one
+        record's chunks can be replaced alone.
+        Returns the chunks and the source of each chunk.
+        """
+        splitter = StructuredSplitter(
+            chunk_size=chunking["chunk_tokens"],
+            chunk_overlap=chunking["overlap_tokens"],
+            encoding=ENCODING
+        )
+        
+        def group_key(doc):
+            if source_name:
+                key = source_name
+            elif source_type in FILE_SOURCE_TYPES or keyed_records:
+                key = doc.metadata.get("source", source_names[0])
+            else:
+                key = source_names[0]
+            record = (doc.metadata.get("record_key"),) if keyed_records else ()
+            return (key,) + _filter_key(doc) + record
+        
+        chunks = []
+        chunk_sources = []
+        for key, chunk in splitter.iter_chunks(documents, group_key=group_key):
+            chunks.append(chunk)
+            chunk_sources.append(key[0])
+        
+        return chunks, chunk_sources
+    
+    def _build_vectorstore(self, chunks: List[Document], chunk_sources: List[str],
+                           progress_callback: Optional[Callable[[dict], None]] = None,
+                           embeddings: Optional[EmbeddingBackend] = None, agent_key: Optional[str] = None):
+        """Embed chunks (through the embedding cache) and build a FAISS store.
+        embeddings is the backend to use (default: the one for new agents). With agent_key,
+        chunks are added to that agent: its own backend is used and the vectors must have
+        the dimension stored for it.
+        Returns the vectorstore, the chunk id -> source mapping, the cache stats for this
+        ingestion and the embedding dispatch stats."""
+        expected_dimension = None
+        if agent_key is not None:
+            embeddings = self._agent_embeddings(agent_key)
+            expected_dimension = self._agent_embedding_spec(agent_key).get("dimension")
+        embeddings = embeddings or self.embeddings
+        embedder = CachedEmbeddings(embeddings, self.embedding_cache, embeddings.cache_key)
+        # Completed batches land in the embedding cache, so a re-run resumes where this one
+        # stopped; with the cache disabled nothing is checkpointed and a re-run starts over
+        dispatcher = EmbeddingDispatcher(embedder)
+        
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = dispatcher.embed(texts, lambda done, total: self._report_progress(
+            progress_callback, "embedding", chunks_embedded=done, chunks_total=total
+        ))
+        
+        # A model re-pulled under the same name can change size; its vectors cannot join the index
+        if expected_dimension and vectors and len(vectors[0]) != expected_dimension:
+            raise ValueError(f"Embedding model '{embeddings.model}' returned {len(vectors[0])}-dimension vectors "
+                             f"but the agent's index holds {expected_dimension}; re-embed the agent first")
+        
+        # Chunk ids are recorded in the agent's chunk registry for later deletion
+        chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+        vectorstore = FAISS.from_embeddings(
+            text_embeddings=list(zip(texts, vectors)),
+            embedding=embeddings,
+            metadatas=[chunk.metadata for chunk in chunks],
+            ids=chunk_ids
+        )
+        return vectorstore, dict(zip(chunk_ids, chunk_sources)), embedder.get_stats(), dispatcher.get_stats()
+    
     def generate_embed_token(self, agent_name: str, user_id: str) -> dict:
         """Generate an embed token for an agent"""
         agent_key = self.get_agent_key(agent_name, user_id)
@@ -339,20 +732,13 @@ class RAGAgentSystem:
         user_id = agent.get('user_id')
         
         # Load vectorstore if needed
-        if agent_key not in self.vectorstores:
-            agent_path = self.get_agent_path(agent_name, user_id)
-            try:
-                self.vectorstores[agent_key] = FAISS.load_local(
-                    agent_path, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-            except Exception as e:
-                return {"success": False, "error": f"Error loading agent: {str(e)}"}
+        try:
+            vectorstore = self._get_vectorstore(agent_key)
+        except Exception as e:
+            return {"success": False, "error": f"Error loading agent: {str(e)}"}
         
         # Query
         try:
-            vectorstore = self.vectorstores[agent_key]
             retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
             
             prompt = ChatPromptTemplate.from_template(self.EMBED_PROMPT_TEMPLATE)
@@ -394,8 +780,13 @@ class RAGAgentSystem:
         except Exception as e:
             return {"success": False, "error": f"Error: {str(e)}"}
     
-    def create_agent(self, agent_name: str, pdf_paths: List[str], 
-                    user_id: str, description: str = "", domain: str = "") -> dict:
+    @agent_write
+    def create_agent(self, agent_name: str, pdf_paths: List[str],
+                    user_id: str, description: str = "", domain: str = "",
+                    progress_callback: Optional[Callable[[dict], None]] = None,
+                    chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None,
+                    dedup: Optional[str] = None, dedup_threshold: Optional[float] = None,
+                    embedding_backend: Optional[str] = None, embedding_model: Optional[str] = None) -> dict:
         """Create a new RAG agent with its own FAISS vector store"""
         
         agent_key = self.get_agent_key(agent_name, user_id)
@@ -404,53 +795,61 @@ class RAGAgentSystem:
             return {"success": False, "error": f"Agent '{agent_name}' already exists for this user"}
         
         try:
-            # Extract text from all PDFs
-            all_text = ""
-            pdf_names = []
+            dedup_settings = self._dedup_settings(dedup, dedup_threshold)
+            embeddings = self._embedding_settings(embedding_backend, embedding_model)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        
+        try:
+            self._report_progress(progress_callback, "extracting")
             
-            for pdf_path in pdf_paths:
-                if not os.path.exists(pdf_path):
-                    return {"success": False, "error": f"PDF file not found: {pdf_path}"}
-                
-                text = self.extract_text_from_pdf(pdf_path)
-                if text:
-                    all_text += text + "\n\n"
-                    pdf_names.append(os.path.basename(pdf_path))
+            # Extract text from all PDFs
+            try:
+                documents, pdf_names, _ = self._load_source_documents('pdf', {'file_paths': pdf_paths})
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
             
-            if not all_text.strip():
+            if not any(doc.page_content.strip() for doc in documents):
                 return {"success": False, "error": "No text could be extracted from PDFs"}
             
-            # Split text into chunks (smaller chunks to fit embedding model context)
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=400,
-                chunk_overlap=50,
-                length_function=len
-            )
-            chunks = text_splitter.split_text(all_text)
+            self._report_progress(progress_callback, "splitting")
+            
+            # Split text into token-sized chunks, one set per PDF
+            chunking = self._chunking_settings(chunk_tokens, overlap_tokens, embeddings)
+            chunks, chunk_sources = self._split_by_source(documents, 'pdf', pdf_names, chunking)
             
             if not chunks:
                 return {"success": False, "error": "No text chunks created"}
             
+            # Collapse repeated chunks before they are embedded
+            chunks, chunk_sources, dedup_stats = self._dedup_chunks(chunks, chunk_sources, dedup_settings)
+            
             # Create FAISS vector store
-            vectorstore = FAISS.from_texts(
-                texts=chunks,
-                embedding=self.embeddings
+            vectorstore, chunk_map, cache_stats, embed_stats = self._build_vectorstore(
+                chunks, chunk_sources, progress_callback, embeddings=embeddings
             )
             
-            # Save FAISS index to disk
+            # Save the index to disk (small agents as one matrix, larger ones as a first segment)
+            self._report_progress(progress_callback, "saving")
             agent_path = self.get_agent_path(agent_name, user_id)
-            vectorstore.save_local(agent_path)
             
             # Store references
-            self.vectorstores[agent_key] = vectorstore
+            self.vectorstores[agent_key] = create_agent_store(
+                agent_path, embeddings, vectorstore, chunk_sources=chunk_map
+            )
             
             agent_data = {
                 "agent_name": agent_name,
                 "user_id": user_id,
                 "domain": domain,
                 "description": description,
+                "source_type": "pdf",
+                "source_files": pdf_names,
                 "pdf_files": pdf_names,
                 "num_documents": len(chunks),
+                "chunking": chunking,
+                "dedup": dedup_settings,
+                "embedding": {**embeddings.spec(), "dimension": vectorstore.index.d},
                 "embed_token": None,
                 "embed_enabled": False,
                 "created_at": datetime.now().isoformat()
@@ -464,20 +863,29 @@ class RAGAgentSystem:
                 "agent_name": agent_name,
                 "domain": domain,
                 "documents_processed": len(pdf_names),
-                "chunks_created": len(chunks)
+                "chunks_created": len(chunks),
+                "chunking": chunking,
+                "dedup": dedup_stats,
+                "embedding_cache": cache_stats,
+                "embedding": embed_stats
             }
-            
+        
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @agent_write
     def create_agent_from_source(self, agent_name: str, source_type: str, source_config: Dict[str, Any],
-                                  user_id: str, description: str = "", domain: str = "") -> dict:
+                                  user_id: str, description: str = "", domain: str = "",
+                                  progress_callback: Optional[Callable[[dict], None]] = None,
+                                  chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None,
+                                  dedup: Optional[str] = None, dedup_threshold: Optional[float] = None,
+                                  embedding_backend: Optional[str] = None, embedding_model: Optional[str] = None) -> dict:
         """
         Create a new RAG agent from various data sources.
         
         Args:
             agent_name: Name of the agent
-            source_type: Type of source ('pdf', 'csv', 'word', 'sql', 'nosql')
+            source_type: Type of source ('pdf', 'csv', 'word', 'parquet', 'sql', 'nosql')
             source_config: Configuration for the source
                 - For files (pdf/csv/word): {'file_paths': [...]}
                 - For SQL: {'connection_string': '...', 'tables': [...], 'sample_limit': 1000}
@@ -485,95 +893,90 @@ class RAGAgentSystem:
             user_id: User ID who owns the agent
             description: Agent description
             domain: Agent domain/specialty
+            progress_callback: Optional callable receiving progress updates
+            chunk_tokens: Chunk size in tokens (clamped to the agent's embedding model window)
+            overlap_tokens: Token overlap between pieces of long documents
+            dedup: Duplicate chunk removal ('off', 'exact', 'minhash', 'simhash'; default exact)
+            dedup_threshold: Near-duplicate similarity threshold (default per mode)
+            embedding_backend: Embedding backend ('ollama', 'onnx', 'hash'; default from EMBEDDING_BACKEND)
+            embedding_model: Embedding model (default: the backend's default model)
         """
         agent_key = self.get_agent_key(agent_name, user_id)
         
         if agent_key in self.agents:
             return {"success": False, "error": f"Agent '{agent_name}' already exists for this user"}
         
+        if source_type == 'pdf':
+            # Use existing PDF logic
+            return self.create_agent(
+                agent_name=agent_name,
+                pdf_paths=source_config.get('file_paths', []),
+                user_id=user_id,
+                description=description,
+                domain=domain,
+                progress_callback=progress_callback,
+                chunk_tokens=chunk_tokens,
+                overlap_tokens=overlap_tokens,
+                dedup=dedup,
+                dedup_threshold=dedup_threshold,
+                embedding_backend=embedding_backend,
+                embedding_model=embedding_model
+            )
+        
         try:
-            documents = []
-            source_names = []
+            dedup_settings = self._dedup_settings(dedup, dedup_threshold)
+            embeddings = self._embedding_settings(embedding_backend, embedding_model)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        
+        try:
+            self._report_progress(progress_callback, "extracting")
+            
+            chunking = self._chunking_settings(chunk_tokens, overlap_tokens, embeddings)
             
             # Extract documents based on source type
-            if source_type == 'pdf':
-                # Use existing PDF logic
-                return self.create_agent(
-                    agent_name=agent_name,
-                    pdf_paths=source_config.get('file_paths', []),
-                    user_id=user_id,
-                    description=description,
-                    domain=domain
+            try:
+                documents, source_names, extraction = self._load_source_documents(
+                    source_type, source_config, chunking, progress_callback
                 )
-                
-            elif source_type == 'csv':
-                file_paths = source_config.get('file_paths', [])
-                source = CSVSource(file_paths)
-                documents = source.extract_documents()
-                source_names = [os.path.basename(f) for f in file_paths]
-                
-            elif source_type == 'word':
-                file_paths = source_config.get('file_paths', [])
-                source = WordSource(file_paths)
-                documents = source.extract_documents()
-                source_names = [os.path.basename(f) for f in file_paths]
-                
-            elif source_type == 'sql':
-                connection_string = source_config.get('connection_string', '')
-                tables = source_config.get('tables', None)
-                sample_limit = source_config.get('sample_limit', 1000)
-                
-                if not connection_string:
-                    return {"success": False, "error": "SQL connection string is required"}
-                
-                source = SQLSource(connection_string, tables=tables, sample_limit=sample_limit)
-                documents = source.extract_documents()
-                source_names = [f"SQL: {len(tables) if tables else 'all'} tables"]
-                
-            elif source_type == 'nosql':
-                connection_string = source_config.get('connection_string', '')
-                database = source_config.get('database', '')
-                collections = source_config.get('collections', None)
-                sample_limit = source_config.get('sample_limit', 1000)
-                
-                if not connection_string or not database:
-                    return {"success": False, "error": "MongoDB connection string and database name are required"}
-                
-                source = NoSQLSource(connection_string, database, collections=collections, sample_limit=sample_limit)
-                documents = source.extract_documents()
-                source_names = [f"MongoDB: {database}"]
-                
-            else:
-                return {"success": False, "error": f"Unsupported source type: {source_type}"}
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
             
             if not documents:
                 return {"success": False, "error": "No documents could be extracted from the source"}
             
-            # Extract text from documents and split into chunks
-            all_text = "\n\n".join([doc.page_content for doc in documents])
+            self._report_progress(progress_callback, "splitting")
             
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=400,
-                chunk_overlap=50,
-                length_function=len
-            )
-            chunks = text_splitter.split_text(all_text)
+            # Streamed (Parquet) documents are counted as the splitter reads them
+            extracted = {"documents": 0}
+            
+            def counted(docs):
+                for doc in docs:
+                    extracted["documents"] += 1
+                    yield doc
+            
+            # Split into token-sized chunks, keeping each chunk within a single source
+            chunks, chunk_sources = self._split_by_source(counted(documents), source_type, source_names, chunking)
             
             if not chunks:
                 return {"success": False, "error": "No text chunks created from source"}
             
+            # Collapse repeated chunks before they are embedded
+            chunks, chunk_sources, dedup_stats = self._dedup_chunks(chunks, chunk_sources, dedup_settings)
+            
             # Create FAISS vector store
-            vectorstore = FAISS.from_texts(
-                texts=chunks,
-                embedding=self.embeddings
+            vectorstore, chunk_map, cache_stats, embed_stats = self._build_vectorstore(
+                chunks, chunk_sources, progress_callback, embeddings=embeddings
             )
             
-            # Save FAISS index to disk
+            # Save the index to disk (small agents as one matrix, larger ones as a first segment)
+            self._report_progress(progress_callback, "saving")
             agent_path = self.get_agent_path(agent_name, user_id)
-            vectorstore.save_local(agent_path)
             
             # Store references
-            self.vectorstores[agent_key] = vectorstore
+            self.vectorstores[agent_key] = create_agent_store(
+                agent_path, embeddings, vectorstore, chunk_sources=chunk_map
+            )
             
             agent_data = {
                 "agent_name": agent_name,
@@ -584,6 +987,9 @@ class RAGAgentSystem:
                 "source_files": source_names,
                 "pdf_files": source_names if source_type == 'pdf' else [],  # Backward compatibility
                 "num_documents": len(chunks),
+                "chunking": chunking,
+                "dedup": dedup_settings,
+                "embedding": {**embeddings.spec(), "dimension": vectorstore.index.d},
                 "embed_token": None,
                 "embed_enabled": False,
                 "created_at": datetime.now().isoformat()
@@ -597,24 +1003,32 @@ class RAGAgentSystem:
                 "agent_name": agent_name,
                 "source_type": source_type,
                 "domain": domain,
-                "documents_extracted": len(documents),
-                "chunks_created": len(chunks)
+                "documents_extracted": extracted["documents"],
+                "chunks_created": len(chunks),
+                "chunking": chunking,
+                "dedup": dedup_stats,
+                "extraction": extraction,
+                "embedding_cache": cache_stats,
+                "embedding": embed_stats
             }
-            
+        
         except Exception as e:
             print(f"[ERROR] Failed to create agent from source: {e}")
             return {"success": False, "error": str(e)}
     
-    def update_agent_data(self, agent_name: str, user_id: str, 
-                          source_type: str, source_config: Dict[str, Any]) -> dict:
+    @agent_write
+    def update_agent_data(self, agent_name: str, user_id: str,
+                          source_type: str, source_config: Dict[str, Any],
+                          progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
         """
         Add more data to an existing agent (append-only strategy).
         
         Args:
             agent_name: Name of the existing agent
             user_id: User ID who owns the agent
-            source_type: Type of new source ('pdf', 'csv', 'word', 'sql', 'nosql')
+            source_type: Type of new source ('pdf', 'csv', 'word', 'parquet', 'sql', 'nosql')
             source_config: Configuration for the source
+            progress_callback: Optional callable receiving progress updates
         """
         agent_key = self.get_agent_key(agent_name, user_id)
         
@@ -628,102 +1042,45 @@ class RAGAgentSystem:
         
         try:
             # Load existing vectorstore if not in memory
-            if agent_key not in self.vectorstores:
-                agent_path = self.get_agent_path(agent_name, user_id)
-                try:
-                    self.vectorstores[agent_key] = FAISS.load_local(
-                        agent_path, 
-                        self.embeddings,
-                        allow_dangerous_deserialization=True
-                    )
-                except Exception as e:
-                    return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
-            
-            existing_vectorstore = self.vectorstores[agent_key]
+            try:
+                existing_vectorstore = self._get_vectorstore(agent_key)
+            except Exception as e:
+                return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
+            
             original_chunk_count = self.agents[agent_key].get("num_documents", 0)
             
             # Extract documents from new source
-            documents = []
-            source_names = []
-            
-            if source_type == 'pdf':
-                file_paths = source_config.get('file_paths', [])
-                for pdf_path in file_paths:
-                    if os.path.exists(pdf_path):
-                        text = self.extract_text_from_pdf(pdf_path)
-                        if text:
-                            from langchain_core.documents import Document
-                            documents.append(Document(page_content=text, metadata={"source": os.path.basename(pdf_path)}))
-                            source_names.append(os.path.basename(pdf_path))
-                            
-            elif source_type == 'csv':
-                file_paths = source_config.get('file_paths', [])
-                source = CSVSource(file_paths)
-                documents = source.extract_documents()
-                source_names = [os.path.basename(f) for f in file_paths]
-                
-            elif source_type == 'word':
-                file_paths = source_config.get('file_paths', [])
-                source = WordSource(file_paths)
-                documents = source.extract_documents()
-                source_names = [os.path.basename(f) for f in file_paths]
-                
-            elif source_type == 'sql':
-                connection_string = source_config.get('connection_string', '')
-                tables = source_config.get('tables', None)
-                sample_limit = source_config.get('sample_limit', 1000)
-                
-                if not connection_string:
-                    return {"success": False, "error": "SQL connection string is required"}
-                
-                source = SQLSource(connection_string, tables=tables, sample_limit=sample_limit)
-                documents = source.extract_documents()
-                source_names = [f"SQL: {len(tables) if tables else 'all'} tables"]
-                
-            elif source_type == 'nosql':
-                connection_string = source_config.get('connection_string', '')
-                database = source_config.get('database', '')
-                collections = source_config.get('collections', None)
-                sample_limit = source_config.get('sample_limit', 1000)
-                
-                if not connection_string or not database:
-                    return {"success": False, "error": "MongoDB connection string and database are required"}
-                
-                source = NoSQLSource(connection_string, database, collections=collections, sample_limit=sample_limit)
-                documents = source.extract_documents()
-                source_names = [f"MongoDB: {database}"]
-                
-            else:
-                return {"success": False, "error": f"Unsupported source type: {source_type}"}
+            self._report_progress(progress_callback, "extracting")
+            chunking = self._agent_chunking(agent_key)
+            try:
+                documents, source_names, extraction = self._load_source_documents(
+                    source_type, source_config, chunking, progress_callback
+                )
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
             
             if not documents:
                 return {"success": False, "error": "No documents could be extracted from the source"}
             
             # Split into chunks
-            all_text = "\n\n".join([doc.page_content for doc in documents])
-            
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=400,
-                chunk_overlap=50,
-                length_function=len
-            )
-            chunks = text_splitter.split_text(all_text)
+            self._report_progress(progress_callback, "splitting")
+            chunks, chunk_sources = self._split_by_source(documents, source_type, source_names, chunking)
             
             if not chunks:
                 return {"success": False, "error": "No text chunks created from new source"}
             
+            # Collapse repeated chunks before they are embedded
+            chunks, chunk_sources, dedup_stats = self._dedup_chunks(chunks, chunk_sources, self._agent_dedup(agent_key))
+            
             # Create new vectorstore from new chunks
-            new_vectorstore = FAISS.from_texts(
-                texts=chunks,
-                embedding=self.embeddings
+            new_vectorstore, chunk_map, cache_stats, embed_stats = self._build_vectorstore(
+                chunks, chunk_sources, progress_callback, agent_key=agent_key
             )
             
-            # Merge new vectorstore into existing one
-            existing_vectorstore.merge_from(new_vectorstore)
-            
-            # Save updated FAISS index
-            agent_path = self.get_agent_path(agent_name, user_id)
-            existing_vectorstore.save_local(agent_path)
+            # Write new chunks as their own segment (existing segments are untouched)
+            self._report_progress(progress_callback, "saving")
+            existing_vectorstore = self._append_chunks(agent_key, new_vectorstore, chunk_map)
+            existing_vectorstore.schedule_compaction()
             
             # Update metadata
             existing_sources = self.agents[agent_key].get("source_files", [])
@@ -747,15 +1104,596 @@ class RAGAgentSystem:
                 "source_type": source_type,
                 "new_chunks_added": len(chunks),
                 "total_chunks": new_total_chunks,
-                "sources_added": source_names
+                "sources_added": source_names,
+                "dedup": dedup_stats,
+                "extraction": extraction,
+                "embedding_cache": cache_stats,
+                "embedding": embed_stats
             }
-            
+        
         except Exception as e:
             print(f"[ERROR] Failed to update agent data: {e}")
             return {"success": False, "error": str(e)}
     
-    def query_agent(self, agent_name: str, query: str, user_id: str, k: int = 4) -> dict:
-        """Query an agent with a question"""
+    def sync_agent_sql(self, agent_name: str, user_id: str, source_config: Dict[str, Any],
+                       progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Incrementally re-sync an agent's SQL tables.
+        
+        Only rows past each table's watermark (stored in the agent's sync_state)
+        are extracted. Their previous chunks are replaced and unchanged rows are
+        left alone, so a refresh costs time proportional to the changes. The
+        first sync of a table indexes every row keyed by primary key and
+        replaces that table's rows from the agent's bulk-loaded SQL sources
+        ("SQL: ..."); tables that cannot be synced, and schema chunks, keep
+        their bulk-loaded chunks. Rows deleted from the database are not detected.
+        
+        Args:
+            agent_name: Name of the existing agent
+            user_id: User ID who owns the agent
+            source_config: SQL configuration (connection_string, optional tables)
+            progress_callback: Optional callable receiving progress updates
+        """
+        connection_string = source_config.get('connection_string', '')
+        if not connection_string:
+            return {"success": False, "error": "SQL connection string is required"}
+        
+        def extract(watermarks):
+            source = SQLSource(connection_string, tables=source_config.get('tables'))
+            documents, new_watermarks, unsupported = source.extract_changes(watermarks)
+            return documents, new_watermarks, {}, unsupported
+        
+        return self._sync_records(agent_name, user_id, "tables", "SQL: ", "table_name", extract, progress_callback)
+    
+    def sync_agent_nosql(self, agent_name: str, user_id: str, source_config: Dict[str, Any],
+                         progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Incrementally re-sync an agent's MongoDB collections.
+        
+        Each collection resumes from a change stream token (replica sets), an
+        updated_at-style watermark or its last ObjectId. Only new or modified
+        documents are re-embedded, replacing their chunks by document_id;
+        deletions are applied when a change stream is available. The first sync
+        of a collection that indexes its documents replaces that collection's
+        chunks from the agent's bulk-loaded "MongoDB: ..." sources.
+        
+        Args:
+            agent_name: Name of the existing agent
+            user_id: User ID who owns the agent
+            source_config: NoSQL configuration (connection_string, database, optional
+                collections, projection, exclude_fields, batch_size)
+            progress_callback: Optional callable receiving progress updates
+        """
+        connection_string = source_config.get('connection_string', '')
+        database = source_config.get('database', '')
+        if not connection_string or not database:
+            return {"success": False, "error": "MongoDB connection string and database name are required"}
+        
+        def extract(resume_points):
+            source = NoSQLSource(connection_string, database, collections=source_config.get('collections'),
+                                 projection=source_config.get('projection'),
+                                 exclude_fields=source_config.get('exclude_fields'),
+                                 batch_size=source_config.get('batch_size', 1000))
+            return source.extract_changes(resume_points)
+        
+        return self._sync_records(agent_name, user_id, "collections", "MongoDB: ", "collection_name",
+                                  extract, progress_callback)
+    
+    @agent_write
+    def _sync_records(self, agent_name: str, user_id: str, state_key: str, bulk_prefix: str, bulk_field: str,
+                      extract: Callable[[dict], Tuple[List[Document], Dict[str, dict], Dict[str, List[str]], List[str]]],
+                      progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Apply an incremental sync of keyed records (SQL rows, MongoDB documents).
+        
+        extract receives the stored resume points and returns the changed
+        documents, the new resume points, deleted record keys per source and
+        the unsupported tables/collections. Changed records' old chunks are
+        replaced; deleted records' chunks are removed. Resume points are kept in
+        agent["sync_state"][state_key].
+        
+        Bulk-loaded sources (names starting with bulk_prefix) hold the records
+        of many tables/collections, told apart by the bulk_field metadata. When
+        a table/collection is first indexed by a sync, its bulk chunks are
+        removed; schema chunks and everything not synced stay.
+        """
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        agent = self.agents[agent_key]
+        if agent.get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            try:
+                vectorstore = self._get_vectorstore(agent_key)
+            except Exception as e:
+                return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
+            
+            sync_state = agent.get("sync_state", {})
+            resume_points = sync_state.get(state_key, {})
+            
+            self._report_progress(progress_callback, "extracting")
+            try:
+                documents, new_points, deleted, unsupported = extract(resume_points)
+            except ConnectionError as e:
+                return {"success": False, "error": str(e)}
+            
+            if not new_points:
+                return {
+                    "success": False,
+                    "error": "Nothing can be synced incrementally (no usable primary key, watermark or change stream)",
+                    "unsupported": unsupported
+                }
+            
+            self._report_progress(progress_callback, "splitting")
+            chunking = self._agent_chunking(agent_key)
+            chunks, chunk_sources = self._split_by_source(documents, 'sync', [bulk_prefix], chunking, keyed_records=True)
+            
+            # Chunks indexed for changed or deleted records by earlier syncs
+            stale_records = defaultdict(set)
+            for doc in documents:
+                stale_records[doc.metadata["source"]].add(doc.metadata["record_key"])
+            for source_name, keys in deleted.items():
+                stale_records[source_name].update(keys)
+            old_chunk_ids = [chunk_id for source_name, keys in stale_records.items()
+                             for chunk_id in vectorstore.record_chunk_ids(source_name, list(keys))]
+            
+            # Tables/collections indexed by a sync for the first time take over from bulk loads
+            indexed = {name for name, point in new_points.items() if point.get("mode") != "full"}
+            indexed.update(doc.metadata["source"] for doc in documents)
+            taken_over = {name for name in indexed
+                          if name not in resume_points or resume_points[name].get("mode") == "full"}
+            bulk_sources = [name for name in agent.get("source_files", []) if str(name).startswith(bulk_prefix)]
+            bulk_chunk_ids = []
+            if taken_over and bulk_sources:
+                bulk_ids = {chunk_id for name in bulk_sources for chunk_id in vectorstore.source_chunk_ids(name)}
+                bulk_chunk_ids = [chunk_id for chunk_id, doc in vectorstore.iter_chunks()
+                                  if chunk_id in bulk_ids and not doc.metadata.get("is_schema")
+                                  and doc.metadata.get(bulk_field) in taken_over]
+            
+            cache_stats = embed_stats = None
+            if chunks:
+                new_vectorstore, chunk_map, cache_stats, embed_stats = self._build_vectorstore(
+                    chunks, chunk_sources, progress_callback, agent_key=agent_key
+                )
+                # chunk_map is in chunk order
+                chunk_records = {chunk_id: chunk.metadata.get("record_key")
+                                 for chunk_id, chunk in zip(chunk_map, chunks)}
+                
+                # New versions go in before old ones are removed, as in replace_agent_source
+                self._report_progress(progress_callback, "saving")
+                vectorstore = self._append_chunks(agent_key, new_vectorstore, chunk_map, chunk_records)
+            
+            stale_ids = old_chunk_ids + bulk_chunk_ids
+            removed = vectorstore.delete_ids(stale_ids) if stale_ids else 0
+            for name in bulk_sources:
+                if not vectorstore.source_chunk_ids(name):
+                    self._forget_source(agent_key, name)
+            vectorstore.schedule_compaction()
+            
+            now = datetime.now().isoformat()
+            source_files = agent.get("source_files", [])
+            agent["source_files"] = source_files + [name for name in new_points if name not in source_files]
+            agent["num_documents"] = max(0, agent.get("num_documents", 0) - removed) + len(chunks)
+            agent["sync_state"] = {**sync_state, state_key: {**resume_points, **new_points}, "last_synced_at": now}
+            agent["updated_at"] = now
+            self.save_agent_to_db(agent_key, agent)
+            
+            return {
+                "success": True,
+                "agent_name": agent_name,
+                "records_changed": len(documents),
+                "records_deleted": sum(len(keys) for keys in deleted.values()),
+                "chunks_added": len(chunks),
+                "chunks_removed": removed,
+                "total_chunks": agent["num_documents"],
+                "synced": list(new_points),
+                "unsupported": unsupported,
+                "embedding_cache": cache_stats,
+                "embedding": embed_stats
+            }
+        
+        except Exception as e:
+            print(f"[ERROR] Failed to sync agent {agent_name}: {e}")
+            return {"success": False, "error": str(e)}
+    
+    @agent_write
+    def set_agent_storage(self, agent_name: str, user_id: str, precision: Optional[str] = None,
+                          dimensions: Optional[int] = None) -> dict:
+        """
+        Choose how an agent's vectors are held in memory: float32, float16 or
+        binary (a Hamming-distance first stage for the largest agents),
+        optionally truncated to the first `dimensions` dimensions (Matryoshka
+        models only). Compact storage rescores its candidates in float32, more
+        of them for larger query k. Files on disk keep float32 vectors, so
+        nothing is re-embedded; segments are rebuilt from them in place.
+        """
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        agent = self.agents[agent_key]
+        if agent.get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            storage = self._storage_settings(precision, dimensions, self._agent_embedding_spec(agent_key))
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        
+        try:
+            vectorstore = self._get_vectorstore(agent_key)
+        except Exception as e:
+            return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
+        
+        memory_before = vectorstore.memory_bytes
+        vectorstore.set_storage(storage)
+        
+        agent["storage"] = storage
+        agent["updated_at"] = datetime.now().isoformat()
+        self.save_agent_to_db(agent_key, agent)
+        
+        return {
+            "success": True,
+            "agent_name": agent_name,
+            "storage": storage,
+            "memory_mb_before": round(memory_before / (1024 * 1024), 2),
+            "memory_mb": round(vectorstore.memory_bytes / (1024 * 1024), 2)
+        }
+    
+    def get_storage_report(self, agent_name: str, user_id: str, k: int = 4,
+                           queries: Optional[List[str]] = None) -> dict:
+        """
+        Recall@k against exact float32 search, and vector memory, of each
+        storage option for an agent. queries are embedded with the agent's
+        model; without them a sample of the agent's own chunks is used.
+        Truncated options are only listed for Matryoshka models.
+        """
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        if self.agents[agent_key].get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            vectorstore = self._get_vectorstore(agent_key)
+        except Exception as e:
+            return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
+        
+        dimension = vectorstore.dimension
+        if not dimension:
+            return {"success": False, "error": "Agent has no vectors"}
+        
+        spec = self._agent_embedding_spec(agent_key)
+        embeddings = self._agent_embeddings(agent_key)
+        
+        options = [storage_settings(precision) for precision in STORAGE_PRECISIONS]
+        if embeddings.matryoshka:
+            truncations = [dimension // 2, dimension // 4, dimension // 8]
+            for size in [d for d in truncations if d >= MIN_DIMENSIONS]:
+                options += [storage_settings(precision, size) for precision in STORAGE_PRECISIONS]
+        
+        try:
+            query_vectors = np.array(embeddings.embed_documents(queries), dtype=np.float32) if queries else None
+            report = recall_report(vectorstore.full_vectors(), options, k=k, queries=query_vectors)
+        except Exception as e:
+            return {"success": False, "error": f"Failed to build storage report: {str(e)}"}
+        
+        current = self._agent_storage(agent_key)
+        for option, row in zip(options, report):
+            row["current"] = option == current
+        
+        return {
+            "success": True,
+            "agent_name": agent_name,
+            "embedding": {**spec, "dimension": dimension},
+            "total_chunks": vectorstore.ntotal,
+            "k": k,
+            "queries": len(queries) if queries else "sampled from chunks",
+            "storage": current,
+            "options": report
+        }
+    
+    def list_agent_sources(self, agent_name: str, user_id: str) -> dict:
+        """List an agent's sources with the number of chunks tracked for each"""
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        agent = self.agents[agent_key]
+        if agent.get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            vectorstore = self._get_vectorstore(agent_key)
+        except Exception as e:
+            return {"success": False, "error": f"Error loading agent: {str(e)}"}
+        
+        tracked = dict(vectorstore.source_counts())
+        
+        # Agents created before chunk tracking have sources with no tracked chunks
+        sources = []
+        for name in dict.fromkeys(agent.get("source_files", agent.get("pdf_files", []))):
+            sources.append({"name": name, "chunks": tracked.pop(name, 0)})
+        for name, count in tracked.items():
+            sources.append({"name": name, "chunks": count})
+        
+        return {
+            "success": True,
+            "agent_name": agent_name,
+            "sources": sources,
+            "filters": vectorstore._filter_values(),
+            "total_chunks": vectorstore.ntotal
+        }
+    
+    @agent_write
+    def delete_agent_source(self, agent_name: str, user_id: str, source_name: str) -> dict:
+        """Remove one source's chunks from an agent without rebuilding its index"""
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        agent = self.agents[agent_key]
+        if agent.get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            vectorstore = self._get_vectorstore(agent_key)
+        except Exception as e:
+            return {"success": False, "error": f"Error loading agent: {str(e)}"}
+        
+        try:
+            removed = vectorstore.delete_source(source_name)
+        except Exception as e:
+            print(f"[ERROR] Failed to delete source {source_name}: {e}")
+            return {"success": False, "error": str(e)}
+        
+        if removed == 0:
+            return {
+                "success": False,
+                "error": f"No tracked chunks for source '{source_name}'. Sources added before "
+                         f"chunk tracking can only be removed by recreating the agent."
+            }
+        
+        vectorstore.schedule_compaction()
+        
+        self._forget_source(agent_key, source_name)
+        agent["num_documents"] = max(0, agent.get("num_documents", 0) - removed)
+        agent["updated_at"] = datetime.now().isoformat()
+        self.save_agent_to_db(agent_key, agent)
+        
+        return {
+            "success": True,
+            "agent_name": agent_name,
+            "source": source_name,
+            "chunks_removed": removed,
+            "total_chunks": agent["num_documents"]
+        }
+    
+    @agent_write
+    def replace_agent_source(self, agent_name: str, user_id: str, source_name: str,
+                             source_type: str, source_config: Dict[str, Any],
+                             progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Replace one source's chunks with freshly extracted ones.
+        
+        Only the new content is embedded; the old chunks are removed from the
+        segments holding them. The replacement keeps the original source name.
+        """
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        agent = self.agents[agent_key]
+        if agent.get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            try:
+                vectorstore = self._get_vectorstore(agent_key)
+            except Exception as e:
+                return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
+            
+            old_chunk_ids = vectorstore.source_chunk_ids(source_name)
+            if not old_chunk_ids:
+                return {"success": False, "error": f"No tracked chunks for source '{source_name}'"}
+            
+            self._report_progress(progress_callback, "extracting")
+            chunking = self._agent_chunking(agent_key)
+            try:
+                documents, _, extraction = self._load_source_documents(
+                    source_type, source_config, chunking, progress_callback
+                )
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            
+            if not documents:
+                return {"success": False, "error": "No documents could be extracted from the source"}
+            
+            self._report_progress(progress_callback, "splitting")
+            chunks, chunk_sources = self._split_by_source(documents, source_type, [source_name],
+                                                          chunking, source_name=source_name)
+            
+            if not chunks:
+                return {"success": False, "error": "No text chunks created from new source"}
+            
+            chunks, chunk_sources, dedup_stats = self._dedup_chunks(chunks, chunk_sources, self._agent_dedup(agent_key))
+            
+            new_vectorstore, chunk_map, cache_stats, embed_stats = self._build_vectorstore(
+                chunks, chunk_sources, progress_callback, agent_key=agent_key
+            )
+            
+            # Add the new version before removing the old one so queries never see neither
+            self._report_progress(progress_callback, "saving")
+            vectorstore = self._append_chunks(agent_key, new_vectorstore, chunk_map)
+            removed = vectorstore.delete_ids(old_chunk_ids)
+            vectorstore.schedule_compaction()
+            
+            self._forget_source(agent_key, source_name)
+            agent["source_files"] = agent.get("source_files", []) + [source_name]
+            agent["num_documents"] = max(0, agent.get("num_documents", 0) - removed) + len(chunks)
+            agent["updated_at"] = datetime.now().isoformat()
+            self.save_agent_to_db(agent_key, agent)
+            
+            return {
+                "success": True,
+                "agent_name": agent_name,
+                "source": source_name,
+                "chunks_removed": removed,
+                "chunks_added": len(chunks),
+                "total_chunks": agent["num_documents"],
+                "dedup": dedup_stats,
+                "extraction": extraction,
+                "embedding_cache": cache_stats,
+                "embedding": embed_stats
+            }
+        
+        except Exception as e:
+            print(f"[ERROR] Failed to replace source {source_name}: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def _forget_source(self, agent_key: str, source_name: str):
+        """Drop a source name from an agent's source lists"""
+        agent = self.agents[agent_key]
+        for field in ("source_files", "pdf_files"):
+            if isinstance(agent.get(field), list):
+                agent[field] = [name for name in agent[field] if name != source_name]
+    
+    @agent_write
+    def reembed_agent(self, agent_name: str, user_id: str, embedding_backend: Optional[str] = None,
+                      embedding_model: Optional[str] = None,
+                      progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Re-embed an agent's chunks with another embedding model (by default
+        the one for new agents) and swap the new index in.
+        
+        Chunk texts, metadata, sources and record keys come from the existing
+        index, so the original files and databases are not needed. Chunks
+        longer than the new model's window are split again. The old index
+        keeps answering queries until the new one is in place.
+        
+        Args:
+            agent_name: Name of the existing agent
+            user_id: User ID who owns the agent
+            embedding_backend: Backend to move to ('ollama', 'onnx', 'hash')
+            embedding_model: Model to move to (default: the backend's default model)
+            progress_callback: Optional callable receiving progress updates
+        """
+        agent_key = self.get_agent_key(agent_name, user_id)
+        
+        if agent_key not in self.agents:
+            return {"success": False, "error": f"Agent '{agent_name}' not found"}
+        
+        agent = self.agents[agent_key]
+        if agent.get("user_id") != user_id:
+            return {"success": False, "error": "Access denied"}
+        
+        try:
+            embeddings = self._embedding_settings(embedding_backend, embedding_model)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        
+        try:
+            try:
+                old_vectorstore = self._get_vectorstore(agent_key)
+            except Exception as e:
+                return {"success": False, "error": f"Failed to load existing agent: {str(e)}"}
+            
+            self._report_progress(progress_callback, "extracting")
+            stored = list(old_vectorstore.iter_chunks())
+            if not stored:
+                return {"success": False, "error": "Agent has no chunks to re-embed"}
+            entries = old_vectorstore.chunk_entries([chunk_id for chunk_id, _ in stored])
+            
+            # Keep the agent's chunk size unless the new model's window is smaller
+            self._report_progress(progress_callback, "splitting")
+            previous_chunking = self._agent_chunking(agent_key)
+            chunking = self._chunking_settings(previous_chunking["chunk_tokens"],
+                                               previous_chunking["overlap_tokens"], embeddings)
+            documents = [doc for _, doc in stored]
+            origins = [entries.get(chunk_id, (None, None)) for chunk_id, _ in stored]
+            
+            if chunking["chunk_tokens"] < previous_chunking["chunk_tokens"]:
+                splitter = StructuredSplitter(
+                    chunk_size=chunking["chunk_tokens"],
+                    chunk_overlap=chunking["overlap_tokens"],
+                    encoding=ENCODING
+                )
+                # Split chunk by chunk; pieces inherit their chunk's source and record
+                split_documents, split_origins = [], []
+                for doc, origin in zip(documents, origins):
+                    for _, piece in splitter.iter_chunks([doc]):
+                        split_documents.append(piece)
+                        split_origins.append(origin)
+                documents, origins = split_documents, split_origins
+            
+            chunk_sources = [source for source, _ in origins]
+            vectorstore, chunk_map, cache_stats, embed_stats = self._build_vectorstore(
+                documents, chunk_sources, progress_callback, embeddings=embeddings
+            )
+            
+            # Chunks missing from the registry (pre-registry agents) stay untracked
+            chunk_records = {chunk_id: record for chunk_id, (_, record) in zip(chunk_map, origins) if record}
+            chunk_map = {chunk_id: source for chunk_id, source in chunk_map.items() if source is not None}
+            
+            # Build the new index beside the old one, then swap the directories
+            self._report_progress(progress_callback, "saving")
+            agent_path = os.path.join(self.persist_directory, agent_key)
+            staging_path = agent_path + REEMBED_STAGING_SUFFIX
+            create_agent_store(
+                staging_path, embeddings, vectorstore, chunk_sources=chunk_map, chunk_records=chunk_records
+            ).close()
+            
+            old_vectorstore.close()
+            replace_agent_store(staging_path, agent_path)
+            new_embedding = {**embeddings.spec(), "dimension": vectorstore.index.d}
+            self.vectorstores[agent_key] = load_agent_store(
+                agent_path, embeddings, storage=self._agent_storage(agent_key, new_embedding)
+            )
+            
+            previous_embedding = self._agent_embedding_spec(agent_key)
+            agent["embedding"] = new_embedding
+            agent["chunking"] = chunking
+            agent["num_documents"] = len(documents)
+            agent["updated_at"] = datetime.now().isoformat()
+            self.save_agent_to_db(agent_key, agent)
+            
+            print(f"[OK] Re-embedded agent '{agent_name}' with {embeddings.backend}:{embeddings.model} "
+                  f"({len(stored)} -> {len(documents)} chunks)")
+            
+            return {
+                "success": True,
+                "agent_name": agent_name,
+                "previous_embedding_model": previous_embedding,
+                "embedding_model": agent["embedding"],
+                "chunks_before": len(stored),
+                "total_chunks": len(documents),
+                "chunking": chunking,
+                "embedding_cache": cache_stats,
+                "embedding": embed_stats
+            }
+        
+        except Exception as e:
+            print(f"[ERROR] Failed to re-embed agent {agent_name}: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def query_agent(self, agent_name: str, query: str, user_id: str, k: int = 4,
+                    filter: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        Query an agent with a question.
+        
+        filter optionally restricts retrieval by chunk metadata before scoring,
+        e.g. {"table_name": "orders"} or {"source": ["a.csv", "b.csv"], "is_schema": False}.
+        """
         
         agent_key = self.get_agent_key(agent_name, user_id)
         
@@ -770,20 +1708,16 @@ class RAGAgentSystem:
         domain = agent_info.get("domain", "general knowledge")
         
         # Load vectorstore if not already loaded
-        if agent_key not in self.vectorstores:
-            agent_path = self.get_agent_path(agent_name, user_id)
-            try:
-                self.vectorstores[agent_key] = FAISS.load_local(
-                    agent_path, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-            except Exception as e:
-                return {"success": False, "error": f"Error loading agent: {str(e)}"}
+        try:
+            vectorstore = self._get_vectorstore(agent_key)
+        except Exception as e:
+            return {"success": False, "error": f"Error loading agent: {str(e)}"}
         
         try:
-            vectorstore = self.vectorstores[agent_key]
-            retriever = vectorstore.as_retriever(search_kwargs={"k": k})
+            search_kwargs = {"k": k}
+            if filter:
+                search_kwargs["filter"] = filter
+            retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
             
             # Create prompt
             prompt = ChatPromptTemplate.from_template(self.SYSTEM_PROMPT_TEMPLATE)
@@ -825,6 +1759,7 @@ class RAGAgentSystem:
                 "success": True,
                 "answer": answer,
                 "source_documents": [doc.page_content for doc in source_docs],
+                "source_metadata": [doc.metadata for doc in source_docs],
                 "agent_name": agent_name,
                 "token_usage": token_usage
             }
@@ -876,12 +1811,18 @@ class RAGAgentSystem:
             "description": agent.get("description", ""),
             "pdf_files": agent.get("pdf_files", []),
             "num_documents": agent.get("num_documents", 0),
+            "chunking": agent.get("chunking"),
+            "dedup": agent.get("dedup"),
+            "embedding": agent.get("embedding") or LEGACY_SPEC,
+            "storage": self._agent_storage(agent_key),
+            "sync_state": agent.get("sync_state"),
             "embed_token": agent.get("embed_token"),
             "embed_enabled": agent.get("embed_enabled", False),
             "user_id": agent.get("user_id"),
             "created_at": agent.get("created_at")
         }
     
+    @agent_write
     def delete_agent(self, agent_name: str, user_id: str) -> dict:
         """Delete an agent and its data"""
         
@@ -901,11 +1842,12 @@ class RAGAgentSystem:
                 if token in self.embed_tokens:
                     del self.embed_tokens[token]
             
-            # Delete FAISS index from disk
-            agent_path = self.get_agent_path(agent_name, user_id)
-            if os.path.exists(agent_path):
-                import shutil
-                shutil.rmtree(agent_path)
+            # Let any background compaction finish before removing files
+            if agent_key in self.vectorstores:
+                self.vectorstores[agent_key].close()
+            
+            # Delete the index from disk (its directory or packed record)
+            remove_agent_store(self.get_agent_path(agent_name, user_id))
             
             # Remove from memory
             if agent_key in self.vectorstores:
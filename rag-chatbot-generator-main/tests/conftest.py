@@ -0,0 +1,79 @@
+"""
+Shared test setup: the app modules on sys.path, the hash embedding
+backend, no MongoDB, and a word-level tokenizer when tiktoken cannot
+download cl100k_base (offline runs).
+"""
+import os
+import re
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault('EMBEDDING_BACKEND', 'hash')
+
+import tiktoken
+
+
+class WordEncoding:
+    """Stand-in for a tiktoken encoding: one token per word, space run or symbol"""
+    name = "words"
+
+    def __init__(self):
+        self.tokens = {}
+        self.texts = {}
+
+    def encode_ordinary(self, text):
+        ids = []
+        for piece in re.findall(r"\w+|\s+|[^\w\s]", text):
+            if piece not in self.tokens:
+                self.tokens[piece] = len(self.tokens)
+                self.texts[self.tokens[piece]] = piece
+            ids.append(self.tokens[piece])
+        return ids
+
+    def encode(self, text, **kwargs):
+        return self.encode_ordinary(text)
+
+    def encode_ordinary_batch(self, texts, **kwargs):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def encode_batch(self, texts, **kwargs):
+        return self.encode_ordinary_batch(texts)
+
+    def decode(self, ids):
+        return "".join(self.texts[i] for i in ids)
+
+    def decode_with_offsets(self, ids):
+        offsets, position = [], 0
+        for i in ids:
+            offsets.append(position)
+            position += len(self.texts[i])
+        return self.decode(ids), offsets
+
+
+try:
+    tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _words = WordEncoding()
+    tiktoken.get_encoding = lambda name: _words
+
+import db
+
+# Agents and jobs are kept in memory only
+db.get_database = lambda: None
+
+
+@pytest.fixture(scope="session")
+def embedding():
+    """The hash embedding backend (deterministic, no model)"""
+    from embedding_backends import create_backend
+    return create_backend("hash")
+
+
+@pytest.fixture
+def rag_system(tmp_path):
+    """A RAGAgentSystem persisting to a temporary directory"""
+    from rag_agent_system import RAGAgentSystem
+    return RAGAgentSystem(persist_directory=str(tmp_path / "faiss_db"))
@@ -0,0 +1,16 @@
+"""Helpers shared by the vector store tests"""
+from langchain_community.vectorstores import FAISS
+
+
+def faiss_chunks(embedding, prefix, count, source):
+    """A FAISS store of count chunks with ids prefix0..prefixN, all from source"""
+    ids = [f"{prefix}{i}" for i in range(count)]
+    store = FAISS.from_texts([f"{source} chunk {prefix} number {i}" for i in range(count)], embedding,
+                             metadatas=[{"source": source, "table_name": source, "cid": cid} for cid in ids],
+                             ids=ids)
+    return store, {cid: source for cid in ids}
+
+
+def searched_ids(store, embedding, k=100, **kwargs):
+    query = embedding.embed_query("chunk number")
+    return {doc.metadata["cid"] for doc in store.similarity_search_by_vector(query, k, **kwargs)}
@@ -0,0 +1,70 @@
+"""Concurrent writes to the same agent through RAGAgentSystem"""
+import threading
+
+
+def write_csv(tmp_path, name, rows):
+    path = tmp_path / name
+    path.write_text("id,text\n" + "".join(f"{i},row {name} {i} with a few words\n" for i in range(rows)))
+    return str(path)
+
+
+def run_together(calls):
+    results = [None] * len(calls)
+
+    def run(index, call):
+        results[index] = call()
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_updates_keep_every_source(rag_system, tmp_path):
+    assert rag_system.create_agent_from_source("alpha", "csv", {"file_paths": [write_csv(tmp_path, "base.csv", 5)]}, "u1")["success"]
+    paths = [write_csv(tmp_path, f"update{i}.csv", 20) for i in range(4)]
+
+    results = run_together([
+        lambda path=path: rag_system.update_agent_data("alpha", "u1", "csv", {"file_paths": [path]})
+        for path in paths
+    ])
+
+    assert all(result["success"] for result in results)
+    agent_key = rag_system.get_agent_key("alpha", "u1")
+    agent = rag_system.agents[agent_key]
+    store = rag_system._get_vectorstore(agent_key)
+    assert agent["num_documents"] == store.ntotal
+    assert len(agent["source_files"]) == 5
+    assert {name for name, _ in store.source_counts()} >= set(agent["source_files"])
+
+
+def test_concurrent_creates_register_one_agent(rag_system, tmp_path):
+    paths = [write_csv(tmp_path, f"create{i}.csv", 10) for i in range(3)]
+
+    results = run_together([
+        lambda path=path: rag_system.create_agent_from_source("beta", "csv", {"file_paths": [path]}, "u1")
+        for path in paths
+    ])
+
+    assert sum(result["success"] for result in results) == 1
+    agent = rag_system.agents[rag_system.get_agent_key("beta", "u1")]
+    assert len(agent["source_files"]) == 1
+
+
+def test_update_during_reembed_uses_one_embedding_model(rag_system, tmp_path):
+    assert rag_system.create_agent_from_source("gamma", "csv", {"file_paths": [write_csv(tmp_path, "base.csv", 30)]}, "u1")["success"]
+    update_path = write_csv(tmp_path, "more.csv", 30)
+
+    results = run_together([
+        lambda: rag_system.reembed_agent("gamma", "u1", embedding_backend="hash", embedding_model="hash-256"),
+        lambda: rag_system.update_agent_data("gamma", "u1", "csv", {"file_paths": [update_path]})
+    ])
+
+    assert all(result["success"] for result in results), results
+    agent_key = rag_system.get_agent_key("gamma", "u1")
+    store = rag_system._get_vectorstore(agent_key)
+    assert rag_system.agents[agent_key]["embedding"]["model"] == "hash-256"
+    assert store.dimension == 256
+    assert rag_system.agents[agent_key]["num_documents"] == store.ntotal
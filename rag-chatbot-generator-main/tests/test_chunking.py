@@ -0,0 +1,107 @@
+"""Structure-aware splitter: record packing, group boundaries, long documents, streaming, token budgets"""
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from chunking import StructuredSplitter, RECORD_SEPARATOR
+
+
+def record(text, **metadata):
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_records_are_packed_without_being_cut():
+    splitter = StructuredSplitter(chunk_size=30, chunk_overlap=5)
+    rows = [record(f"row {i} value {i}") for i in range(10)]
+
+    chunks = list(splitter.split_documents(rows))
+
+    assert all(len(chunk.page_content) <= 30 for chunk in chunks)
+    assert len(chunks) < len(rows)
+    packed = [part for chunk in chunks for part in chunk.page_content.split(RECORD_SEPARATOR)]
+    assert packed == [row.page_content for row in rows]
+
+
+def test_chunks_never_span_two_groups():
+    splitter = StructuredSplitter(chunk_size=200, chunk_overlap=10)
+    rows = [record(f"{table} row {i}", table_name=table) for table in ("orders", "users") for i in range(3)]
+
+    keyed = list(splitter.iter_chunks(rows, group_key=lambda doc: doc.metadata["table_name"]))
+
+    assert [key for key, _ in keyed] == ["orders", "users"]
+    assert keyed[0][1].page_content == RECORD_SEPARATOR.join(f"orders row {i}" for i in range(3))
+    assert keyed[1][1].metadata == {"table_name": "users"}
+
+
+def test_packed_chunk_keeps_only_shared_metadata():
+    splitter = StructuredSplitter(chunk_size=200, chunk_overlap=10)
+    rows = [record("first", source="a.csv", row=1), record("second", source="a.csv", row=2)]
+
+    [chunk] = list(splitter.split_documents(rows))
+
+    assert chunk.metadata == {"source": "a.csv"}
+
+
+def test_long_document_is_split_on_its_own_at_separators():
+    splitter = StructuredSplitter(chunk_size=60, chunk_overlap=10)
+    paragraph = "This sentence is part of a long paragraph. " * 6
+    documents = [record("short before"), record(paragraph, source="long"), record("short after")]
+
+    chunks = list(splitter.split_documents(documents))
+
+    assert chunks[0].page_content == "short before"
+    assert chunks[-1].page_content == "short after"
+    pieces = chunks[1:-1]
+    assert len(pieces) > 1
+    assert all(piece.metadata == {"source": "long"} for piece in pieces)
+    assert all(len(piece.page_content) <= 60 for piece in pieces)
+    # Cuts fall after a sentence, not inside a word
+    assert all(piece.page_content.endswith(".") for piece in pieces[:-1])
+
+
+def test_blank_records_are_skipped():
+    splitter = StructuredSplitter(chunk_size=50, chunk_overlap=5)
+
+    chunks = list(splitter.split_documents([record(""), record("   "), record("kept")]))
+
+    assert [chunk.page_content for chunk in chunks] == ["kept"]
+
+
+def test_documents_are_consumed_lazily():
+    splitter = StructuredSplitter(chunk_size=20, chunk_overlap=5)
+    consumed = []
+
+    def rows():
+        for i in range(1000):
+            consumed.append(i)
+            yield record(f"row number {i}")
+
+    first = next(splitter.split_documents(rows()))
+
+    assert first.page_content == "row number 0"
+    assert len(consumed) < 10
+
+
+def test_token_sized_chunks_fit_the_budget():
+    from token_counter import ENCODING
+    splitter = StructuredSplitter(chunk_size=40, chunk_overlap=8, encoding=ENCODING)
+    text = " ".join(f"word{i} appears in sentence {i // 10}." for i in range(200))
+    rows = [record(f"short row {i}") for i in range(20)]
+
+    chunks = list(splitter.split_documents(rows + [record(text)]))
+
+    assert all(len(ENCODING.encode_ordinary(chunk.page_content)) <= 40 for chunk in chunks)
+    pieces = [chunk.page_content for chunk in chunks if "appears" in chunk.page_content]
+    assert len(pieces) > 5
+    # Neighbouring pieces of the long document share their overlap
+    assert all(set(first.split()[-4:]) & set(second.split()[:12]) for first, second in zip(pieces, pieces[1:]))
+
+
+def test_chunk_size_is_clamped_to_the_model_window(rag_system):
+    small_model = SimpleNamespace(context_window=100)
+
+    assert rag_system._chunking_settings(1000, 500, small_model) == {"chunk_tokens": 90, "overlap_tokens": 45}
+    assert rag_system._chunking_settings(None, None) == {
+        "chunk_tokens": rag_system.DEFAULT_CHUNK_TOKENS, "overlap_tokens": rag_system.DEFAULT_OVERLAP_TOKENS}
+    assert rag_system._chunking_settings(1, 0)["chunk_tokens"] == rag_system.MIN_CHUNK_TOKENS
+    assert rag_system._chunking_settings(5000)["chunk_tokens"] == rag_system.MAX_CHUNK_TOKENS
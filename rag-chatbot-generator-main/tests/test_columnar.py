@@ -0,0 +1,79 @@
+"""Vectorized row rendering: Arrow batches render as rows of Python values do; Parquet documents"""
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+from data_sources.columnar import render_row, render_rows
+from data_sources.parquet_source import ParquetSource
+
+COLUMNS = {
+    "id": pa.array([1, 2, 3]),
+    "price": pa.array([1.0, 2.5, 1.5e-7]),
+    "active": pa.array([True, False, None]),
+    "name": pa.array(["  padded  ", "", "plain"]),
+    "created": pa.array([datetime(2024, 1, 2, 3, 4, 5), datetime(2024, 1, 2, 3, 4, 5, 250000), None]),
+    "seen": pa.array([datetime(2024, 5, 6, 7, 8, 9, tzinfo=timezone.utc)] * 3, pa.timestamp("us", tz="UTC")),
+    "day": pa.array([date(2024, 1, 2), None, date(1999, 12, 31)]),
+    "at": pa.array([time(9, 30), time(9, 30, 1, 500), None]),
+    "amount": pa.array([Decimal("10.50"), None, Decimal("-3.25")]),
+    "blob": pa.array([b"\x00\x01", None, b"x"]),
+    "tags": pa.array([["a", "b"], [], None]),
+    "wait": pa.array([timedelta(seconds=90), None, timedelta(days=1)]),
+    "kind": pa.array(["x", "y", "x"]).dictionary_encode()
+}
+
+
+def test_vectorized_rendering_matches_row_rendering():
+    batch = pa.RecordBatch.from_pydict(COLUMNS)
+    names = batch.schema.names
+
+    vectorized = render_rows(batch).to_pylist()
+    per_row = [render_row(row.values(), names) for row in batch.to_pylist()]
+
+    assert vectorized == per_row
+    assert vectorized[0].splitlines()[:4] == ["id: 1", "price: 1", "active: true", "name: padded"]
+    assert "price: 1.5e-7" in vectorized[2]
+    assert "created: 2024-01-02 03:04:05.250000" in vectorized[1]
+    assert "seen: 2024-05-06 07:08:09Z" in vectorized[0]
+    assert not any("blob" in text for text in vectorized)
+
+
+def test_blank_rows_render_empty():
+    batch = pa.RecordBatch.from_pydict({"a": pa.array([None, "x"]), "b": pa.array(["  ", None])})
+
+    assert render_rows(batch).to_pylist() == ["", "a: x"]
+    assert render_row([None, "  "], ["a", "b"]) == ""
+
+
+@pytest.fixture
+def parquet_file(tmp_path):
+    path = tmp_path / "items.parquet"
+    ids = [None if i == 5 else i for i in range(25)]
+    names = [f"item {i}" if i % 7 and i != 5 else None for i in range(25)]
+    pq.write_table(pa.table({"id": ids, "name": names}), path)
+    return str(path)
+
+
+def test_parquet_rows_become_documents_across_batches(parquet_file):
+    documents = ParquetSource([parquet_file], batch_rows=4).extract_documents()
+
+    # Row 6 has no values: no document, and the rows after it keep their numbers
+    assert len(documents) == 24
+    assert [doc.metadata["row_number"] for doc in documents] == [n for n in range(1, 26) if n != 6]
+    by_row = {doc.metadata["row_number"]: doc.page_content for doc in documents}
+    assert by_row[9] == "id: 8\nname: item 8"
+    assert by_row[8] == "id: 7"
+
+
+def test_parquet_batched_documents_keep_row_ranges(parquet_file):
+    documents = ParquetSource([parquet_file], rows_per_document=3, batch_rows=10).extract_documents()
+
+    rows = [text for doc in documents for text in doc.page_content.split("\n\n")]
+    assert rows == [text for text in render_rows(pq.read_table(parquet_file)).to_pylist() if text]
+    # Blank row 6 does not count; groups also end at the record batch boundary (row 10)
+    assert [(doc.metadata["row_start"], doc.metadata["row_end"]) for doc in documents][:4] == [
+        (1, 3), (4, 7), (8, 10), (11, 13)]
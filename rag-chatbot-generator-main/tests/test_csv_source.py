@@ -0,0 +1,67 @@
+"""CSV parsing: parallel byte ranges match a serial parse; quoted newlines fall back before the pool starts"""
+import pytest
+
+from data_sources import csv_source
+from data_sources.csv_source import CSVSource
+
+
+def write_csv(path, rows, quoted_at=None):
+    with open(path, "w", newline="") as f:
+        f.write("id,name,notes\n")
+        for i in range(rows):
+            if i == quoted_at:
+                # A quoted field spanning many lines, longer than one byte range
+                f.write(f'{i},multi,"' + "\n".join(f"line {n}" for n in range(1500)) + '"\n')
+            else:
+                f.write(f"{i},name {i},plain note {i}\n")
+    return str(path)
+
+
+def parse(path, workers, **kwargs):
+    source = CSVSource([path], workers=workers, **kwargs)
+    documents = source.extract_documents()
+    return [(doc.page_content, doc.metadata) for doc in documents], source.rows_processed
+
+
+@pytest.fixture
+def small_ranges(monkeypatch):
+    monkeypatch.setattr(csv_source, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(csv_source, "PARALLEL_RANGE_BYTES", 16 * 1024)
+
+
+def test_parallel_parse_matches_serial(tmp_path, small_ranges):
+    path = write_csv(tmp_path / "data.csv", 3000)
+
+    parallel = parse(path, workers=2)
+    serial = parse(path, workers=1)
+
+    assert parallel == serial
+    assert parallel[1] == 3000
+
+
+def test_parallel_batches_keep_rows_in_file_order(tmp_path, small_ranges):
+    path = write_csv(tmp_path / "data.csv", 3000)
+
+    documents, rows = parse(path, workers=2, rows_per_document=7)
+
+    # Batches end at range boundaries, but rows and their numbers stay in order
+    lines = [line for content, _ in documents for line in content.splitlines()[1:]]
+    assert lines == [f"{i} | name {i} | plain note {i}" for i in range(3000)]
+    starts = [metadata["row_start"] for _, metadata in documents]
+    ends = [metadata["row_end"] for _, metadata in documents]
+    assert starts == [1] + [end + 1 for end in ends[:-1]]
+    assert (rows, ends[-1]) == (3000, 3000)
+
+
+def test_quoted_newline_across_a_boundary_is_parsed_serially(tmp_path, small_ranges, monkeypatch):
+    # Past the 64 KB sniffing sample, so only the boundary check can catch it
+    path = write_csv(tmp_path / "quoted.csv", 6000, quoted_at=4000)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("the process pool was started")
+
+    monkeypatch.setattr(csv_source, "ProcessPoolExecutor", no_pool)
+    documents, rows = parse(path, workers=2)
+
+    assert rows == 6000
+    assert sum("line 1499" in content for content, _ in documents) == 1
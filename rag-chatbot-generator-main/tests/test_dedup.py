@@ -0,0 +1,73 @@
+"""Chunk deduplication: exact, MinHash and SimHash modes, groups, and per-table groups on ingestion"""
+import sqlite3
+
+import pytest
+from langchain_core.documents import Document
+
+from dedup import deduplicate, content_hash
+
+LONG = ("The quarterly report covers revenue growth across every region, the new warehouse "
+        "opening in the north, hiring plans for the support team and the budget for next year. ")
+
+
+def test_exact_duplicates_ignore_whitespace():
+    kept, stats = deduplicate(["a  b\nc", "a b c", "a b d"], mode="exact")
+
+    assert kept == [0, 2]
+    assert stats == {"exact_duplicates": 1, "near_duplicates": 0}
+    assert content_hash(" x\ty ") == content_hash("x y")
+
+
+def test_off_keeps_everything():
+    assert deduplicate(["same", "same"], mode="off") == ([0, 1], {"exact_duplicates": 0, "near_duplicates": 0})
+
+
+@pytest.mark.parametrize("mode", ["minhash", "simhash"])
+def test_near_duplicates_collapse(mode):
+    texts = [LONG * 3, LONG * 3 + "Updated.", "An unrelated note about the office coffee machine and its repair."]
+
+    kept, stats = deduplicate(texts, mode=mode)
+
+    assert kept == [0, 2]
+    assert stats == {"exact_duplicates": 0, "near_duplicates": 1}
+
+
+@pytest.mark.parametrize("mode", ["exact", "minhash", "simhash"])
+def test_groups_are_never_compared(mode):
+    kept, _ = deduplicate([LONG, LONG, LONG], groups=["a", "b", "a"], mode=mode)
+
+    assert kept == [0, 1]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        deduplicate(["x"], mode="fuzzy")
+
+
+def test_chunks_of_one_source_are_grouped_by_table(rag_system):
+    chunks = [Document(page_content=LONG, metadata={"source": "db", "table_name": table})
+              for table in ("orders", "archive", "orders")]
+
+    kept, sources, stats = rag_system._dedup_chunks(chunks, ["SQL: all tables"] * 3, {"mode": "exact"})
+
+    assert [chunk.metadata["table_name"] for chunk in kept] == ["orders", "archive"]
+    assert stats["chunks_collapsed"] == 1
+
+
+def test_identical_tables_in_one_sql_load_keep_their_chunks(rag_system, tmp_path):
+    path = tmp_path / "shop.db"
+    conn = sqlite3.connect(path)
+    for name in ("orders", "orders_archive"):
+        conn.execute(f"create table {name} (id integer primary key, note text)")
+        conn.executemany(f"insert into {name} values (?, ?)", [(i, f"{LONG * 4} Order {i}.") for i in range(10)])
+    conn.commit()
+    conn.close()
+
+    result = rag_system.create_agent_from_source(
+        "shop", "sql", {"connection_string": f"sqlite:///{path}"}, "u1", dedup="minhash")
+
+    assert result["success"]
+    store = rag_system._get_vectorstore(rag_system.get_agent_key("shop", "u1"))
+    tables = [doc.metadata.get("table_name") for _, doc in store.iter_chunks() if not doc.metadata.get("is_schema")]
+    # Near-duplicate rows collapse inside each table, never across the two
+    assert tables.count("orders") == tables.count("orders_archive") > 0
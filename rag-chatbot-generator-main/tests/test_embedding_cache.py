@@ -0,0 +1,130 @@
+"""Content-addressed embedding cache: keys, model isolation, LRU eviction, CachedEmbeddings"""
+import hashlib
+import itertools
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, CachedEmbeddings, embedding_cache_key
+
+
+class CountingEmbeddings(Embeddings):
+    """Four-dimensional vectors derived from the text length; records every text embedded"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0, 2.0, 3.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 2.0, 3.0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache" / "embeddings.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing last_access times so LRU order is deterministic"""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_key_is_sha256_of_model_and_text():
+    expected = hashlib.sha256(b"model-a\x00hello").hexdigest()
+    assert embedding_cache_key("model-a", "hello") == expected
+    # The separator keeps ("ab", "c") and ("a", "bc") apart
+    assert embedding_cache_key("ab", "c") != embedding_cache_key("a", "bc")
+
+
+def test_round_trip_and_misses(cache):
+    cache.put_many("m", ["one", "two"], [[0.5, 1.0], [1.5, 2.0]])
+
+    assert cache.get_many("m", ["two", "three", "one"]) == [[1.5, 2.0], None, [0.5, 1.0]]
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_models_do_not_share_vectors(cache):
+    cache.put_many("model-a", ["same text"], [[1.0, 0.0]])
+
+    assert cache.get_many("model-b", ["same text"]) == [None]
+    assert cache.get_many("model-a", ["same text"]) == [[1.0, 0.0]]
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    first = EmbeddingCache(path)
+    first.put_many("m", ["kept"], [[1.0, 2.0]])
+    first.close()
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many("m", ["kept"]) == [[1.0, 2.0]]
+    assert reopened.get_stats()["entries"] == 1
+    reopened.close()
+
+
+def test_max_size_is_given_in_megabytes(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_size_mb=3)
+    assert cache.max_size_bytes == 3 * 1024 * 1024
+    assert cache.get_stats()["max_size_mb"] == 3
+    cache.close()
+
+
+def test_eviction_drops_least_recently_used_first(cache, clock):
+    # Four-dimensional float32 vectors are 16 bytes each; room for five
+    cache.max_size_bytes = 5 * 16
+    texts = [f"text {i}" for i in range(5)]
+    cache.put_many("m", texts, [[float(i)] * 4 for i in range(5)])
+
+    # Touch the oldest entry so it is no longer the least recently used
+    cache.get_many("m", ["text 0"])
+    cache.put_many("m", ["text 5"], [[5.0] * 4])
+
+    stats = cache.get_stats()
+    assert stats["evictions"] >= 1
+    assert stats["size_mb"] * 1024 * 1024 <= cache.max_size_bytes
+    assert cache.get_many("m", ["text 1"]) == [None]
+    assert cache.get_many("m", ["text 0"]) == [[0.0] * 4]
+    assert cache.get_many("m", ["text 5"]) == [[5.0] * 4]
+
+
+def test_cached_embeddings_only_embed_misses_once(cache):
+    model = CountingEmbeddings()
+    cached = CachedEmbeddings(model, cache, "counting")
+
+    first = cached.embed_documents(["a", "bb", "a"])
+    second = CachedEmbeddings(model, cache, "counting").embed_documents(["bb", "ccc"])
+
+    assert first == [[1.0, 1.0, 2.0, 3.0], [2.0, 1.0, 2.0, 3.0], [1.0, 1.0, 2.0, 3.0]]
+    assert second[0] == first[1]
+    assert model.embedded == ["a", "bb", "ccc"]
+    assert (cached.hits, cached.misses) == (0, 3)
+
+
+def test_cached_embeddings_are_scoped_by_model(cache):
+    model = CountingEmbeddings()
+    CachedEmbeddings(model, cache, "model-a").embed_documents(["shared"])
+    other_model = CachedEmbeddings(model, cache, "model-b")
+    other_model.embed_documents(["shared"])
+
+    assert model.embedded == ["shared", "shared"]
+    assert other_model.get_stats()["hits"] == 0
+
+
+def test_cached_embeddings_without_cache(cache):
+    model = CountingEmbeddings()
+    cached = CachedEmbeddings(model, None, "counting")
+
+    cached.embed_documents(["a", "a"])
+
+    assert model.embedded == ["a", "a"]
+    assert cached.get_stats() == {"enabled": False, "hits": 0, "misses": 2, "hit_rate": 0.0}
@@ -0,0 +1,138 @@
+"""Embedding dispatch: input order, retries with backoff, adaptive batch size, resuming through the cache"""
+import random
+import threading
+import time
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import embedding_dispatcher
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_dispatcher import EmbeddingDispatcher, EmbeddingDispatchError
+
+
+class ScriptedEmbeddings(Embeddings):
+    """One-dimensional vectors (the text's number); failures are scripted per call"""
+
+    def __init__(self, failures=(), delay=0.0):
+        self.failures = set(failures)
+        self.delay = delay
+        self.calls = 0
+        self.embedded = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        if call in self.failures:
+            raise ConnectionError(f"model server restarting (call {call})")
+        with self._lock:
+            self.embedded.extend(texts)
+        return [[float(text)] for text in texts]
+
+    def embed_query(self, text):
+        return [float(text)]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff delays instead of sleeping; jitter at its maximum"""
+    delays = []
+    monkeypatch.setattr(embedding_dispatcher.time, "sleep", delays.append)
+    monkeypatch.setattr(embedding_dispatcher.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def texts(count):
+    return [str(i) for i in range(count)]
+
+
+def test_vectors_come_back_in_input_order():
+    embedder = ScriptedEmbeddings(delay=0.01)
+    dispatcher = EmbeddingDispatcher(embedder, batch_size=8, max_in_flight=4)
+    progress = []
+
+    vectors = dispatcher.embed(texts(100), lambda done, total: progress.append(done))
+
+    assert vectors == [[float(i)] for i in range(100)]
+    assert progress[0] == 0 and progress[-1] == 100
+    assert progress == sorted(progress)
+
+
+def test_failed_batches_are_retried_with_exponential_backoff(sleeps):
+    embedder = ScriptedEmbeddings(failures={1, 2, 3})
+    dispatcher = EmbeddingDispatcher(embedder, batch_size=16, max_in_flight=1, max_retries=5)
+
+    vectors = dispatcher.embed(texts(16))
+
+    assert vectors == [[float(i)] for i in range(16)]
+    assert sleeps == [1.0, 2.0, 4.0]
+    assert dispatcher.get_stats()["retries"] == 3
+
+
+def test_batch_fails_after_every_retry(sleeps):
+    embedder = ScriptedEmbeddings(failures=set(range(1, 10)))
+    dispatcher = EmbeddingDispatcher(embedder, batch_size=16, max_retries=3)
+
+    with pytest.raises(EmbeddingDispatchError, match="after 3 attempts"):
+        dispatcher.embed(texts(16))
+    assert len(sleeps) == 2
+
+
+def test_failures_and_slow_batches_back_off():
+    dispatcher = EmbeddingDispatcher(ScriptedEmbeddings(), batch_size=64, max_in_flight=4, target_latency=1.0)
+
+    for _ in range(6):
+        dispatcher._record_success(0.1)
+    assert dispatcher.in_flight_limit > 2
+    assert dispatcher.batch_size == 64
+
+    dispatcher._record_success(5.0)
+    assert dispatcher.batch_size == 32
+
+    dispatcher._record_failure()
+    assert (dispatcher.in_flight_limit, dispatcher.batch_size) == (1.0, 16)
+    for _ in range(5):
+        dispatcher._record_failure()
+    assert dispatcher.batch_size == embedding_dispatcher.MIN_BATCH_SIZE
+
+    # Fast batches grow the batch back, up to the configured size
+    for _ in range(10):
+        dispatcher._record_success(0.1)
+    assert dispatcher.batch_size == 64
+
+
+def test_rerun_resumes_from_the_cache(tmp_path, sleeps):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    # The third batch fails for good: the first run stops after two batches
+    failing = ScriptedEmbeddings(failures={3})
+    first = EmbeddingDispatcher(CachedEmbeddings(failing, cache, "scripted"), batch_size=8,
+                                max_in_flight=1, max_retries=1)
+    with pytest.raises(EmbeddingDispatchError):
+        first.embed(texts(40))
+    assert first.get_stats()["resumable"] is True
+
+    rerun = ScriptedEmbeddings()
+    vectors = EmbeddingDispatcher(CachedEmbeddings(rerun, cache, "scripted"), batch_size=8).embed(texts(40))
+
+    assert vectors == [[float(i)] for i in range(40)]
+    assert sorted(rerun.embedded, key=int) == texts(40)[16:]
+    cache.close()
+
+
+def test_without_a_cache_a_rerun_starts_over(sleeps):
+    failing = ScriptedEmbeddings(failures={3})
+    first = EmbeddingDispatcher(CachedEmbeddings(failing, None, "scripted"), batch_size=8,
+                                max_in_flight=1, max_retries=1)
+    with pytest.raises(EmbeddingDispatchError):
+        first.embed(texts(40))
+
+    rerun = ScriptedEmbeddings()
+    dispatcher = EmbeddingDispatcher(CachedEmbeddings(rerun, None, "scripted"), batch_size=8)
+    dispatcher.embed(texts(40))
+
+    assert len(rerun.embedded) == 40
+    assert dispatcher.get_stats()["resumable"] is False
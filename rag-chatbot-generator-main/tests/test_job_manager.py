@@ -0,0 +1,150 @@
+"""Ingestion job scheduling: per-agent serialization, exclusive creates, cancellation, stored params"""
+import threading
+import time
+
+import pytest
+
+from job_manager import JobManager, JobConflict, TERMINAL_STATUSES
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection to record what the job manager stores"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find(self, query):
+        return []
+
+    def find_one(self, query):
+        return None
+
+    def find_one_and_update(self, query, update, upsert=False):
+        previous = self.docs.get(query["_id"])
+        doc = dict(previous or {"_id": query["_id"]})
+        doc.update(update.get("$set", {}))
+        self.docs[query["_id"]] = doc
+        return previous
+
+
+class Recorder:
+    """Job handler that records overlapping runs of the same agent"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.running = set()
+        self.overlaps = []
+        self.started = []
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def __call__(self, params, progress_callback):
+        agent = params["agent"]
+        with self._lock:
+            if agent in self.running:
+                self.overlaps.append(agent)
+            self.running.add(agent)
+            self.started.append((agent, params["n"]))
+        self.release.wait(5)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running.discard(agent)
+        return {"success": True}
+
+
+def wait_for(manager, job_ids, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if all(manager.get_job(job_id)["status"] in TERMINAL_STATUSES for job_id in job_ids):
+            return
+        time.sleep(0.01)
+    pytest.fail("jobs did not finish")
+
+
+def wait_for_idle(manager, timeout=10):
+    """Wait until every finished job has left its agent's queue"""
+    deadline = time.time() + timeout
+    while manager._agent_queues and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_jobs_of_one_agent_run_one_at_a_time_in_order():
+    handler = Recorder()
+    manager = JobManager(None, {"update": handler}, max_workers=4)
+
+    jobs = [manager.submit("update", "u1", agent, {"agent": agent, "n": n})
+            for n in range(3) for agent in ("alpha", "beta")]
+    wait_for(manager, [job["job_id"] for job in jobs])
+
+    assert handler.overlaps == []
+    assert [n for agent, n in handler.started if agent == "alpha"] == [0, 1, 2]
+    assert [n for agent, n in handler.started if agent == "beta"] == [0, 1, 2]
+
+
+def test_different_agents_run_concurrently():
+    handler = Recorder()
+    handler.release.clear()
+    manager = JobManager(None, {"update": handler}, max_workers=4)
+
+    jobs = [manager.submit("update", "u1", agent, {"agent": agent, "n": 0}) for agent in ("alpha", "beta")]
+    deadline = time.time() + 5
+    while len(handler.started) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    handler.release.set()
+    wait_for(manager, [job["job_id"] for job in jobs])
+
+    assert len(handler.started) == 2
+
+
+def test_exclusive_submit_conflicts_with_active_job():
+    handler = Recorder()
+    handler.release.clear()
+    manager = JobManager(None, {"create": handler}, max_workers=2)
+
+    first = manager.submit("create", "u1", "alpha", {"agent": "alpha", "n": 0}, exclusive=True)
+    with pytest.raises(JobConflict):
+        manager.submit("create", "u1", "alpha", {"agent": "alpha", "n": 1}, exclusive=True)
+    # Other agents and users are not affected
+    other = manager.submit("create", "u2", "alpha", {"agent": "other", "n": 0}, exclusive=True)
+
+    handler.release.set()
+    wait_for(manager, [first["job_id"], other["job_id"]])
+    wait_for_idle(manager)
+
+    later = manager.submit("create", "u1", "alpha", {"agent": "alpha", "n": 2}, exclusive=True)
+    wait_for(manager, [later["job_id"]])
+    assert manager.get_job(later["job_id"])["status"] == "succeeded"
+
+
+def test_cancelling_a_waiting_job_never_runs_it():
+    handler = Recorder()
+    handler.release.clear()
+    manager = JobManager(None, {"update": handler}, max_workers=2)
+
+    running = manager.submit("update", "u1", "alpha", {"agent": "alpha", "n": 0})
+    waiting = manager.submit("update", "u1", "alpha", {"agent": "alpha", "n": 1})
+    manager.cancel_job(waiting["job_id"], "u1")
+
+    assert manager.get_job(waiting["job_id"])["status"] == "cancelled"
+    handler.release.set()
+    wait_for(manager, [running["job_id"]])
+    assert handler.started == [("alpha", 0)]
+
+
+def test_connection_strings_are_never_stored():
+    collection = FakeCollection()
+    manager = JobManager(collection, {"sync_sql": Recorder()}, max_workers=1)
+    params = {"agent": "alpha", "n": 0,
+              "source_config": {"connection_string": "postgresql://user:secret@db/shop", "tables": ["orders"]}}
+
+    job = manager.submit("sync_sql", "u1", "alpha", params)
+    wait_for(manager, [job["job_id"]])
+
+    stored = collection.docs[job["job_id"]]
+    assert "secret" not in repr(stored)
+    assert stored["params_redacted"] is True
+    assert stored["params"]["source_config"]["tables"] == ["orders"]
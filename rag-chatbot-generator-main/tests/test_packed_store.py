@@ -0,0 +1,102 @@
+"""Packed small agents: deletes, upgrades and background compaction of dead packs"""
+import os
+import threading
+
+from vector_stores import AgentPack, PackedVectorStore, SegmentedVectorStore, load_agent_store
+from vector_stores import packed
+
+from store_helpers import faiss_chunks, searched_ids
+
+RECORD = 100
+
+
+def record(tag):
+    return tag.encode().ljust(RECORD, b".")
+
+
+def half_dead_pack(tmp_path):
+    """Pack 0 holding a0 and a1 is closed (two records fill a pack), a2 starts pack 1"""
+    pack = AgentPack(str(tmp_path / "packed"), max_bytes=2 * RECORD + RECORD // 2)
+    for key in ("a0", "a1", "a2"):
+        pack.write(key, record(key))
+    return pack
+
+
+def wait_for_compaction(pack):
+    thread = pack._compaction_thread
+    if thread is not None:
+        thread.join(timeout=10)
+
+
+def test_delete_and_upgrade(tmp_path, embedding):
+    path = str(tmp_path / "agents" / "agent")
+    store = PackedVectorStore.create(path, embedding, *faiss_chunks(embedding, "a", 10, "A"))
+    store.delete_ids(["a0"])
+
+    reloaded = load_agent_store(path, embedding)
+    assert isinstance(reloaded, PackedVectorStore)
+    assert reloaded.ntotal == 9
+
+    upgraded = reloaded.upgrade()
+    assert isinstance(upgraded, SegmentedVectorStore)
+    assert upgraded.ntotal == 9
+    assert not PackedVectorStore.exists(path)
+    assert searched_ids(upgraded, embedding) == {f"a{i}" for i in range(1, 10)}
+
+
+def test_mostly_dead_pack_is_compacted_in_the_background(tmp_path):
+    pack = half_dead_pack(tmp_path)
+    assert os.path.exists(pack._pack_path(0))
+
+    pack.delete("a0")
+    wait_for_compaction(pack)
+
+    assert not os.path.exists(pack._pack_path(0))
+    assert pack.read("a1") == record("a1")
+    assert pack.read("a2") == record("a2")
+    assert pack.stats()["agents"] == 2
+    pack.close()
+
+
+def test_writes_do_not_wait_for_compaction(tmp_path, monkeypatch):
+    pack = half_dead_pack(tmp_path)
+    reading, release = threading.Event(), threading.Event()
+    pread = os.pread
+
+    def slow_pread(fd, length, offset):
+        # Hold the compactor while it copies a record, outside the pack lock
+        if threading.current_thread().name.startswith("compact-"):
+            reading.set()
+            release.wait(10)
+        return pread(fd, length, offset)
+
+    monkeypatch.setattr(packed.os, "pread", slow_pread)
+
+    pack.delete("a0")
+    assert reading.wait(10)
+
+    # The record being copied is rewritten meanwhile: the copy must not win
+    pack.write("a1", record("a1 rewritten"))
+    pack.write("b0", record("b0"))
+    assert pack.read("a2") == record("a2")
+
+    release.set()
+    wait_for_compaction(pack)
+
+    assert not os.path.exists(pack._pack_path(0))
+    assert pack.read("a1") == record("a1 rewritten")
+    assert pack.read("b0") == record("b0")
+    pack.close()
+
+
+def test_renamed_record_is_moved_with_its_new_key(tmp_path):
+    pack = half_dead_pack(tmp_path)
+    pack.rename("a1", "c1")
+
+    pack.delete("a0")
+    wait_for_compaction(pack)
+
+    assert not os.path.exists(pack._pack_path(0))
+    assert pack.read("c1") == record("a1")
+    assert pack.read("a1") is None
+    pack.close()
@@ -0,0 +1,143 @@
+"""Compact vector storage: float16, truncated and binary candidates rescored in float32 keep recall"""
+import faiss
+import numpy as np
+import pytest
+
+from vector_stores import SegmentedVectorStore
+from vector_stores.quantization import (BINARY_RESCORE_CANDIDATES, CompactIndex, map_flat_vectors, recall_report,
+                                       rescore_candidates, storage_settings)
+
+from store_helpers import faiss_chunks
+
+DIMENSION = 256
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    """Clustered unit vectors whose leading dimensions carry most of the signal, like a Matryoshka model's"""
+    rng = np.random.RandomState(7)
+    centers = rng.normal(size=(40, DIMENSION))
+    points = centers[rng.randint(40, size=3000)] + 0.6 * rng.normal(size=(3000, DIMENSION))
+    points *= np.exp(-np.arange(DIMENSION) / 48.0)
+    points = points.astype(np.float32)
+    faiss.normalize_L2(points)
+    return points
+
+
+def exact_top(vectors, query, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return list(order), distances[order]
+
+
+@pytest.mark.parametrize("storage", [{"precision": "float16"},
+                                     {"precision": "float32", "dimensions": 64},
+                                     {"precision": "float16", "dimensions": 64}])
+def test_rescoring_restores_recall(vectors, storage):
+    [report] = recall_report([vectors], [storage], k=10)
+
+    assert report["recall"] >= 0.99
+    assert report["recall"] >= report["recall_first_stage"]
+    assert report["bytes_per_vector"] == (storage.get("dimensions") or DIMENSION) * (
+        2 if storage["precision"] == "float16" else 4)
+
+
+def test_results_carry_exact_float32_distances(vectors):
+    index = CompactIndex(vectors, {"precision": "float16", "dimensions": 64})
+
+    for query in vectors[:20]:
+        found = index.search(query, 10)
+        positions, distances = exact_top(vectors, query, 10)
+        assert [position for position, _ in found] == positions
+        assert np.allclose([distance for _, distance in found], distances, atol=1e-6)
+
+
+def test_filtered_search_stays_within_positions(vectors):
+    index = CompactIndex(vectors, {"precision": "float16"})
+    allowed = np.arange(0, 3000, 3, dtype=np.int64)
+
+    found = index.search(vectors[1], 5, positions=allowed)
+    assert {position for position, _ in found} <= set(allowed.tolist())
+
+    # A restriction no larger than the candidate set is scored exactly
+    few = np.array([5, 10, 15], dtype=np.int64)
+    assert sorted(position for position, _ in index.search(vectors[1], 5, positions=few)) == [5, 10, 15]
+
+
+def test_rescoring_reads_the_flat_index_file(tmp_path, vectors):
+    flat = faiss.IndexFlatL2(DIMENSION)
+    flat.add(vectors[:100])
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(flat, path)
+
+    mapped = map_flat_vectors(path)
+
+    assert mapped.shape == (100, DIMENSION)
+    assert np.array_equal(mapped, vectors[:100])
+
+
+def test_storage_settings_validate_dimensions():
+    assert storage_settings("float16", 1024, full_dimension=1024) == {"precision": "float16", "dimensions": None}
+    with pytest.raises(ValueError):
+        storage_settings("float16", 8)
+    with pytest.raises(ValueError):
+        storage_settings("int4")
+
+
+def test_float16_store_returns_the_float32_results(tmp_path, embedding):
+    store = SegmentedVectorStore.create(str(tmp_path / "agent"), embedding, *faiss_chunks(embedding, "a", 200, "A"))
+    queries = [embedding.embed_query(f"chunk number {i}") for i in range(0, 200, 20)]
+
+    def scores():
+        return [[round(score, 5) for _, score in store.similarity_search_with_score_by_vector(query, 10)]
+                for query in queries]
+
+    full = scores()
+    store.set_storage({"precision": "float16", "dimensions": None})
+
+    assert scores() == full
+
+
+@pytest.fixture(scope="module")
+def offset_vectors():
+    """Clustered unit vectors offset from zero, as many embedding models' are"""
+    rng = np.random.RandomState(3)
+    centers = rng.normal(size=(40, DIMENSION))
+    points = (centers[rng.randint(40, size=3000)] + 0.6 * rng.normal(size=(3000, DIMENSION)) + 2.0).astype(np.float32)
+    faiss.normalize_L2(points)
+    return points
+
+
+@pytest.mark.parametrize("dimensions", [None, 128])
+def test_binary_first_stage_is_rescored_to_full_recall(offset_vectors, dimensions):
+    [report] = recall_report([offset_vectors], [{"precision": "binary", "dimensions": dimensions}], k=10)
+
+    # Sign bits alone find few of the true neighbours; rescoring their candidates finds them all
+    assert report["recall_first_stage"] < 0.6
+    assert report["recall"] >= 0.99
+    assert report["bytes_per_vector"] == (dimensions or DIMENSION) // 8
+
+
+def test_binary_codes_are_taken_around_the_mean(offset_vectors):
+    index = CompactIndex(offset_vectors, {"precision": "binary", "dimensions": None})
+
+    assert np.allclose(index.center, offset_vectors.mean(axis=0), atol=1e-5)
+    # Bits split about evenly; around zero nearly every bit would be set
+    assert 0.4 < np.unpackbits(index._encode(offset_vectors[:500])).mean() < 0.6
+    assert index.memory_bytes == 3000 * DIMENSION // 8
+
+
+def test_binary_rescores_a_few_hundred_candidates():
+    assert rescore_candidates({"precision": "binary"}, 4) == BINARY_RESCORE_CANDIDATES
+    assert rescore_candidates({"precision": "binary"}, 100) > BINARY_RESCORE_CANDIDATES
+    assert rescore_candidates({"precision": "float16"}, 4) < BINARY_RESCORE_CANDIDATES
+
+
+def test_binary_results_carry_exact_float32_distances(offset_vectors):
+    index = CompactIndex(offset_vectors, {"precision": "binary"})
+
+    for query in offset_vectors[:20]:
+        found = index.search(query, 10)
+        positions, distances = exact_top(offset_vectors, query, 10)
+        assert [position for position, _ in found] == positions
+        assert np.allclose([distance for _, distance in found], distances, atol=1e-6)
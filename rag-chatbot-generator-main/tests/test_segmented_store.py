@@ -0,0 +1,147 @@
+"""Segmented store deletes: registry tombstones, compaction and crash recovery"""
+import json
+import os
+import threading
+
+import pytest
+
+from vector_stores import SegmentedVectorStore
+
+from store_helpers import faiss_chunks, searched_ids
+
+
+def build(tmp_path, embedding, **kwargs):
+    store = SegmentedVectorStore.create(str(tmp_path / "agent"), embedding,
+                                        *faiss_chunks(embedding, "a", 30, "A"), max_deleted_pct=101, **kwargs)
+    store.append(*faiss_chunks(embedding, "b", 20, "B"))
+    return store
+
+
+def segment_files(store):
+    return {segment.name: os.path.getmtime(segment.path) for segment in store.segments}
+
+
+def manifest(tmp_path):
+    with open(tmp_path / "agent" / "manifest.json") as f:
+        return json.load(f)
+
+
+def test_delete_tombstones_without_rewriting_segments_or_manifest(tmp_path, embedding):
+    store = build(tmp_path, embedding)
+    files = segment_files(store)
+    before = manifest(tmp_path)
+
+    assert store.delete_ids(["a1", "a2", "b3", "missing"]) == 3
+
+    assert store.ntotal == 47
+    assert segment_files(store) == files
+    assert manifest(tmp_path) == before
+    assert searched_ids(store, embedding).isdisjoint({"a1", "a2", "b3"})
+    assert searched_ids(store, embedding, filter={"table_name": "A"}) == {f"a{i}" for i in range(30)} - {"a1", "a2"}
+    assert "a1" not in store.source_chunk_ids("A")
+
+
+def test_tombstones_survive_reload(tmp_path, embedding):
+    store = build(tmp_path, embedding)
+    store.delete_ids(["a1", "b3"])
+    store.close()
+
+    reloaded = SegmentedVectorStore.load(str(tmp_path / "agent"), embedding)
+
+    assert reloaded.ntotal == 48
+    assert searched_ids(reloaded, embedding).isdisjoint({"a1", "b3"})
+    assert sum(1 for _ in reloaded.iter_chunks()) == 48
+
+
+def test_deleting_a_whole_segment_drops_it(tmp_path, embedding):
+    store = build(tmp_path, embedding)
+    emptied = store.segments[1]
+
+    store.delete_ids([f"b{i}" for i in range(20)])
+
+    assert [segment.name for segment in store.segments] == [store.segments[0].name]
+    assert store.ntotal == 30
+    assert not os.path.exists(emptied.path)
+    assert emptied.name not in store.registry.tombstones()
+
+
+def test_compaction_removes_tombstoned_vectors(tmp_path, embedding):
+    store = build(tmp_path, embedding)
+    store.max_deleted_pct = 20
+    store.delete_ids([f"a{i}" for i in range(10)])
+    assert store.needs_compaction()
+
+    store.compact()
+
+    assert store.ntotal == 40
+    assert all(not segment.deleted for segment in store.segments)
+    assert sum(segment.store.index.ntotal for segment in store.segments) == 40
+    assert store.registry.tombstones() == {}
+    assert searched_ids(store, embedding) == {f"a{i}" for i in range(10, 30)} | {f"b{i}" for i in range(20)}
+
+
+def test_delete_does_not_wait_for_compaction(tmp_path, embedding):
+    store = build(tmp_path, embedding)
+    done = threading.Event()
+
+    with store._rewrite_lock:
+        worker = threading.Thread(target=lambda: (store.delete_ids(["a1"]), done.set()))
+        worker.start()
+        assert done.wait(5)
+    worker.join()
+    assert store.ntotal == 49
+
+
+def test_deletes_during_compaction_carry_over(tmp_path, embedding, monkeypatch):
+    store = build(tmp_path, embedding)
+    store.delete_ids(["a0"])
+    write_segment = store._write_segment
+
+    def write_then_delete(vectorstore):
+        segment = write_segment(vectorstore)
+        # Runs while the compaction holds its merged copy but has not swapped it in
+        store.delete_ids(["a5"] + [f"b{i}" for i in range(20)])
+        return segment
+
+    monkeypatch.setattr(store, "_write_segment", write_then_delete)
+    store.compact()
+
+    expected = {f"a{i}" for i in range(1, 30)} - {"a5"}
+    assert len(store.segments) == 1
+    assert store.ntotal == len(expected)
+    assert searched_ids(store, embedding) == expected
+    store.close()
+
+    reloaded = SegmentedVectorStore.load(str(tmp_path / "agent"), embedding)
+    assert searched_ids(reloaded, embedding) == expected
+    assert reloaded.source_chunk_ids("B") == []
+
+
+def test_crash_between_manifest_and_registry_is_repaired(tmp_path, embedding, monkeypatch):
+    store = build(tmp_path, embedding)
+    store.delete_ids(["a0"])
+    write_segment = store._write_segment
+
+    def write_then_delete(vectorstore):
+        segment = write_segment(vectorstore)
+        store.delete_ids(["a5"])
+        return segment
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("crashed")
+
+    monkeypatch.setattr(store, "_write_segment", write_then_delete)
+    monkeypatch.setattr(store.registry, "move_segments", crash)
+    with pytest.raises(RuntimeError):
+        store.compact()
+    store.close()
+
+    reloaded = SegmentedVectorStore.load(str(tmp_path / "agent"), embedding)
+
+    # The chunk deleted mid-compaction stays deleted in the merged segment
+    assert "a5" not in searched_ids(reloaded, embedding)
+    assert len(reloaded.source_chunk_ids("A")) == 28
+    assert reloaded.delete_ids(["a1", "b1"]) == 2
+    assert reloaded.delete_source("B") == 19
+    assert searched_ids(reloaded, embedding) == {f"a{i}" for i in range(2, 30)} - {"a5"}
+    assert set(reloaded.registry.segment_names()) == {reloaded.segments[0].name}
@@ -0,0 +1,38 @@
+"""Small agent layout: deletes, reloads and the upgrade past the small-store limit"""
+from vector_stores import SegmentedVectorStore, SmallVectorStore, load_agent_store, grow_agent_store
+from vector_stores import agent_store
+
+from store_helpers import faiss_chunks, searched_ids
+
+
+def test_delete_and_reload(tmp_path, embedding):
+    path = str(tmp_path / "agent")
+    store = SmallVectorStore.create(path, embedding, *faiss_chunks(embedding, "a", 10, "A"))
+
+    assert store.delete_ids(["a0", "a1"]) == 2
+
+    reloaded = load_agent_store(path, embedding)
+    assert isinstance(reloaded, SmallVectorStore)
+    assert reloaded.ntotal == 8
+    assert searched_ids(reloaded, embedding).isdisjoint({"a0", "a1"})
+
+
+def test_grow_within_limit_keeps_small_layout(tmp_path, embedding, monkeypatch):
+    monkeypatch.setattr(agent_store, "SMALL_AGENT_MAX_CHUNKS", 20)
+    store = SmallVectorStore.create(str(tmp_path / "agent"), embedding, *faiss_chunks(embedding, "a", 10, "A"))
+
+    assert grow_agent_store(store, 10) is store
+
+
+def test_grow_past_limit_upgrades_to_segmented(tmp_path, embedding, monkeypatch):
+    monkeypatch.setattr(agent_store, "SMALL_AGENT_MAX_CHUNKS", 20)
+    path = str(tmp_path / "agent")
+    store = SmallVectorStore.create(path, embedding, *faiss_chunks(embedding, "a", 15, "A"))
+
+    grown = grow_agent_store(store, 10)
+    grown.append(*faiss_chunks(embedding, "b", 10, "B"))
+
+    assert isinstance(grown, SegmentedVectorStore)
+    assert grown.ntotal == 25
+    assert sorted(grown.source_chunk_ids("A")) == sorted(f"a{i}" for i in range(15))
+    assert isinstance(load_agent_store(path, embedding), SegmentedVectorStore)
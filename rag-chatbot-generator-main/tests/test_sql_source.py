@@ -0,0 +1,207 @@
+"""SQL extraction against SQLite: shared connection slots, pool timeouts, engine cache bounds, sampling, Arrow fetch"""
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import column, event, table
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from data_sources import sql_source
+from data_sources.columnar import rows_to_batch
+from data_sources.sql_source import SQLSource, get_engine
+
+TABLES = [f"t{i}" for i in range(6)]
+
+
+def make_database(path, tables=TABLES, rows=20):
+    conn = sqlite3.connect(path)
+    for name in tables:
+        conn.execute(f"create table {name} (id integer primary key, label text)")
+        conn.executemany(f"insert into {name} values (?, ?)", [(i, f"{name} row {i}") for i in range(rows)])
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+@pytest.fixture(autouse=True)
+def fresh_engines(monkeypatch):
+    monkeypatch.setattr(sql_source, "POOL_SIZE", 2)
+    monkeypatch.setattr(sql_source, "_engines", type(sql_source._engines)())
+    monkeypatch.setattr(sql_source, "_adbc_idle", {})
+    yield
+    for engine, _ in sql_source._engines.values():
+        engine.dispose()
+
+
+def tables_of(documents):
+    return {doc.metadata["table_name"] for doc in documents}
+
+
+def test_concurrent_jobs_share_the_pool_without_losing_tables(tmp_path, monkeypatch):
+    url = make_database(tmp_path / "shop.db")
+    engine, _ = get_engine(url)
+    checked_out = []
+    peak = []
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(*args):
+        checked_out.append(1)
+        peak.append(len(checked_out))
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(*args):
+        checked_out.pop()
+
+    extract_table_data = SQLSource._extract_table_data
+
+    def slow_extract(self, conn, table_name, columns):
+        time.sleep(0.05)
+        return extract_table_data(self, conn, table_name, columns)
+
+    monkeypatch.setattr(SQLSource, "_extract_table_data", slow_extract)
+    # A short pool timeout: without the shared slots the two jobs would hit it
+    monkeypatch.setattr(engine.pool, "_timeout", 0.01)
+
+    results = {}
+    jobs = [threading.Thread(target=lambda n=n: results.update({n: SQLSource(url).extract_documents()}))
+            for n in range(2)]
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.join()
+
+    assert tables_of(results[0]) == tables_of(results[1]) == set(TABLES)
+    assert max(peak) <= 2
+
+
+def test_pool_timeout_fails_the_extraction(tmp_path, monkeypatch):
+    url = make_database(tmp_path / "shop.db")
+    extract_table_data = SQLSource._extract_table_data
+
+    def timed_out(self, conn, table_name, columns):
+        if table_name == "t3":
+            raise PoolTimeoutError("QueuePool limit reached")
+        return extract_table_data(self, conn, table_name, columns)
+
+    # Raised where _extract_table used to catch it and drop the table
+    monkeypatch.setattr(SQLSource, "_extract_table_data", timed_out)
+
+    with pytest.raises(PoolTimeoutError):
+        SQLSource(url).extract_documents()
+
+
+def test_engine_cache_disposes_the_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql_source, "MAX_ENGINES", 2)
+    urls = [make_database(tmp_path / f"db{i}.db", tables=["t0"]) for i in range(3)]
+    first, _ = get_engine(urls[0])
+    second, _ = get_engine(urls[1])
+    disposed = []
+    monkeypatch.setattr(second, "dispose", lambda: disposed.append("second"))
+
+    # Using the first engine again makes the second the least recently used
+    assert get_engine(urls[0])[0] is first
+    get_engine(urls[2])
+
+    assert disposed == ["second"]
+    assert list(sql_source._engines) == [urls[0], urls[2]]
+    assert get_engine(urls[1])[0] is not second
+
+
+def test_stratified_sample_is_one_windowed_query(tmp_path):
+    path = tmp_path / "people.db"
+    conn = sqlite3.connect(path)
+    conn.execute("create table people (id integer primary key, team text)")
+    teams = ["red"] * 60 + ["blue"] * 30 + ["green"] * 9 + [None]
+    conn.executemany("insert into people values (?, ?)", list(enumerate(teams)))
+    conn.commit()
+    conn.close()
+    source = SQLSource(f"sqlite:///{path}", sampling="stratified", sample_column="team", sample_limit=20)
+    assert source._connect()
+    statements = []
+
+    with source._connection() as conn:
+        event.listen(conn, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        rows = list(source._stratified_rows(conn, table("people", column("id"), column("team")), "team"))
+
+    counts = {team: sum(1 for _, row_team in rows if row_team == team) for team in ("red", "blue", "green", None)}
+    assert counts == {"red": 12, "blue": 6, "green": 1, None: 1}
+    assert len({row_id for row_id, _ in rows}) == 20
+    # The per-stratum counts, then a single query for the rows of every stratum
+    assert len(statements) == 2
+    assert "row_number() over" in statements[1].lower()
+
+
+class FakeAdbcConnection:
+    """sqlite3 behind the small part of the ADBC DB-API that the Arrow fetch uses"""
+
+    def __init__(self, path, connects):
+        connects.append(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.closed = False
+
+    def cursor(self):
+        return FakeAdbcCursor(self.conn)
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+class FakeAdbcCursor:
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+
+    def execute(self, sql):
+        self.cursor.execute(sql)
+
+    def fetch_record_batch(self):
+        names = [description[0] for description in self.cursor.description]
+        return iter([rows_to_batch(self.cursor.fetchall(), names)])
+
+    def close(self):
+        self.cursor.close()
+
+
+def mixed_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("create table items (id integer primary key, price real, name text, data blob, note text)")
+    conn.executemany("insert into items values (?, ?, ?, ?, ?)", [
+        (1, 2.0, "  padded  ", b"\x00", None),
+        (2, 0.25, None, None, "mixed"),
+        (3, None, "", None, "  "),
+        (4, 1e-7, "tiny", None, "x")
+    ])
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+def documents(url, fetch):
+    return [(doc.page_content, doc.metadata) for doc in SQLSource(url, fetch=fetch).extract_documents()]
+
+
+def test_arrow_fetch_renders_rows_identically(tmp_path):
+    url = mixed_database(tmp_path / "items.db")
+
+    assert documents(url, "arrow") == documents(url, "rows")
+
+
+def test_adbc_connections_are_reused_within_the_slots(tmp_path, monkeypatch):
+    url = make_database(tmp_path / "shop.db")
+    connects = []
+    driver = SimpleNamespace(connect=lambda path: FakeAdbcConnection(path, connects))
+    monkeypatch.setattr(sql_source.importlib, "import_module", lambda name: driver)
+
+    arrow = documents(url, "arrow")
+    documents(url, "arrow")
+
+    assert arrow == documents(url, "rows")
+    assert 1 <= len(connects) <= 2
+    idle = sql_source._adbc_idle[url]
+    assert len(idle) == len(connects)
+    assert not any(adbc_conn.closed for adbc_conn in idle)
@@ -0,0 +1,84 @@
+"""Incremental SQL sync against a SQLite database"""
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "shop.db"
+    conn = sqlite3.connect(path)
+    # updated_at + primary key: watermark sync
+    conn.execute("create table orders (id integer primary key, item text, updated_at timestamp)")
+    conn.executemany("insert into orders values (?, ?, ?)",
+                     [(i, f"item {i}", f"2024-01-01 00:00:{i:02d}") for i in range(1, 41)])
+    # Primary key only: keyset sync on the key
+    conn.execute("create table tags (id integer primary key, tag text)")
+    conn.executemany("insert into tags values (?, ?)", [(i, f"tag{i}") for i in range(1, 11)])
+    # No key at all: cannot be synced incrementally
+    conn.execute("create table notes (body text)")
+    conn.execute("insert into notes values ('keep me')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def source_config(tmp_path):
+    return {"connection_string": f"sqlite:///{tmp_path / 'shop.db'}", "tables": None, "sample_limit": 100}
+
+
+def chunks(rag_system, table_name):
+    store = rag_system._get_vectorstore(rag_system.get_agent_key("shop", "u1"))
+    return [doc.page_content for _, doc in store.iter_chunks()
+            if doc.metadata.get("table_name") == table_name and not doc.metadata.get("is_schema")]
+
+
+def test_first_sync_takes_over_and_plans_each_table(rag_system, database, tmp_path):
+    config = source_config(tmp_path)
+    assert rag_system.create_agent_from_source("shop", "sql", config, "u1")["success"]
+
+    result = rag_system.sync_agent_sql("shop", "u1", config)
+
+    assert result["success"]
+    assert sorted(result["synced"]) == ["orders", "tags"]
+    assert result["unsupported"] == ["notes"]
+    state = rag_system.agents[rag_system.get_agent_key("shop", "u1")]["sync_state"]["tables"]
+    assert state["orders"]["column"] == "updated_at"
+    assert state["orders"]["key_column"] == "id"
+    assert state["tags"]["column"] == "id"
+    assert state["tags"]["value"] == 10
+
+
+def test_sync_only_embeds_changed_rows(rag_system, database, tmp_path):
+    config = source_config(tmp_path)
+    rag_system.create_agent_from_source("shop", "sql", config, "u1")
+    rag_system.sync_agent_sql("shop", "u1", config)
+
+    unchanged = rag_system.sync_agent_sql("shop", "u1", config)
+    assert unchanged["records_changed"] == 0
+    assert unchanged["chunks_added"] == 0
+
+    database.execute("update orders set item = 'changed', updated_at = '2024-02-01 00:00:00' where id = 5")
+    database.execute("insert into orders values (41, 'new order', '2024-02-02 00:00:00')")
+    database.execute("insert into tags values (11, 'newtag')")
+    database.commit()
+
+    result = rag_system.sync_agent_sql("shop", "u1", config)
+
+    assert result["records_changed"] == 3
+    assert result["chunks_removed"] == 1
+    orders = chunks(rag_system, "orders")
+    assert len(orders) == 41
+    assert any("item: changed" in text for text in orders)
+    assert not any("item: item 5" in text for text in orders)
+    assert len(chunks(rag_system, "tags")) == 11
+
+
+def test_unsupported_table_keeps_bulk_chunks(rag_system, database, tmp_path):
+    config = source_config(tmp_path)
+    rag_system.create_agent_from_source("shop", "sql", config, "u1")
+
+    for _ in range(2):
+        result = rag_system.sync_agent_sql("shop", "u1", config)
+        assert "notes" in result["unsupported"]
+        assert chunks(rag_system, "notes") == ["[notes]\nbody: keep me"]
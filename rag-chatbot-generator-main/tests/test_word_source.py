@@ -0,0 +1,42 @@
+"""Word extraction: structural units in document order, the same with spawned workers"""
+import pytest
+
+docx = pytest.importorskip("docx")
+
+from data_sources.word_source import WordSource
+
+
+def write_docx(path, title, paragraphs):
+    document = docx.Document()
+    document.add_heading(title, level=1)
+    for text in paragraphs:
+        document.add_paragraph(text)
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = "key", "value"
+    table.cell(1, 0).text, table.cell(1, 1).text = title, str(len(paragraphs))
+    document.save(str(path))
+    return str(path)
+
+
+def extract(paths, workers):
+    return [(doc.page_content, doc.metadata) for doc in WordSource(paths, workers=workers).extract_documents()]
+
+
+def test_parallel_extraction_matches_serial(tmp_path):
+    paths = [write_docx(tmp_path / f"doc{i}.docx", f"Report {i}", [f"Paragraph {n} of report {i}." for n in range(3)])
+             for i in range(3)]
+
+    parallel = extract(paths, workers=2)
+
+    assert parallel == extract(paths, workers=1)
+    assert [metadata["source"] for _, metadata in parallel][::5] == ["doc0.docx", "doc1.docx", "doc2.docx"]
+
+
+def test_unreadable_file_does_not_stop_the_others(tmp_path):
+    broken = tmp_path / "broken.docx"
+    broken.write_bytes(b"not a zip file")
+    good = write_docx(tmp_path / "good.docx", "Good", ["Only paragraph."])
+
+    documents = extract([str(broken), good], workers=2)
+
+    assert {metadata["source"] for _, metadata in documents} == {"good.docx"}
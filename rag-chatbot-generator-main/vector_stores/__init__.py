@@ -0,0 +1,35 @@
+"""
+Vector store layouts for agent indexes.
+"""
+from .segmented import SegmentedVectorStore, Segment
+from .small_store import SmallVectorStore, SMALL_AGENT_MAX_CHUNKS
+from .packed import PackedVectorStore, AgentPack, PACKED_SMALL_AGENTS
+from .agent_store import (AgentStore, create_agent_store, load_agent_store, grow_agent_store,
+                          replace_agent_store, remove_agent_store)
+from .chunk_registry import ChunkRegistry
+from .metadata_index import MetadataIndex, FILTER_FIELDS
+from .quantization import CompactIndex, STORAGE_PRECISIONS, DEFAULT_STORAGE, storage_settings, recall_report
+
+__all__ = [
+    'SegmentedVectorStore',
+    'Segment',
+    'SmallVectorStore',
+    'SMALL_AGENT_MAX_CHUNKS',
+    'PackedVectorStore',
+    'AgentPack',
+    'PACKED_SMALL_AGENTS',
+    'AgentStore',
+    'create_agent_store',
+    'load_agent_store',
+    'grow_agent_store',
+    'replace_agent_store',
+    'remove_agent_store',
+    'ChunkRegistry',
+    'MetadataIndex',
+    'FILTER_FIELDS',
+    'CompactIndex',
+    'STORAGE_PRECISIONS',
+    'DEFAULT_STORAGE',
+    'storage_settings',
+    'recall_report'
+]
@@ -0,0 +1,77 @@
+"""
+Agent Store Selection
+Picks the vector store layout for an agent: the NumPy-backed
+SmallVectorStore for agents up to SMALL_AGENT_MAX_CHUNKS chunks (or, with
+PACKED_SMALL_AGENTS, a PackedVectorStore record in the shared packs), and
+the segmented FAISS store for everything larger.
+"""
+import os
+import shutil
+from typing import Any, Dict, Optional, Union
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from .segmented import SegmentedVectorStore
+from .small_store import SmallVectorStore, SMALL_AGENT_MAX_CHUNKS
+from .packed import PackedVectorStore, PACKED_SMALL_AGENTS, pack_root, open_pack
+
+AgentStore = Union[SegmentedVectorStore, SmallVectorStore]
+
+
+def create_agent_store(path: str, embedding: Embeddings, vectorstore: FAISS,
+                       chunk_sources: Optional[Dict[str, str]] = None,
+                       chunk_records: Optional[Dict[str, str]] = None,
+                       storage: Optional[Dict[str, Any]] = None) -> AgentStore:
+    """Create the store for a new agent index, choosing the layout by size"""
+    remove_agent_store(path)
+    if vectorstore.index.ntotal > SMALL_AGENT_MAX_CHUNKS:
+        store_class = SegmentedVectorStore
+    else:
+        store_class = PackedVectorStore if PACKED_SMALL_AGENTS else SmallVectorStore
+    return store_class.create(path, embedding, vectorstore, chunk_sources=chunk_sources,
+                              chunk_records=chunk_records, storage=storage)
+
+
+def load_agent_store(path: str, embedding: Embeddings, storage: Optional[Dict[str, Any]] = None) -> AgentStore:
+    """Load an agent index in whichever layout it was written"""
+    if SmallVectorStore.exists(path):
+        return SmallVectorStore.load(path, embedding, storage=storage)
+    if not os.path.isdir(path) and PackedVectorStore.exists(path):
+        return PackedVectorStore.load(path, embedding, storage=storage)
+    return SegmentedVectorStore.load(path, embedding, storage=storage)
+
+
+def grow_agent_store(store: AgentStore, new_chunks: int) -> AgentStore:
+    """
+    The store to append new_chunks chunks to: a small store that would
+    outgrow SMALL_AGENT_MAX_CHUNKS is upgraded to the segmented layout first.
+    """
+    if isinstance(store, SmallVectorStore) and store.ntotal + new_chunks > SMALL_AGENT_MAX_CHUNKS:
+        print(f"[INFO] Upgrading {store.path} to the segmented layout "
+              f"({store.ntotal + new_chunks} chunks > {SMALL_AGENT_MAX_CHUNKS})")
+        return store.upgrade()
+    return store
+
+
+def replace_agent_store(staging_path: str, path: str):
+    """Make the index built at staging_path the agent's index at path, in either layout"""
+    if not os.path.isdir(staging_path) and PackedVectorStore.exists(staging_path):
+        shutil.rmtree(path, ignore_errors=True)
+        open_pack(pack_root(path)).rename(os.path.basename(staging_path), os.path.basename(path))
+        return
+
+    retired_path = staging_path + ".old"
+    shutil.rmtree(retired_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, retired_path)
+    os.replace(staging_path, path)
+    PackedVectorStore.remove(path)
+    shutil.rmtree(retired_path, ignore_errors=True)
+
+
+def remove_agent_store(path: str):
+    """Delete an agent index from disk, in either layout"""
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    PackedVectorStore.remove(path)
@@ -0,0 +1,210 @@
+"""
+Chunk Registry
+Persistent chunk-id -> source mapping for an agent index, so the chunks of a
+single source can be found and removed without scanning or re-embedding
+anything else. Chunks of keyed records (e.g. synced SQL rows) also store the
+record key, so a changed record's chunks can be replaced on their own.
+
+Deleted chunks still present in a segment file are kept as tombstones
+(chunk id -> segment) until compaction drops them from disk.
+"""
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# SQLite limits the number of bound parameters per statement
+QUERY_BATCH_SIZE = 500
+
+
+class ChunkRegistry:
+    """SQLite table of (chunk_id, source, segment, record_key) rows for one agent"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                segment TEXT NOT NULL
+            )
+        """)
+        # Registries created before record keys existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "record_key" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN record_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_segment ON chunks(segment)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_record ON chunks(source, record_key)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tombstones (
+                chunk_id TEXT PRIMARY KEY,
+                segment TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tombstones_segment ON tombstones(segment)")
+        self._conn.commit()
+
+    def add(self, segment: str, chunk_sources: Dict[str, str],
+            chunk_records: Optional[Dict[str, str]] = None):
+        """Record which source (and optionally which record) each chunk of a new segment came from"""
+        chunk_records = chunk_records or {}
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, source, segment, record_key) VALUES (?, ?, ?, ?)",
+                [(chunk_id, source, segment, chunk_records.get(chunk_id))
+                 for chunk_id, source in chunk_sources.items()]
+            )
+            self._conn.commit()
+
+    def ids_for_source(self, source: str) -> Dict[str, List[str]]:
+        """Chunk ids of a source, grouped by the segment holding them"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT segment, chunk_id FROM chunks WHERE source = ?", (source,)
+            ).fetchall()
+
+        by_segment: Dict[str, List[str]] = defaultdict(list)
+        for segment, chunk_id in rows:
+            by_segment[segment].append(chunk_id)
+        return dict(by_segment)
+
+    def ids_for_records(self, source: str, record_keys: Iterable[str]) -> List[str]:
+        """Chunk ids of the given records of a source"""
+        record_keys = list(record_keys)
+        chunk_ids: List[str] = []
+
+        with self._lock:
+            for start in range(0, len(record_keys), QUERY_BATCH_SIZE):
+                batch = record_keys[start:start + QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                chunk_ids.extend(chunk_id for (chunk_id,) in self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE source = ? AND record_key IN ({placeholders})",
+                    [source] + batch
+                ))
+        return chunk_ids
+
+    def segments_for_ids(self, chunk_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Group chunk ids by the segment holding them (unknown ids are skipped)"""
+        chunk_ids = list(chunk_ids)
+        by_segment: Dict[str, List[str]] = defaultdict(list)
+
+        with self._lock:
+            for start in range(0, len(chunk_ids), QUERY_BATCH_SIZE):
+                batch = chunk_ids[start:start + QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for segment, chunk_id in self._conn.execute(
+                    f"SELECT segment, chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ):
+                    by_segment[segment].append(chunk_id)
+        return dict(by_segment)
+
+    def entries(self, chunk_ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """(source, record key) of each tracked chunk id (unknown ids are skipped)"""
+        chunk_ids = list(chunk_ids)
+        entries: Dict[str, Tuple[str, Optional[str]]] = {}
+
+        with self._lock:
+            for start in range(0, len(chunk_ids), QUERY_BATCH_SIZE):
+                batch = chunk_ids[start:start + QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for chunk_id, source, record_key in self._conn.execute(
+                    f"SELECT chunk_id, source, record_key FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ):
+                    entries[chunk_id] = (source, record_key)
+        return entries
+
+    def remove(self, chunk_ids: Iterable[str]):
+        """Forget deleted chunks"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(c,) for c in chunk_ids])
+            self._conn.commit()
+
+    def tombstone(self, by_segment: Dict[str, List[str]]):
+        """Mark chunks deleted in the segments still holding them and forget their sources, in one commit"""
+        rows = [(chunk_id, segment) for segment, chunk_ids in by_segment.items() for chunk_id in chunk_ids]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO tombstones (chunk_id, segment) VALUES (?, ?)", rows)
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(c,) for c, _ in rows])
+            self._conn.commit()
+
+    def tombstones(self) -> Dict[str, List[str]]:
+        """Tombstoned chunk ids, grouped by segment"""
+        with self._lock:
+            rows = self._conn.execute("SELECT segment, chunk_id FROM tombstones").fetchall()
+
+        by_segment: Dict[str, List[str]] = defaultdict(list)
+        for segment, chunk_id in rows:
+            by_segment[segment].append(chunk_id)
+        return dict(by_segment)
+
+    def drop_tombstones(self, segments: Iterable[str]):
+        """Forget the tombstones of segments removed from disk"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM tombstones WHERE segment = ?", [(s,) for s in segments])
+            self._conn.commit()
+
+    def move_segments(self, old_segments: Iterable[str], new_segment: str, purged: Iterable[str] = ()):
+        """
+        Point chunks and tombstones at the segment that replaced theirs
+        (compaction), forgetting the tombstones of purged chunks, in one commit.
+        """
+        with self._lock:
+            for table in ("chunks", "tombstones"):
+                self._conn.executemany(
+                    f"UPDATE {table} SET segment = ? WHERE segment = ?",
+                    [(new_segment, old) for old in old_segments]
+                )
+            self._conn.executemany("DELETE FROM tombstones WHERE chunk_id = ?", [(c,) for c in purged])
+            self._conn.commit()
+
+    def segment_names(self) -> List[str]:
+        """Every segment name that chunks or tombstones point at"""
+        with self._lock:
+            return [name for (name,) in self._conn.execute(
+                "SELECT segment FROM chunks UNION SELECT segment FROM tombstones"
+            )]
+
+    def ids_in_segments(self, segments: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """(chunk ids, tombstoned chunk ids) pointing at the given segments"""
+        segments = list(segments)
+        chunk_ids: List[str] = []
+        tombstone_ids: List[str] = []
+
+        with self._lock:
+            for start in range(0, len(segments), QUERY_BATCH_SIZE):
+                batch = segments[start:start + QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                chunk_ids.extend(c for (c,) in self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE segment IN ({placeholders})", batch
+                ))
+                tombstone_ids.extend(c for (c,) in self._conn.execute(
+                    f"SELECT chunk_id FROM tombstones WHERE segment IN ({placeholders})", batch
+                ))
+        return chunk_ids, tombstone_ids
+
+    def reassign(self, chunks: Dict[str, str], tombstones: Dict[str, str], dropped: Iterable[str]):
+        """Repoint chunks and tombstones (chunk id -> segment) and forget dropped ids, in one commit"""
+        with self._lock:
+            self._conn.executemany("UPDATE chunks SET segment = ? WHERE chunk_id = ?",
+                                   [(segment, c) for c, segment in chunks.items()])
+            self._conn.executemany("UPDATE tombstones SET segment = ? WHERE chunk_id = ?",
+                                   [(segment, c) for c, segment in tombstones.items()])
+            dropped = [(c,) for c in dropped]
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", dropped)
+            self._conn.executemany("DELETE FROM tombstones WHERE chunk_id = ?", dropped)
+            self._conn.commit()
+
+    def source_counts(self) -> List[Tuple[str, int]]:
+        """Number of tracked chunks per source"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT source, COUNT(*) FROM chunks GROUP BY source ORDER BY source"
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,115 @@
+"""
+Metadata Posting Lists
+Per-segment inverted index from chunk metadata values to FAISS positions,
+used to restrict a vector search to matching chunks (a table, a source file,
+schema chunks) before scoring instead of over-fetching and post-filtering.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+# Metadata fields that get posting lists
+FILTER_FIELDS = ("source", "source_type", "table_name", "collection_name", "is_schema")
+
+
+def _normalize(field: str, value: Any) -> Any:
+    """Chunks without an is_schema flag are data chunks"""
+    if field == "is_schema":
+        return bool(value)
+    return value
+
+
+class MetadataIndex:
+    """Posting lists {field: {value: sorted int64 positions}} for one FAISS store"""
+
+    def __init__(self, postings: Dict[str, Dict[Any, np.ndarray]], ntotal: int):
+        self.postings = postings
+        self.ntotal = ntotal
+
+    @classmethod
+    def build(cls, store: FAISS) -> "MetadataIndex":
+        """Scan the store's docstore once and collect positions per metadata value"""
+        metadatas: List[Dict[str, Any]] = [{}] * store.index.ntotal
+        for position, doc_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                metadatas[position] = doc.metadata
+        return cls.from_metadatas(metadatas)
+
+    @classmethod
+    def from_metadatas(cls, metadatas: List[Dict[str, Any]]) -> "MetadataIndex":
+        """Posting lists for chunks whose metadata is given in position order"""
+        lists: Dict[str, Dict[Any, List[int]]] = {field: defaultdict(list) for field in FILTER_FIELDS}
+
+        for position, metadata in enumerate(metadatas):
+            for field in FILTER_FIELDS:
+                if field in metadata or field == "is_schema":
+                    value = _normalize(field, metadata.get(field))
+                    try:
+                        lists[field][value].append(position)
+                    except TypeError:
+                        # Unhashable values (lists, dicts) cannot be filtered on
+                        pass
+
+        postings = {
+            field: {value: np.array(sorted(positions), dtype=np.int64) for value, positions in values.items()}
+            for field, values in lists.items()
+        }
+        return cls(postings, len(metadatas))
+
+    def select(self, filter: Dict[str, Any]) -> np.ndarray:
+        """
+        Positions matching a filter. Fields are ANDed; a list value matches any
+        of its items. Raises ValueError for fields without posting lists.
+        """
+        selected: Optional[np.ndarray] = None
+
+        for field, wanted in filter.items():
+            if field not in self.postings:
+                raise ValueError(f"Cannot filter on '{field}'. Filterable fields: {', '.join(FILTER_FIELDS)}")
+
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            parts = [self.postings[field].get(_normalize(field, v)) for v in values]
+            parts = [p for p in parts if p is not None]
+            matches = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+            selected = matches if selected is None else np.intersect1d(selected, matches, assume_unique=True)
+            if selected.size == 0:
+                break
+
+        if selected is None:
+            return np.arange(self.ntotal, dtype=np.int64)
+        return selected
+
+    def values(self) -> Dict[str, List[Any]]:
+        """Distinct values per filterable field"""
+        return {field: list(values.keys()) for field, values in self.postings.items() if values}
+
+
+def search_positions(store: FAISS, embedding: List[float], k: int,
+                     positions: np.ndarray) -> List[tuple]:
+    """Score only the given positions of a FAISS store. Returns (Document, distance) pairs."""
+    if positions.size == 0:
+        return []
+
+    query = np.array([embedding], dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(query)
+
+    # The selector must stay referenced for the duration of the search
+    selector = faiss.IDSelectorBatch(positions)
+    params = faiss.SearchParameters(sel=selector)
+    distances, indices = store.index.search(query, min(k, positions.size), params=params)
+
+    results = []
+    for distance, position in zip(distances[0], indices[0]):
+        if position == -1:
+            continue
+        doc = store.docstore.search(store.index_to_docstore_id[int(position)])
+        if isinstance(doc, Document):
+            results.append((doc, float(distance)))
+    return results
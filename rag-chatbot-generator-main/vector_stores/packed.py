@@ -0,0 +1,365 @@
+"""
+Packed Agent Storage
+Small agents kept together instead of in a directory each: an agent's
+vectors and chunks are one contiguous record in a shared pack file, and an
+SQLite offset table maps agent_key -> (pack, offset, length). Loading an
+agent is one table lookup and one pread, and tens of thousands of agents
+need a handful of files rather than a directory and two files apiece.
+
+Records are only appended. Rewriting an agent appends a new record and
+repoints its row, which is the commit point; the old range becomes dead
+space. Once a pack reaches PACK_MAX_MB a new one is started, and a closed
+pack that is at least half dead has its live records copied forward and is
+removed by a background thread. The copy takes the pack lock one record at
+a time, so writes and loads of other agents are not held up by it.
+"""
+import os
+import json
+import struct
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from .segmented import SegmentedVectorStore
+from .small_store import SmallVectorStore, _Contents, UPGRADE_STAGING_SUFFIX
+
+# Store new small agents in the shared packs instead of per-agent directories
+PACKED_SMALL_AGENTS = os.environ.get('PACKED_SMALL_AGENTS', 'false').lower() in ('1', 'true', 'yes')
+
+# Size at which the current pack file is closed and a new one started
+PACK_MAX_MB = int(os.environ.get('PACK_MAX_MB', '256'))
+
+# Closed packs with at least this share of dead bytes are compacted
+PACK_DEAD_RATIO = 0.5
+
+PACK_DIR = "packed"
+OFFSETS_FILE = "offsets.sqlite"
+PACK_PREFIX = "pack_"
+PACK_SUFFIX = ".bin"
+
+# Record: header, float32 vectors (rows x dimension), then the chunk columns as JSON
+RECORD_MAGIC = b"PKA1"
+_HEADER = struct.Struct("<4sIII")
+
+
+def encode_record(contents: _Contents) -> bytes:
+    """One agent's vectors and chunks as a contiguous record"""
+    columns = json.dumps(contents.columns(), ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    vectors = np.ascontiguousarray(contents.vectors, dtype=np.float32)
+    rows, dimension = vectors.shape if vectors.ndim == 2 else (0, 0)
+    return _HEADER.pack(RECORD_MAGIC, rows, dimension, len(columns)) + vectors.tobytes() + columns
+
+
+def decode_record(data: bytes) -> _Contents:
+    magic, rows, dimension, columns_length = _HEADER.unpack_from(data)
+    if magic != RECORD_MAGIC:
+        raise ValueError("Packed agent record is corrupt")
+    start = _HEADER.size
+    end = start + rows * dimension * 4
+    vectors = np.frombuffer(data, dtype=np.float32, count=rows * dimension, offset=start).reshape(rows, dimension)
+    columns = json.loads(data[end:end + columns_length].decode('utf-8'))
+    return _Contents.from_columns(vectors, columns)
+
+
+class AgentPack:
+    """Append-only pack files plus the agent_key -> (pack, offset, length) table"""
+
+    def __init__(self, root: str, max_bytes: int = PACK_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, OFFSETS_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS agents (
+                agent_key TEXT PRIMARY KEY,
+                pack INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_pack ON agents(pack)")
+        self._conn.commit()
+
+        # Read descriptors stay open; only the current pack is written
+        self._readers: Dict[int, int] = {}
+        self._writer: Optional[int] = None
+        packs = [int(name[len(PACK_PREFIX):-len(PACK_SUFFIX)]) for name in os.listdir(root)
+                 if name.startswith(PACK_PREFIX) and name.endswith(PACK_SUFFIX)]
+        self._current = max(packs, default=0)
+
+        # Closed packs that lost a record and wait for the compactor to check them
+        self._pending: set = set()
+        self._compaction_thread: Optional[threading.Thread] = None
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.root, f"{PACK_PREFIX}{pack:06d}{PACK_SUFFIX}")
+
+    def _reader(self, pack: int) -> int:
+        if pack not in self._readers:
+            self._readers[pack] = os.open(self._pack_path(pack), os.O_RDONLY)
+        return self._readers[pack]
+
+    def _locate(self, agent_key: str) -> Optional[Tuple[int, int, int]]:
+        return self._conn.execute(
+            "SELECT pack, offset, length FROM agents WHERE agent_key = ?", (agent_key,)
+        ).fetchone()
+
+    def _append(self, data: bytes) -> Tuple[int, int]:
+        """Append a record to the current pack (lock held). Returns (pack, offset)."""
+        if self._writer is not None and os.fstat(self._writer).st_size + len(data) > self.max_bytes:
+            os.close(self._writer)
+            self._writer = None
+            self._current += 1
+        if self._writer is None:
+            self._writer = os.open(self._pack_path(self._current), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+        offset = os.fstat(self._writer).st_size
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._writer, view):]
+        os.fsync(self._writer)
+        return self._current, offset
+
+    # ==================== AGENT RECORDS ====================
+
+    def contains(self, agent_key: str) -> bool:
+        with self._lock:
+            return self._locate(agent_key) is not None
+
+    def read(self, agent_key: str) -> Optional[bytes]:
+        """An agent's record in one pread, or None if the agent is not packed"""
+        with self._lock:
+            location = self._locate(agent_key)
+            if location is None:
+                return None
+            pack, offset, length = location
+            data = os.pread(self._reader(pack), length, offset)
+        if len(data) != length:
+            raise ValueError(f"Packed record of '{agent_key}' is truncated")
+        return data
+
+    def write(self, agent_key: str, data: bytes):
+        """Store a new version of an agent's record"""
+        with self._lock:
+            previous = self._locate(agent_key)
+            pack, offset = self._append(data)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO agents (agent_key, pack, offset, length) VALUES (?, ?, ?, ?)",
+                (agent_key, pack, offset, len(data))
+            )
+            self._conn.commit()
+        if previous is not None:
+            self.schedule_compaction(previous[0])
+
+    def delete(self, agent_key: str) -> bool:
+        """Forget an agent's record. Returns True if there was one."""
+        with self._lock:
+            previous = self._locate(agent_key)
+            if previous is None:
+                return False
+            self._conn.execute("DELETE FROM agents WHERE agent_key = ?", (agent_key,))
+            self._conn.commit()
+        self.schedule_compaction(previous[0])
+        return True
+
+    def rename(self, old_key: str, new_key: str):
+        """Give a record a new key, replacing any record already under it"""
+        with self._lock:
+            replaced = self._locate(new_key)
+            self._conn.execute("DELETE FROM agents WHERE agent_key = ?", (new_key,))
+            self._conn.execute("UPDATE agents SET agent_key = ? WHERE agent_key = ?", (new_key, old_key))
+            self._conn.commit()
+        if replaced is not None:
+            self.schedule_compaction(replaced[0])
+
+    # ==================== MAINTENANCE ====================
+
+    def schedule_compaction(self, pack: int) -> bool:
+        """Queue a pack for the background compactor, starting it if none is running"""
+        with self._lock:
+            self._pending.add(pack)
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return False
+            self._compaction_thread = threading.Thread(
+                target=self._compact_pending, name=f"compact-{os.path.basename(self.root)}", daemon=True
+            )
+            self._compaction_thread.start()
+            return True
+
+    def _compact_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._compaction_thread = None
+                    return
+                pack = self._pending.pop()
+            try:
+                self.compact(pack)
+            except Exception as e:
+                print(f"[ERROR] Compaction of pack {pack} failed in {self.root}: {e}")
+
+    def _needs_compaction(self, pack: int) -> bool:
+        """True when pack is a closed pack at least PACK_DEAD_RATIO dead (lock held)"""
+        if pack == self._current or not os.path.exists(self._pack_path(pack)):
+            return False
+        size = os.path.getsize(self._pack_path(pack))
+        live = self._conn.execute(
+            "SELECT COALESCE(SUM(length), 0) FROM agents WHERE pack = ?", (pack,)
+        ).fetchone()[0]
+        return size - live >= size * PACK_DEAD_RATIO
+
+    def compact(self, pack: int) -> bool:
+        """
+        Copy a mostly dead closed pack's live records forward and remove it.
+        Each record is copied under the lock on its own; records rewritten,
+        renamed or deleted meanwhile are followed. Returns True if the pack was removed.
+        """
+        with self._lock:
+            if not self._needs_compaction(pack):
+                return False
+            rows = self._conn.execute(
+                "SELECT offset, length FROM agents WHERE pack = ?", (pack,)
+            ).fetchall()
+            dead = os.path.getsize(self._pack_path(pack)) - sum(length for _, length in rows)
+
+        # A private descriptor: the pack is only removed by this thread
+        fd = os.open(self._pack_path(pack), os.O_RDONLY)
+        try:
+            moved = 0
+            for offset, length in rows:
+                data = os.pread(fd, length, offset)
+                with self._lock:
+                    # Matched by location, not key: a rename keeps the record where it is
+                    if self._conn.execute("SELECT 1 FROM agents WHERE pack = ? AND offset = ?",
+                                          (pack, offset)).fetchone() is None:
+                        continue
+                    new_pack, new_offset = self._append(data)
+                    self._conn.execute("UPDATE agents SET pack = ?, offset = ? WHERE pack = ? AND offset = ?",
+                                       (new_pack, new_offset, pack, offset))
+                    self._conn.commit()
+                    moved += 1
+        finally:
+            os.close(fd)
+
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM agents WHERE pack = ? LIMIT 1", (pack,)).fetchone() is not None:
+                return False
+            if pack in self._readers:
+                os.close(self._readers.pop(pack))
+            os.remove(self._pack_path(pack))
+        print(f"[OK] Compacted pack {pack} ({moved} agents moved, {dead / 1024 / 1024:.1f} MB freed)")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            agents, live = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM agents").fetchone()
+            sizes = [os.path.getsize(os.path.join(self.root, name)) for name in os.listdir(self.root)
+                     if name.startswith(PACK_PREFIX) and name.endswith(PACK_SUFFIX)]
+        return {
+            "agents": agents,
+            "packs": len(sizes),
+            "size_mb": round(sum(sizes) / 1024 / 1024, 2),
+            "dead_mb": round((sum(sizes) - live) / 1024 / 1024, 2)
+        }
+
+    def close(self):
+        """Wait for the compactor to finish and close the pack files"""
+        thread = self._compaction_thread
+        if thread is not None and thread.is_alive():
+            thread.join()
+        with self._lock:
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers.clear()
+            if self._writer is not None:
+                os.close(self._writer)
+                self._writer = None
+            self._conn.close()
+
+
+_packs: Dict[str, AgentPack] = {}
+_packs_lock = threading.Lock()
+
+
+def pack_root(agent_path: str) -> str:
+    """Pack directory shared by the agents stored beside agent_path"""
+    return os.path.join(os.path.dirname(os.path.abspath(agent_path)), PACK_DIR)
+
+
+def open_pack(root: str) -> AgentPack:
+    """The process-wide AgentPack for a pack directory"""
+    with _packs_lock:
+        if root not in _packs:
+            _packs[root] = AgentPack(root)
+        return _packs[root]
+
+
+class PackedVectorStore(SmallVectorStore):
+    """A small store kept as one record of the shared packs instead of its own directory"""
+
+    def __init__(self, path: str, embedding: Embeddings, contents: _Contents, pack: AgentPack,
+                 storage: Optional[Dict[str, Any]] = None):
+        super().__init__(path, embedding, contents, storage=storage)
+        self.pack = pack
+        self.agent_key = os.path.basename(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """True when the agent at path is held in the packs"""
+        root = pack_root(path)
+        return os.path.isdir(root) and open_pack(root).contains(os.path.basename(path))
+
+    @staticmethod
+    def remove(path: str) -> bool:
+        """Drop the packed record of the agent at path, if any"""
+        root = pack_root(path)
+        return os.path.isdir(root) and open_pack(root).delete(os.path.basename(path))
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, storage: Optional[Dict[str, Any]] = None,
+             **kwargs) -> "PackedVectorStore":
+        pack = open_pack(pack_root(path))
+        data = pack.read(os.path.basename(path))
+        if data is None:
+            raise FileNotFoundError(f"No packed vector index found for {path}")
+        return cls(path, embedding, decode_record(data), pack, storage=storage)
+
+    @classmethod
+    def create(cls, path: str, embedding: Embeddings, vectorstore: FAISS,
+               chunk_sources: Optional[Dict[str, str]] = None,
+               chunk_records: Optional[Dict[str, str]] = None,
+               storage: Optional[Dict[str, Any]] = None, **kwargs) -> "PackedVectorStore":
+        """Create a packed store for the agent at path holding the chunks of vectorstore"""
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        store = cls(path, embedding, cls._contents_from(vectorstore, chunk_sources, chunk_records),
+                    open_pack(pack_root(path)), storage=storage)
+        store._write(store._contents)
+        return store
+
+    def _write(self, contents: _Contents):
+        """Append a new record and repoint the agent at it (lock held by writers)"""
+        self.pack.write(self.agent_key, encode_record(contents))
+        self._contents = contents
+
+    def upgrade(self) -> SegmentedVectorStore:
+        """
+        Rebuild the store as a SegmentedVectorStore in the agent's own
+        directory and drop its packed record. This object must not be used after.
+        """
+        with self._lock:
+            staging_path = self.path + UPGRADE_STAGING_SUFFIX
+            self._create_segmented(staging_path)
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(staging_path, self.path)
+            self.pack.delete(self.agent_key)
+
+        return SegmentedVectorStore.load(self.path, self.embedding, storage=self.storage)
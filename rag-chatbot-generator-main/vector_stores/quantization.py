@@ -0,0 +1,294 @@
+"""
+Compact Vector Storage
+Per-agent options for holding segment vectors in memory in less space:
+
+- precision float32: the segment's FAISS flat index as written (default)
+- precision float16: a half-precision scalar-quantized copy (half the memory)
+- precision binary: one sign bit per dimension (1/32 of the memory), searched
+  by Hamming distance with popcount; meant as a first stage whose few
+  hundred candidates are rescored, for the largest agents
+- dimensions N: only the first N dimensions, renormalized, for Matryoshka
+  embedding models whose leading dimensions carry most of the signal
+  (combines with either precision)
+
+Segment files on disk always keep the full float32 vectors; index.faiss
+stays a flat index, so deletes and compaction work as before and the
+storage option can be changed without re-embedding. A compact segment
+searches its small in-memory index for a candidate set and rescores the
+candidates exactly against the float32 vectors, memory-mapped straight out
+of index.faiss, so only the touched rows are ever read.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+STORAGE_PRECISIONS = ('float32', 'float16', 'binary')
+DEFAULT_STORAGE = {"precision": "float32", "dimensions": None}
+
+# Smallest truncated dimension accepted
+MIN_DIMENSIONS = 32
+
+# Compact search fetches max(k * RESCORE_FACTOR, MIN_RESCORE_CANDIDATES) candidates to rescore
+RESCORE_FACTOR = int(os.environ.get('RESCORE_FACTOR', '8'))
+MIN_RESCORE_CANDIDATES = 32
+
+# Binary codes rank coarsely, so at least this many candidates are rescored
+BINARY_RESCORE_CANDIDATES = int(os.environ.get('BINARY_RESCORE_CANDIDATES', '200'))
+
+# Recall report: queries sampled from the agent's chunks and vectors searched
+REPORT_QUERIES = 200
+REPORT_MAX_VECTORS = 100000
+
+# faiss.write_index fourccs of flat indexes, whose float32 vectors end the file
+_FLAT_FOURCCS = (b'IxF2', b'IxFI')
+
+_BYTES_PER_VALUE = {'float32': 4, 'float16': 2}
+
+
+def storage_settings(precision: Optional[str] = None, dimensions: Optional[int] = None,
+                     full_dimension: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Validated storage option. dimensions equal to the full dimension means
+    no truncation. Raises ValueError for an unknown precision or a
+    dimension outside [MIN_DIMENSIONS, full_dimension].
+    """
+    precision = precision or DEFAULT_STORAGE["precision"]
+    if precision not in STORAGE_PRECISIONS:
+        raise ValueError(f"Unknown vector precision '{precision}'. Use one of: {', '.join(STORAGE_PRECISIONS)}")
+
+    if dimensions is not None:
+        dimensions = int(dimensions)
+        if full_dimension and dimensions >= full_dimension:
+            dimensions = None
+        elif dimensions < MIN_DIMENSIONS:
+            raise ValueError(f"dimensions must be at least {MIN_DIMENSIONS}")
+    return {"precision": precision, "dimensions": dimensions}
+
+
+def is_compact(storage: Optional[Dict[str, Any]]) -> bool:
+    """True when a storage option needs a compact index (anything but full float32)"""
+    return bool(storage) and (storage.get("precision", "float32") != "float32" or bool(storage.get("dimensions")))
+
+
+def bytes_per_vector(storage: Dict[str, Any], dimension: int) -> int:
+    """In-memory size of one vector under a storage option"""
+    dimensions = storage.get("dimensions") or dimension
+    if storage.get("precision") == "binary":
+        return (dimensions + 7) // 8
+    return dimensions * _BYTES_PER_VALUE[storage.get("precision", "float32")]
+
+
+def rescore_candidates(storage: Dict[str, Any], k: int) -> int:
+    """Number of compact candidates rescored in float32 for k results"""
+    floor = BINARY_RESCORE_CANDIDATES if storage.get("precision") == "binary" else MIN_RESCORE_CANDIDATES
+    return max(k * RESCORE_FACTOR, floor)
+
+
+def map_flat_vectors(index_file: str) -> np.ndarray:
+    """
+    Read-only memory map of the float32 vectors of a flat index written by
+    faiss.write_index. The header is read to size the map; the vectors are
+    the last ntotal * d * 4 bytes of the file.
+    """
+    with open(index_file, 'rb') as f:
+        header = f.read(20)
+    if header[:4] not in _FLAT_FOURCCS:
+        raise ValueError(f"{index_file} is not a flat FAISS index")
+
+    dimension = int(np.frombuffer(header, dtype=np.int32, count=1, offset=4)[0])
+    ntotal = int(np.frombuffer(header, dtype=np.int64, count=1, offset=8)[0])
+    payload = ntotal * dimension * 4
+    offset = os.path.getsize(index_file) - payload
+    if offset < len(header):
+        raise ValueError(f"{index_file} is shorter than its {ntotal} x {dimension} vectors")
+    if ntotal == 0:
+        return np.empty((0, dimension), dtype=np.float32)
+    return np.memmap(index_file, dtype=np.float32, mode='r', offset=offset, shape=(ntotal, dimension))
+
+
+def truncate(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """First `dimensions` columns, rescaled to unit length (Matryoshka truncation)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not dimensions:
+        return vectors
+    head = np.array(vectors[:, :dimensions], dtype=np.float32)
+    faiss.normalize_L2(head)
+    return head
+
+
+class CompactIndex:
+    """A segment's compact in-memory index plus its memory-mapped float32 vectors for rescoring"""
+
+    def __init__(self, vectors: np.ndarray, storage: Dict[str, Any]):
+        """
+        Build the compact index.
+
+        Args:
+            vectors: Full float32 vectors in FAISS position order (usually a memory map)
+            storage: Storage option (see storage_settings)
+        """
+        self.vectors = vectors
+        self.storage = storage
+        self.dimension = vectors.shape[1]
+        self.dimensions = storage.get("dimensions") or self.dimension
+
+        self.binary = storage.get("precision") == "binary"
+        self.center: Optional[np.ndarray] = None
+
+        if self.binary:
+            # Sign bits around the segment's mean: embedding dimensions are often
+            # offset from zero, which would leave many bits the same for every vector
+            total = np.zeros(self.dimensions, dtype=np.float64)
+            for start in range(0, len(vectors), 65536):
+                total += truncate(vectors[start:start + 65536], storage.get("dimensions")).sum(axis=0)
+            self.center = (total / max(1, len(vectors))).astype(np.float32)
+            # Codes are padded to whole bytes
+            self.index = faiss.IndexBinaryFlat(((self.dimensions + 7) // 8) * 8)
+        elif storage.get("precision") == "float16":
+            self.index = faiss.IndexScalarQuantizer(self.dimensions, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        else:
+            self.index = faiss.IndexFlatL2(self.dimensions)
+
+        # Add in blocks so a memory-mapped segment is never copied whole
+        for start in range(0, len(vectors), 65536):
+            self.index.add(self._encode(vectors[start:start + 65536]))
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Vectors as the compact index stores them: truncated, and sign bits for binary"""
+        vectors = truncate(vectors, self.storage.get("dimensions"))
+        if self.binary:
+            return np.packbits(vectors > self.center, axis=1)
+        return vectors
+
+    @classmethod
+    def from_file(cls, index_file: str, storage: Dict[str, Any]) -> "CompactIndex":
+        return cls(map_flat_vectors(index_file), storage)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.ntotal * bytes_per_vector(self.storage, self.dimension)
+
+    def candidates(self, queries: np.ndarray, count: int, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """First stage: positions of the closest `count` vectors in the compact index, one row per query (-1 pads)"""
+        compact_queries = self._encode(queries.reshape(-1, self.dimension))
+        params = None
+        if positions is not None:
+            # The selector must stay referenced for the duration of the search
+            selector = faiss.IDSelectorBatch(positions)
+            params = faiss.SearchParameters(sel=selector)
+        _, found = self.index.search(compact_queries, count, params=params)
+        return found
+
+    def rescore(self, query: np.ndarray, found: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Second stage: exact float32 top-k (position, squared L2 distance) among candidate positions"""
+        found = found[found >= 0]
+        if found.size == 0:
+            return []
+        # Sorted positions read the memory map front to back
+        found = np.sort(found)
+        distances = ((np.asarray(self.vectors[found], dtype=np.float32) - query) ** 2).sum(axis=1)
+        best = np.argsort(distances, kind='stable')[:k]
+        return [(int(found[i]), float(distances[i])) for i in best]
+
+    def search(self, query: np.ndarray, k: int, positions: Optional[np.ndarray] = None,
+               candidates: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (position, squared L2 distance) pairs: compact candidates
+        rescored exactly in float32. positions restricts the search (filters);
+        a restriction no larger than the candidate set is scored exactly.
+        """
+        if k <= 0 or self.ntotal == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        count = candidates or rescore_candidates(self.storage, k)
+
+        if positions is not None and positions.size <= count:
+            found = positions
+        else:
+            found = self.candidates(query, min(count, self.ntotal), positions)[0]
+        return self.rescore(query, found, k)
+
+
+def _sample_rows(parts: Sequence[np.ndarray], count: int, rng: np.random.RandomState) -> np.ndarray:
+    """Up to count rows drawn uniformly from several arrays, copied into one float32 array"""
+    sizes = [len(part) for part in parts]
+    total = sum(sizes)
+    if total <= count:
+        return np.concatenate([np.asarray(part, dtype=np.float32) for part in parts])
+
+    chosen = np.sort(rng.choice(total, count, replace=False))
+    rows = []
+    start = 0
+    for part, size in zip(parts, sizes):
+        local = chosen[(chosen >= start) & (chosen < start + size)] - start
+        if local.size:
+            rows.append(np.asarray(part[local], dtype=np.float32))
+        start += size
+    return np.concatenate(rows)
+
+
+def recall_report(vectors: Sequence[np.ndarray], options: List[Dict[str, Any]], k: int = 4,
+                  queries: Optional[np.ndarray] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Recall@k and memory of each storage option, against exact float32 search.
+
+    vectors are the float32 vectors of each segment (memory maps are fine).
+    Without queries, up to REPORT_QUERIES stored vectors are used as queries
+    and each one's own vector is left out of its results. Beyond
+    REPORT_MAX_VECTORS vectors a sample is searched, so recall is an estimate
+    for large agents; memory figures are for all vectors.
+    """
+    rng = np.random.RandomState(seed)
+    total_vectors = sum(len(part) for part in vectors)
+    vectors = np.ascontiguousarray(_sample_rows(vectors, REPORT_MAX_VECTORS, rng))
+    dimension = vectors.shape[1]
+
+    exclude_self = queries is None
+    if exclude_self:
+        query_positions = rng.choice(len(vectors), min(REPORT_QUERIES, len(vectors)), replace=False)
+        queries = vectors[query_positions]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    # One extra result to drop the query's own vector
+    fetch = min(k + 1 if exclude_self else k, len(vectors))
+    exact = faiss.IndexFlatL2(dimension)
+    exact.add(vectors)
+    _, truth = exact.search(queries, fetch)
+
+    def top(found: List[int], index: int) -> set:
+        if exclude_self:
+            found = [p for p in found if p != query_positions[index]]
+        return set(found[:k])
+
+    expected = [top(list(row), i) for i, row in enumerate(truth)]
+
+    possible = sum(len(wanted) for wanted in expected)
+    report = []
+    for storage in options:
+        first_hits = rescored_hits = possible
+        if is_compact(storage):
+            # Same candidate count as a live query for k results
+            compact = CompactIndex(vectors, storage)
+            found = compact.candidates(queries, min(len(vectors), rescore_candidates(storage, fetch)))
+            first_hits = rescored_hits = 0
+            for i, wanted in enumerate(expected):
+                first_hits += len(top([int(p) for p in found[i][:fetch]], i) & wanted)
+                rescored = compact.rescore(queries[i], found[i], fetch)
+                rescored_hits += len(top([p for p, _ in rescored], i) & wanted)
+
+        per_vector = bytes_per_vector(storage, dimension)
+        report.append({
+            "precision": storage.get("precision", "float32"),
+            "dimensions": storage.get("dimensions") or dimension,
+            "bytes_per_vector": per_vector,
+            "memory_mb": round(total_vectors * per_vector / (1024 * 1024), 2),
+            "recall_first_stage": round(first_hits / possible, 4) if possible else None,
+            "recall": round(rescored_hits / possible, 4) if possible else None
+        })
+    return report
@@ -0,0 +1,675 @@
+"""
+Segmented FAISS Vector Store
+Stores an agent's index as a list of append-only FAISS segments. Each update
+writes a small new segment instead of rewriting the whole index, queries
+search every segment and merge the top-k, and a background compactor folds
+segments together once there are too many or they grow too large.
+
+Deleted chunks are tombstoned in the chunk registry rather than removed
+from their segment files: searches skip them, and compaction drops them for
+good. Deletes never wait for a running compaction; tombstones added while
+it runs are carried over to the merged segment.
+
+Segments can be held in memory in a compact form (float16, truncated
+dimensions; see quantization.py) while their files keep float32 vectors.
+"""
+import os
+import json
+import heapq
+import pickle
+import shutil
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import FAISS
+
+from .chunk_registry import ChunkRegistry
+from .metadata_index import MetadataIndex, search_positions
+from .quantization import CompactIndex, is_compact, map_flat_vectors
+
+MANIFEST_FILE = "manifest.json"
+REGISTRY_FILE = "chunks.sqlite"
+MANIFEST_VERSION = 1
+SEGMENT_PREFIX = "seg_"
+
+# Files written by FAISS.save_local; also the legacy single-index layout
+FAISS_INDEX_FILE = "index.faiss"
+FAISS_DOCSTORE_FILE = "index.pkl"
+LEGACY_INDEX_FILES = (FAISS_INDEX_FILE, FAISS_DOCSTORE_FILE)
+
+# Compaction thresholds
+COMPACT_MAX_SEGMENTS = int(os.environ.get('COMPACT_MAX_SEGMENTS', '8'))
+COMPACT_MAX_DELTA_MB = int(os.environ.get('COMPACT_MAX_DELTA_MB', '64'))
+COMPACT_MAX_DELETED_PCT = int(os.environ.get('COMPACT_MAX_DELETED_PCT', '20'))
+
+
+def _dir_size(path: str) -> int:
+    """Total size in bytes of the files in a directory"""
+    total = 0
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            total += os.path.getsize(file_path)
+    return total
+
+
+class Segment:
+    """One immutable FAISS index on disk plus its loaded copy and tombstoned chunk ids"""
+
+    def __init__(self, name: str, path: str, store: FAISS, size_bytes: int,
+                 compact: Optional[CompactIndex] = None, deleted: Iterable[str] = ()):
+        self.name = name
+        self.path = path
+        self.store = store
+        self.size_bytes = size_bytes
+        # Compact storage: store.index is the compact index, float32 vectors are memory-mapped
+        self.compact = compact
+        self.deleted = frozenset(deleted)
+        self._deleted_positions: Optional[np.ndarray] = None
+        self._metadata_index: Optional[MetadataIndex] = None
+
+    @classmethod
+    def open(cls, name: str, path: str, embedding: Embeddings, storage: Optional[Dict[str, Any]] = None,
+             size_bytes: Optional[int] = None, store: Optional[FAISS] = None,
+             deleted: Iterable[str] = ()) -> "Segment":
+        """
+        Load a segment. Compact storage never reads the float32 vectors into
+        memory. store, when the segment was just written from memory, saves
+        reading it back.
+        """
+        size_bytes = _dir_size(path) if size_bytes is None else size_bytes
+        if not is_compact(storage):
+            store = store or FAISS.load_local(path, embedding, allow_dangerous_deserialization=True)
+            return cls(name, path, store, size_bytes, deleted=deleted)
+
+        if store is not None:
+            docstore, index_to_docstore_id = store.docstore, store.index_to_docstore_id
+        else:
+            with open(os.path.join(path, FAISS_DOCSTORE_FILE), 'rb') as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+        compact = CompactIndex.from_file(os.path.join(path, FAISS_INDEX_FILE), storage)
+        return cls(name, path, FAISS(embedding, compact.index, docstore, index_to_docstore_id), size_bytes, compact,
+                   deleted=deleted)
+
+    def with_deleted(self, chunk_ids: Iterable[str]) -> "Segment":
+        """A copy sharing this segment's index with more chunks tombstoned"""
+        segment = Segment(self.name, self.path, self.store, self.size_bytes, self.compact,
+                          self.deleted.union(chunk_ids))
+        segment._metadata_index = self._metadata_index
+        return segment
+
+    def contains(self, chunk_id: str) -> bool:
+        """True if the chunk is in this segment and not tombstoned"""
+        return chunk_id not in self.deleted and isinstance(self.store.docstore.search(chunk_id), Document)
+
+    def chunk_ids(self) -> List[str]:
+        """Ids of the live chunks, in position order"""
+        return [chunk_id for chunk_id in self.store.index_to_docstore_id.values() if chunk_id not in self.deleted]
+
+    @property
+    def ntotal(self) -> int:
+        """Live chunks (tombstoned ones excluded)"""
+        return self.store.index.ntotal - len(self.deleted)
+
+    @property
+    def deleted_positions(self) -> np.ndarray:
+        """Sorted index positions of the tombstoned chunks"""
+        if self._deleted_positions is None:
+            self._deleted_positions = np.array(
+                sorted(position for position, chunk_id in self.store.index_to_docstore_id.items()
+                       if chunk_id in self.deleted), dtype=np.int64
+            )
+        return self._deleted_positions
+
+    def _live(self, positions: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """positions (all positions when None) without the tombstoned ones; None if nothing is tombstoned"""
+        if not self.deleted:
+            return positions
+        if positions is None:
+            positions = np.arange(self.store.index.ntotal, dtype=np.int64)
+        return np.setdiff1d(positions, self.deleted_positions, assume_unique=True)
+
+    @property
+    def dimension(self) -> int:
+        return self.compact.dimension if self.compact is not None else self.store.index.d
+
+    @property
+    def memory_bytes(self) -> int:
+        """Memory held by the segment's vectors, tombstoned ones included"""
+        if self.compact is not None:
+            return self.compact.memory_bytes
+        return self.store.index.ntotal * self.store.index.d * 4
+
+    def full_vectors(self) -> np.ndarray:
+        """The segment's float32 vectors, memory-mapped from disk"""
+        return map_flat_vectors(os.path.join(self.path, FAISS_INDEX_FILE))
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """Posting lists for filtered search, built on first use (segments are immutable)"""
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex.build(self.store)
+        return self._metadata_index
+
+    def search(self, embedding: List[float], k: int, filter: Any = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Top-k of this segment; dict filters are applied before scoring via
+        posting lists, and tombstoned chunks are never scored.
+        """
+        if self.compact is not None:
+            return self._compact_search(embedding, k, filter, **kwargs)
+        if isinstance(filter, dict) and filter:
+            return search_positions(self.store, embedding, k, self._live(self.metadata_index.select(filter)))
+        if self.deleted:
+            fetch = k if filter is None else max(k, kwargs.get("fetch_k", 20))
+            results = search_positions(self.store, embedding, fetch, self._live(None))
+            if callable(filter):
+                results = [(doc, distance) for doc, distance in results if filter(doc.metadata)]
+            return results[:k]
+        return self.store.similarity_search_with_score_by_vector(embedding, k=k, filter=filter, **kwargs)
+
+    def _compact_search(self, embedding: List[float], k: int, filter: Any = None,
+                        **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Compact candidates rescored in float32; callable filters are applied to a larger fetch"""
+        positions = None
+        fetch = k
+        if isinstance(filter, dict) and filter:
+            positions = self.metadata_index.select(filter)
+        elif filter is not None:
+            fetch = max(k, kwargs.get("fetch_k", 20))
+        positions = self._live(positions)
+        if positions is not None and positions.size == 0:
+            return []
+
+        results = []
+        for position, distance in self.compact.search(np.array(embedding, dtype=np.float32), fetch, positions):
+            doc = self.store.docstore.search(self.store.index_to_docstore_id[position])
+            if not isinstance(doc, Document):
+                continue
+            if callable(filter) and not filter(doc.metadata):
+                continue
+            results.append((doc, distance))
+        return results[:k]
+
+    def to_manifest(self) -> dict:
+        # Chunks stored in the segment file, tombstoned ones included
+        return {"name": self.name, "chunks": self.store.index.ntotal, "size_bytes": self.size_bytes}
+
+
+class SegmentedVectorStore(VectorStore):
+    """Vector store made of append-only FAISS segments with background compaction"""
+
+    def __init__(self, path: str, embedding: Embeddings, segments: List[Segment], next_id: int = 0,
+                 max_segments: int = COMPACT_MAX_SEGMENTS, max_delta_mb: int = COMPACT_MAX_DELTA_MB,
+                 max_deleted_pct: int = COMPACT_MAX_DELETED_PCT, storage: Optional[Dict[str, Any]] = None):
+        """
+        Initialize from already loaded segments. Use load() or create() instead.
+
+        Args:
+            path: Agent directory holding the manifest and segment directories
+            embedding: Embedding model used for queries
+            segments: Loaded segments, oldest first
+            next_id: Number used for the next segment directory
+            max_segments: Compact once there are more segments than this
+            max_delta_mb: Compact once segments after the first exceed this size
+            max_deleted_pct: Compact once this share of the stored chunks is tombstoned
+            storage: In-memory vector storage option (default: float32; see quantization.py)
+        """
+        self.path = path
+        self.embedding = embedding
+        self.segments = segments
+        self.next_id = next_id
+        self.max_segments = max_segments
+        self.max_delta_bytes = max_delta_mb * 1024 * 1024
+        self.max_deleted_pct = max_deleted_pct
+        self.storage = storage
+
+        self._lock = threading.RLock()
+        self._compaction_thread: Optional[threading.Thread] = None
+
+        # Serializes operations that replace existing segments (compaction, storage changes)
+        self._rewrite_lock = threading.Lock()
+        # Names of the segments a running compaction is merging
+        self._compacting: frozenset = frozenset()
+
+        # Persistent chunk-id -> source mapping
+        self.registry = ChunkRegistry(os.path.join(path, REGISTRY_FILE))
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    @property
+    def ntotal(self) -> int:
+        return sum(seg.ntotal for seg in self.segments)
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """Vector dimension of the index (None while it has no segments)"""
+        with self._lock:
+            return self.segments[0].dimension if self.segments else None
+
+    @property
+    def memory_bytes(self) -> int:
+        """Memory held by the vectors of all segments"""
+        with self._lock:
+            return sum(seg.memory_bytes for seg in self.segments)
+
+    # ==================== LOADING & PERSISTENCE ====================
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, storage: Optional[Dict[str, Any]] = None,
+             **kwargs) -> "SegmentedVectorStore":
+        """Load an agent's segments, migrating the legacy single-index layout if needed"""
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+
+        if not os.path.exists(manifest_path):
+            if all(os.path.exists(os.path.join(path, f)) for f in LEGACY_INDEX_FILES):
+                cls._migrate_legacy_layout(path)
+            else:
+                raise FileNotFoundError(f"No vector index found at {path}")
+
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        segments = []
+        for entry in manifest.get("segments", []):
+            seg_path = os.path.join(path, entry["name"])
+            segments.append(Segment.open(entry["name"], seg_path, embedding, storage, entry.get("size_bytes")))
+
+        cls._remove_orphans(path, {seg.name for seg in segments})
+        store = cls(path, embedding, segments, next_id=manifest.get("next_id", len(segments)),
+                    storage=storage, **kwargs)
+        store._reconcile_registry()
+        tombstones = store.registry.tombstones()
+        store.segments = [seg.with_deleted(tombstones[seg.name]) if seg.name in tombstones else seg
+                          for seg in store.segments]
+        return store
+
+    @classmethod
+    def create(cls, path: str, embedding: Embeddings, vectorstore: FAISS,
+               chunk_sources: Optional[Dict[str, str]] = None,
+               chunk_records: Optional[Dict[str, str]] = None, **kwargs) -> "SegmentedVectorStore":
+        """Create a new segmented store at path whose first segment is vectorstore"""
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+        store = cls(path, embedding, [], **kwargs)
+        store.append(vectorstore, chunk_sources, chunk_records)
+        return store
+
+    @staticmethod
+    def _migrate_legacy_layout(path: str):
+        """Move a pre-segment index.faiss/index.pkl pair into the first segment"""
+        seg_name = f"{SEGMENT_PREFIX}{0:06d}"
+        seg_path = os.path.join(path, seg_name)
+        os.makedirs(seg_path, exist_ok=True)
+        for file_name in LEGACY_INDEX_FILES:
+            os.replace(os.path.join(path, file_name), os.path.join(seg_path, file_name))
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "next_id": 1,
+            "segments": [{"name": seg_name, "size_bytes": _dir_size(seg_path)}]
+        }
+        SegmentedVectorStore._write_json_atomic(os.path.join(path, MANIFEST_FILE), manifest)
+        print(f"[INFO] Migrated legacy index at {path} to segmented layout")
+
+    @staticmethod
+    def _remove_orphans(path: str, live: set):
+        """Delete segment directories left behind by interrupted writes or compactions"""
+        for name in os.listdir(path):
+            if name.startswith(SEGMENT_PREFIX) and name not in live:
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    @staticmethod
+    def _write_json_atomic(file_path: str, data: dict):
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, file_path)
+
+    def _reconcile_registry(self):
+        """
+        Repoint registry rows left on segments missing from the manifest (a
+        crash between a compaction's manifest commit and its registry update)
+        at the segments that now hold those chunks. Rows of chunks no segment
+        holds any more are dropped.
+        """
+        live = {seg.name for seg in self.segments}
+        stale = [name for name in self.registry.segment_names() if name not in live]
+        if not stale:
+            return
+
+        chunk_ids, tombstone_ids = self.registry.ids_in_segments(stale)
+        holders = {}
+        for chunk_id in chunk_ids + tombstone_ids:
+            for seg in self.segments:
+                if seg.contains(chunk_id):
+                    holders[chunk_id] = seg.name
+                    break
+
+        self.registry.reassign({c: holders[c] for c in chunk_ids if c in holders},
+                               {c: holders[c] for c in tombstone_ids if c in holders},
+                               [c for c in chunk_ids + tombstone_ids if c not in holders])
+        print(f"[INFO] Repointed registry rows of {len(stale)} missing segments in {self.path}")
+
+    def _write_manifest(self):
+        """Persist the current segment list (lock held)"""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "next_id": self.next_id,
+            "segments": [seg.to_manifest() for seg in self.segments]
+        }
+        self._write_json_atomic(os.path.join(self.path, MANIFEST_FILE), manifest)
+
+    def _write_segment(self, vectorstore: FAISS) -> Segment:
+        """Save a FAISS store as a new segment directory (not yet in the manifest)"""
+        with self._lock:
+            seg_name = f"{SEGMENT_PREFIX}{self.next_id:06d}"
+            self.next_id += 1
+
+        seg_path = os.path.join(self.path, seg_name)
+        tmp_path = seg_path + ".tmp"
+        vectorstore.save_local(tmp_path)
+        os.replace(tmp_path, seg_path)
+
+        return Segment.open(seg_name, seg_path, self.embedding, self.storage, store=vectorstore)
+
+    # ==================== WRITES ====================
+
+    def append(self, vectorstore: FAISS, chunk_sources: Optional[Dict[str, str]] = None,
+               chunk_records: Optional[Dict[str, str]] = None) -> Segment:
+        """
+        Add new vectors as their own segment; existing segments are not rewritten.
+
+        Args:
+            vectorstore: FAISS store holding only the new chunks
+            chunk_sources: Optional chunk id -> source name mapping to record
+            chunk_records: Optional chunk id -> record key mapping (keyed records only)
+        """
+        segment = self._write_segment(vectorstore)
+        if chunk_sources:
+            self.registry.add(segment.name, chunk_sources, chunk_records)
+        with self._lock:
+            self.segments.append(segment)
+            self._write_manifest()
+        return segment
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id. Returns True if any chunk was removed."""
+        return self.delete_ids(ids or []) > 0
+
+    def delete_ids(self, chunk_ids: List[str]) -> int:
+        """
+        Remove chunks by id. They are tombstoned in the chunk registry (the
+        commit point) and dropped from disk by the next compaction; a segment
+        left with no live chunks is removed at once. Does not wait for a
+        running compaction. Returns the number removed.
+        """
+        with self._lock:
+            current = {seg.name: seg for seg in self.segments}
+            by_segment: Dict[str, set] = {}
+
+            # Ids the registry does not know, or places in a segment that is gone
+            # (untracked chunks, an interrupted compaction), are looked up directly
+            unresolved = set(chunk_ids)
+            for name, ids in self.registry.segments_for_ids(chunk_ids).items():
+                seg = current.get(name)
+                if seg is None:
+                    continue
+                found = {cid for cid in ids if seg.contains(cid)}
+                if found:
+                    by_segment[name] = found
+                    unresolved -= found
+            for chunk_id in unresolved:
+                for seg in current.values():
+                    if seg.contains(chunk_id):
+                        by_segment.setdefault(seg.name, set()).add(chunk_id)
+                        break
+
+            if not by_segment:
+                return 0
+            self.registry.tombstone({name: list(ids) for name, ids in by_segment.items()})
+
+            segments = []
+            emptied = []
+            for seg in self.segments:
+                if seg.name in by_segment:
+                    seg = seg.with_deleted(by_segment[seg.name])
+                if seg.ntotal > 0:
+                    segments.append(seg)
+                else:
+                    emptied.append(seg)
+            self.segments = segments
+
+            # A segment being merged keeps its files and tombstones until the compaction finishes
+            removable = [seg for seg in emptied if seg.name not in self._compacting]
+            if emptied:
+                self._write_manifest()
+            if removable:
+                self.registry.drop_tombstones(seg.name for seg in removable)
+
+        for seg in removable:
+            shutil.rmtree(seg.path, ignore_errors=True)
+        return sum(len(ids) for ids in by_segment.values())
+
+    def delete_source(self, source: str) -> int:
+        """Remove every chunk recorded for a source. Returns the number removed."""
+        chunk_ids = [cid for ids in self.registry.ids_for_source(source).values() for cid in ids]
+        if not chunk_ids:
+            return 0
+        return self.delete_ids(chunk_ids)
+
+    def source_chunk_ids(self, source: str) -> List[str]:
+        """Ids of the chunks recorded for a source"""
+        return [cid for ids in self.registry.ids_for_source(source).values() for cid in ids]
+
+    def record_chunk_ids(self, source: str, record_keys: List[str]) -> List[str]:
+        """Ids of the chunks recorded for the given records of a source"""
+        return self.registry.ids_for_records(source, record_keys)
+
+    def chunk_entries(self, chunk_ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """(source, record key) of each tracked chunk id"""
+        return self.registry.entries(chunk_ids)
+
+    def source_counts(self) -> List[Tuple[str, int]]:
+        """Number of tracked chunks per source"""
+        return self.registry.source_counts()
+
+    def iter_chunks(self) -> Iterable[Tuple[str, Document]]:
+        """(chunk id, document) of every stored chunk, segment by segment"""
+        with self._lock:
+            segments = list(self.segments)
+        for seg in segments:
+            for chunk_id in seg.chunk_ids():
+                yield chunk_id, seg.store.docstore.search(chunk_id)
+
+    def _segment_by_name(self, name: str) -> Optional[Segment]:
+        with self._lock:
+            for seg in self.segments:
+                if seg.name == name:
+                    return seg
+        return None
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed texts and append them as a new segment"""
+        vectorstore = FAISS.from_texts(list(texts), self.embedding, metadatas=metadatas, ids=ids)
+        self.append(vectorstore)
+        return list(vectorstore.index_to_docstore_id.values())
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   path: Optional[str] = None, **kwargs: Any) -> "SegmentedVectorStore":
+        if path is None:
+            raise ValueError("SegmentedVectorStore.from_texts requires a path")
+        vectorstore = FAISS.from_texts(texts, embedding, metadatas=metadatas, ids=kwargs.pop("ids", None))
+        return cls.create(path, embedding, vectorstore, **kwargs)
+
+    # ==================== SEARCH ====================
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Any = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Search every segment and merge the top-k by distance (lower is closer).
+
+        A dict filter such as {"table_name": "orders"} restricts each segment to
+        the matching positions before scoring; callables fall back to LangChain's
+        post-filtering.
+        """
+        with self._lock:
+            segments = list(self.segments)
+
+        results = []
+        for seg in segments:
+            results.extend(seg.search(embedding, k, filter=filter, **kwargs))
+
+        return heapq.nsmallest(k, results, key=lambda pair: pair[1])
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self.embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    # ==================== COMPACTION ====================
+
+    def needs_compaction(self) -> bool:
+        """True when the segment count, the size of the delta segments or the tombstoned share passes its threshold"""
+        with self._lock:
+            if len(self.segments) > self.max_segments:
+                return True
+            deleted = sum(len(seg.deleted) for seg in self.segments)
+            if deleted and deleted * 100 >= (self.ntotal + deleted) * self.max_deleted_pct:
+                return True
+            delta_bytes = sum(seg.size_bytes for seg in self.segments[1:])
+            return len(self.segments) > 1 and delta_bytes > self.max_delta_bytes
+
+    def schedule_compaction(self) -> bool:
+        """Start a background compaction if thresholds are passed and none is running"""
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return False
+            if not self.needs_compaction():
+                return False
+            self._compaction_thread = threading.Thread(
+                target=self._compact_safely, name=f"compact-{os.path.basename(self.path)}", daemon=True
+            )
+            self._compaction_thread.start()
+            return True
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"[ERROR] Compaction failed for {self.path}: {e}")
+
+    def compact(self):
+        """
+        Merge all current segments into one, dropping tombstoned chunks.
+        Segments appended meanwhile are kept.
+        """
+        with self._rewrite_lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        with self._lock:
+            snapshot = list(self.segments)
+            if len(snapshot) < 2 and not any(seg.deleted for seg in snapshot):
+                return
+            names = frozenset(seg.name for seg in snapshot)
+            self._compacting = names
+
+        try:
+            # Merge fresh copies from disk: faiss merge_from empties its source,
+            # and the loaded segments must keep serving queries meanwhile
+            def live_copy(seg: Segment) -> FAISS:
+                fresh = FAISS.load_local(seg.path, self.embedding, allow_dangerous_deserialization=True)
+                if seg.deleted:
+                    # FAISS.delete maps ids to index positions and calls index.remove_ids
+                    fresh.delete(list(seg.deleted))
+                return fresh
+
+            merged = live_copy(snapshot[0])
+            for seg in snapshot[1:]:
+                merged.merge_from(live_copy(seg))
+
+            merged_segment = self._write_segment(merged)
+            purged = [cid for seg in snapshot for cid in seg.deleted]
+
+            with self._lock:
+                # Chunks deleted while merging stay tombstoned in the merged segment
+                current = {seg.name: seg for seg in self.segments}
+                late = set()
+                for seg in snapshot:
+                    now = current.get(seg.name)
+                    late.update(now.deleted - seg.deleted if now is not None else seg.chunk_ids())
+                if late:
+                    merged_segment = merged_segment.with_deleted(late)
+
+                self.segments = [merged_segment] + [seg for seg in self.segments if seg.name not in names]
+                self._write_manifest()
+                # After the manifest commit: a crash before this is repaired by _reconcile_registry
+                self.registry.move_segments(names, merged_segment.name, purged)
+        finally:
+            with self._lock:
+                self._compacting = frozenset()
+
+        for seg in snapshot:
+            shutil.rmtree(seg.path, ignore_errors=True)
+
+        print(f"[OK] Compacted {len(snapshot)} segments into {merged_segment.name} "
+              f"({merged_segment.ntotal} chunks)")
+
+    def set_storage(self, storage: Optional[Dict[str, Any]]):
+        """
+        Switch the in-memory vector storage. Segments are reopened from their
+        float32 files one by one; queries keep running on the old copies meanwhile.
+        """
+        with self._rewrite_lock:
+            with self._lock:
+                self.storage = storage
+                snapshot = list(self.segments)
+
+            reopened = {seg.name: Segment.open(seg.name, seg.path, self.embedding, storage, seg.size_bytes,
+                                               deleted=seg.deleted)
+                        for seg in snapshot}
+
+            with self._lock:
+                # Keep tombstones added by deletes while the segments were reopened
+                self.segments = [reopened[seg.name].with_deleted(seg.deleted) if seg.name in reopened else seg
+                                 for seg in self.segments]
+
+    def full_vectors(self) -> List[np.ndarray]:
+        """Memory-mapped float32 vectors of every segment"""
+        with self._lock:
+            segments = list(self.segments)
+        return [seg.full_vectors() for seg in segments]
+
+    def filter_values(self) -> Dict[str, List[Any]]:
+        """Distinct values of each filterable metadata field across all segments"""
+        with self._lock:
+            segments = list(self.segments)
+
+        merged: Dict[str, Dict[Any, None]] = {}
+        for seg in segments:
+            for field, values in seg.metadata_index.values().items():
+                merged.setdefault(field, {}).update(dict.fromkeys(values))
+        return {field: list(values) for field, values in merged.items()}
+
+    def close(self):
+        """Wait for any running compaction to finish and release the registry"""
+        thread = self._compaction_thread
+        if thread is not None and thread.is_alive():
+            thread.join()
+        self.registry.close()
@@ -0,0 +1,382 @@
+"""
+Small Agent Vector Store
+Agents with only a few thousand chunks are stored as one float32 .npy matrix
+plus one JSON file holding the chunk texts, metadata, sources and record
+keys column by column. Loading is two reads and a single json.load, and a
+query is one matrix-vector product; there is no FAISS index, pickled
+docstore or SQLite registry to open.
+
+Writes rewrite both files: the matrix goes to a new generation file and
+chunks.json, which names it, is replaced last, so a crash leaves either the
+old or the new version. Stores that grow past SMALL_AGENT_MAX_CHUNKS are
+upgraded to a SegmentedVectorStore (see upgrade()).
+"""
+import os
+import json
+import shutil
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import FAISS
+
+from .metadata_index import MetadataIndex
+from .segmented import SegmentedVectorStore
+
+# Agents up to this many chunks use the small store
+SMALL_AGENT_MAX_CHUNKS = int(os.environ.get('SMALL_AGENT_MAX_CHUNKS', '2000'))
+
+SMALL_STORE_FILE = "chunks.json"
+SMALL_STORE_VERSION = 1
+VECTORS_PREFIX = "vectors."
+
+# Where an upgraded segmented store is built before it replaces the small one
+UPGRADE_STAGING_SUFFIX = ".upgrade"
+
+
+def faiss_contents(vectorstore: FAISS) -> Tuple[np.ndarray, List[str], List[Document]]:
+    """Vectors, chunk ids and documents of a flat FAISS store, in position order"""
+    ntotal = vectorstore.index.ntotal
+    vectors = vectorstore.index.reconstruct_n(0, ntotal) if ntotal else np.empty((0, vectorstore.index.d))
+    ids = [vectorstore.index_to_docstore_id[position] for position in range(ntotal)]
+    return np.asarray(vectors, dtype=np.float32), ids, [vectorstore.docstore.search(i) for i in ids]
+
+
+class _Contents:
+    """One immutable version of a small store; replaced whole on every write"""
+
+    def __init__(self, vectors: np.ndarray, ids: List[str], texts: List[str], metadatas: List[dict],
+                 sources: List[Optional[str]], record_keys: List[Optional[str]]):
+        self.vectors = vectors
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.sources = sources
+        self.record_keys = record_keys
+        # Squared norms for ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+        self.norms = (vectors * vectors).sum(axis=1) if len(vectors) else np.empty(0, dtype=np.float32)
+        self._metadata_index: Optional[MetadataIndex] = None
+
+    @classmethod
+    def from_columns(cls, vectors: np.ndarray, data: Dict[str, Any]) -> "_Contents":
+        return cls(vectors, data["ids"], data["texts"], data["metadatas"], data["sources"], data["record_keys"])
+
+    def columns(self) -> Dict[str, Any]:
+        """Everything but the vectors, as stored next to them"""
+        return {
+            "ids": self.ids,
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "sources": self.sources,
+            "record_keys": self.record_keys
+        }
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex.from_metadatas(self.metadatas)
+        return self._metadata_index
+
+    def select(self, keep: np.ndarray) -> "_Contents":
+        """Copy holding only the rows at the given positions"""
+        rows = keep.tolist()
+        return _Contents(self.vectors[keep], [self.ids[i] for i in rows], [self.texts[i] for i in rows],
+                         [self.metadatas[i] for i in rows], [self.sources[i] for i in rows],
+                         [self.record_keys[i] for i in rows])
+
+
+class SmallVectorStore(VectorStore):
+    """Brute-force NumPy vector store for small agents, with the SegmentedVectorStore interface"""
+
+    def __init__(self, path: str, embedding: Embeddings, contents: _Contents, generation: int = 0,
+                 storage: Optional[Dict[str, Any]] = None):
+        """
+        Initialize from loaded contents. Use load() or create() instead.
+
+        Args:
+            path: Agent directory holding chunks.json and the vector matrix
+            embedding: Embedding model used for queries
+            contents: Loaded vectors and chunks
+            generation: Number of the current vector matrix file
+            storage: Vector storage option, applied once the store is upgraded
+                     (small stores always hold float32)
+        """
+        self.path = path
+        self.embedding = embedding
+        self.generation = generation
+        self.storage = storage
+        self._contents = contents
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._contents.ids)
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self._contents.vectors.shape[1] if self.ntotal else None
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._contents.vectors.nbytes
+
+    # ==================== LOADING & PERSISTENCE ====================
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """True when path holds a small store"""
+        return os.path.exists(os.path.join(path, SMALL_STORE_FILE))
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, storage: Optional[Dict[str, Any]] = None,
+             **kwargs) -> "SmallVectorStore":
+        with open(os.path.join(path, SMALL_STORE_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(path, data["vectors"]))
+
+        contents = _Contents.from_columns(vectors, data)
+        cls._remove_stale(path, data["vectors"])
+        return cls(path, embedding, contents, generation=data.get("generation", 0), storage=storage)
+
+    @classmethod
+    def create(cls, path: str, embedding: Embeddings, vectorstore: FAISS,
+               chunk_sources: Optional[Dict[str, str]] = None,
+               chunk_records: Optional[Dict[str, str]] = None,
+               storage: Optional[Dict[str, Any]] = None, **kwargs) -> "SmallVectorStore":
+        """Create a new small store at path holding the chunks of vectorstore"""
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+        store = cls(path, embedding, cls._contents_from(vectorstore, chunk_sources, chunk_records),
+                    storage=storage)
+        store._write(store._contents)
+        return store
+
+    @staticmethod
+    def _contents_from(vectorstore: FAISS, chunk_sources: Optional[Dict[str, str]],
+                       chunk_records: Optional[Dict[str, str]]) -> _Contents:
+        vectors, ids, docs = faiss_contents(vectorstore)
+        chunk_sources = chunk_sources or {}
+        chunk_records = chunk_records or {}
+        return _Contents(vectors, ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs],
+                         [chunk_sources.get(i) for i in ids], [chunk_records.get(i) for i in ids])
+
+    @staticmethod
+    def _remove_stale(path: str, current: str):
+        """Delete vector matrices left behind by earlier or interrupted writes"""
+        for name in os.listdir(path):
+            if name.startswith(VECTORS_PREFIX) and name != current:
+                os.remove(os.path.join(path, name))
+
+    def _write(self, contents: _Contents):
+        """Persist a new version and make it current (lock held by writers)"""
+        self.generation += 1
+        vectors_name = f"{VECTORS_PREFIX}{self.generation:06d}.npy"
+        np.save(os.path.join(self.path, vectors_name), contents.vectors)
+
+        data = {
+            "version": SMALL_STORE_VERSION,
+            "generation": self.generation,
+            "vectors": vectors_name,
+            **contents.columns()
+        }
+        file_path = os.path.join(self.path, SMALL_STORE_FILE)
+        with open(file_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=str)
+        os.replace(file_path + ".tmp", file_path)
+
+        self._contents = contents
+        self._remove_stale(self.path, vectors_name)
+
+    # ==================== WRITES ====================
+
+    def append(self, vectorstore: FAISS, chunk_sources: Optional[Dict[str, str]] = None,
+               chunk_records: Optional[Dict[str, str]] = None):
+        """Add the chunks of a FAISS store, rewriting the (small) files"""
+        new = self._contents_from(vectorstore, chunk_sources, chunk_records)
+        with self._lock:
+            old = self._contents
+            vectors = np.concatenate([old.vectors, new.vectors]) if len(old.ids) else new.vectors
+            self._write(_Contents(vectors, old.ids + new.ids, old.texts + new.texts,
+                                  old.metadatas + new.metadatas, old.sources + new.sources,
+                                  old.record_keys + new.record_keys))
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id. Returns True if any chunk was removed."""
+        return self.delete_ids(ids or []) > 0
+
+    def delete_ids(self, chunk_ids: List[str]) -> int:
+        """Remove chunks by id. Returns the number removed."""
+        doomed = set(chunk_ids)
+        with self._lock:
+            old = self._contents
+            keep = np.array([i for i, chunk_id in enumerate(old.ids) if chunk_id not in doomed], dtype=np.int64)
+            removed = len(old.ids) - len(keep)
+            if removed:
+                self._write(old.select(keep))
+            return removed
+
+    def delete_source(self, source: str) -> int:
+        """Remove every chunk recorded for a source. Returns the number removed."""
+        return self.delete_ids(self.source_chunk_ids(source))
+
+    def source_chunk_ids(self, source: str) -> List[str]:
+        """Ids of the chunks recorded for a source"""
+        contents = self._contents
+        return [chunk_id for chunk_id, s in zip(contents.ids, contents.sources) if s == source]
+
+    def record_chunk_ids(self, source: str, record_keys: List[str]) -> List[str]:
+        """Ids of the chunks recorded for the given records of a source"""
+        wanted = set(record_keys)
+        contents = self._contents
+        return [chunk_id for chunk_id, s, key in zip(contents.ids, contents.sources, contents.record_keys)
+                if s == source and key in wanted]
+
+    def chunk_entries(self, chunk_ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """(source, record key) of each tracked chunk id"""
+        wanted = set(chunk_ids)
+        contents = self._contents
+        return {chunk_id: (s, key) for chunk_id, s, key in zip(contents.ids, contents.sources, contents.record_keys)
+                if chunk_id in wanted and s is not None}
+
+    def source_counts(self) -> List[Tuple[str, int]]:
+        """Number of tracked chunks per source"""
+        counts: Dict[str, int] = {}
+        for source in self._contents.sources:
+            if source is not None:
+                counts[source] = counts.get(source, 0) + 1
+        return sorted(counts.items())
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed texts and append them"""
+        vectorstore = FAISS.from_texts(list(texts), self.embedding, metadatas=metadatas, ids=ids)
+        self.append(vectorstore)
+        return list(vectorstore.index_to_docstore_id.values())
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   path: Optional[str] = None, **kwargs: Any) -> "SmallVectorStore":
+        if path is None:
+            raise ValueError("SmallVectorStore.from_texts requires a path")
+        vectorstore = FAISS.from_texts(texts, embedding, metadatas=metadatas, ids=kwargs.pop("ids", None))
+        return cls.create(path, embedding, vectorstore, **kwargs)
+
+    # ==================== SEARCH ====================
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Any = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Top-k by squared L2 distance (as FAISS reports it) from one matrix-vector
+        product. Dict filters select rows first; callables filter the ranking.
+        """
+        contents = self._contents
+        if not contents.ids or k <= 0:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = contents.norms - 2.0 * (contents.vectors @ query) + float(query @ query)
+
+        positions = np.arange(len(contents.ids))
+        if isinstance(filter, dict) and filter:
+            positions = contents.metadata_index.select(filter)
+            distances = distances[positions]
+
+        order = np.argsort(distances, kind='stable')
+        if not callable(filter):
+            order = order[:k]
+
+        results = []
+        for i in order:
+            position = int(positions[i])
+            metadata = contents.metadatas[position]
+            if callable(filter) and not filter(metadata):
+                continue
+            results.append((Document(page_content=contents.texts[position], metadata=dict(metadata)),
+                            float(max(distances[i], 0.0))))
+            if len(results) == k:
+                break
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self.embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    # ==================== MAINTENANCE ====================
+
+    def iter_chunks(self) -> Iterable[Tuple[str, Document]]:
+        """(chunk id, document) of every stored chunk"""
+        contents = self._contents
+        for chunk_id, text, metadata in zip(contents.ids, contents.texts, contents.metadatas):
+            yield chunk_id, Document(page_content=text, metadata=dict(metadata))
+
+    def full_vectors(self) -> List[np.ndarray]:
+        return [self._contents.vectors]
+
+    def filter_values(self) -> Dict[str, List[Any]]:
+        """Distinct values of each filterable metadata field"""
+        return self._contents.metadata_index.values()
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def schedule_compaction(self) -> bool:
+        """Nothing to compact: every write rewrites the whole store"""
+        return False
+
+    def set_storage(self, storage: Optional[Dict[str, Any]]):
+        """Remembered for upgrade(); small stores always hold float32"""
+        self.storage = storage
+
+    def to_faiss(self) -> FAISS:
+        """A flat FAISS store with the same chunk ids, vectors and documents"""
+        contents = self._contents
+        return FAISS.from_embeddings(
+            text_embeddings=list(zip(contents.texts, contents.vectors.tolist())),
+            embedding=self.embedding,
+            metadatas=[dict(metadata) for metadata in contents.metadatas],
+            ids=list(contents.ids)
+        )
+
+    def _create_segmented(self, path: str):
+        """Write this store's chunks, with their sources and record keys, as a segmented store at path"""
+        contents = self._contents
+        chunk_sources = {i: s for i, s in zip(contents.ids, contents.sources) if s is not None}
+        chunk_records = {i: key for i, key in zip(contents.ids, contents.record_keys) if key}
+        SegmentedVectorStore.create(path, self.embedding, self.to_faiss(),
+                                    chunk_sources=chunk_sources, chunk_records=chunk_records).close()
+
+    def upgrade(self) -> SegmentedVectorStore:
+        """
+        Rebuild the store as a SegmentedVectorStore at the same path, keeping
+        chunk ids, sources and record keys. This object must not be used after.
+        """
+        with self._lock:
+            staging_path = self.path + UPGRADE_STAGING_SUFFIX
+            self._create_segmented(staging_path)
+
+            retired_path = staging_path + ".old"
+            shutil.rmtree(retired_path, ignore_errors=True)
+            os.replace(self.path, retired_path)
+            os.replace(staging_path, self.path)
+            shutil.rmtree(retired_path, ignore_errors=True)
+
+        return SegmentedVectorStore.load(self.path, self.embedding, storage=self.storage)
+
+    def close(self):
+        """Nothing to release"""
+        pass